@@ -0,0 +1,91 @@
+# construir_instantaneo.py
+# Constrói, fora do servidor, um instantâneo dos dados do dashboard.
+#
+# Lê as fontes como o dashboard (CSVs, cache Parquet ou PostgreSQL, conforme as
+# variáveis DASHBOARD_*), aplica a mesma limpeza e grava numa pasta versionada as
+# tabelas limpas (Arrow IPC), o cubo mensal de vendas, os totais por corretor, a
+# segmentação (resultado e modelo) e as parcelas projetadas do contas a pagar,
+# com um manifesto de linhas e checksums. O dashboard, com
+# DASHBOARD_INSTANTANEOS=<pasta>, abre o instantâneo apontado pelo arquivo ATUAL.
+#
+# Uso:
+#   python construir_instantaneo.py                    # constrói em instantaneos/ e ativa
+#   python construir_instantaneo.py --pasta /srv/inst  # outra pasta (padrão: DASHBOARD_INSTANTANEOS)
+#   python construir_instantaneo.py --sem-ativar       # constrói sem mudar o instantâneo ativo
+#   python construir_instantaneo.py --manter 5         # apaga os mais antigos, mantendo 5 (e o ativo)
+#   python construir_instantaneo.py --listar           # lista os instantâneos e o ativo
+#   python construir_instantaneo.py --ativar NOME      # volta (ou avança) para outro instantâneo
+import argparse
+import json
+import os
+import sys
+import time
+
+RAIZ = os.path.dirname(os.path.abspath(__file__))
+
+def _importar_utils():
+    """Importa utils para ler as fontes, não um instantâneo, e sem a thread de atualização."""
+    os.environ['DASHBOARD_INSTANTANEOS'] = ''
+    os.environ['DASHBOARD_ATUALIZACAO_SEGUNDOS'] = '0'
+    sys.path.insert(0, RAIZ)
+    from streamlit import logger
+    # Fora do servidor, os caches do Streamlit avisam a cada chamada que não há runtime
+    logger.set_log_level('error')
+    import utils
+    return utils
+
+def listar(utils, pasta):
+    nomes = utils.listar_instantaneos(pasta)
+    if not nomes:
+        print(f"Nenhum instantâneo em {pasta}")
+        return
+    try:
+        ativo = utils.instantaneo_ativo(pasta)
+    except FileNotFoundError:
+        ativo = None
+    for nome in nomes:
+        with open(os.path.join(pasta, nome, 'manifesto.json'), encoding='utf-8') as f:
+            manifesto = json.load(f)
+        linhas = manifesto['arquivos']['tabelas/vendas']['linhas']
+        marca = '*' if nome == ativo else ' '
+        print(f"{marca} {nome}   criado em {manifesto['criado_em']}   {linhas:,} vendas".replace(',', '.'))
+
+def construir(utils, pasta, ativar, manter):
+    inicio = time.perf_counter()
+    nome = utils.gerar_instantaneo(pasta)
+    manifesto = utils.verificar_instantaneo(pasta, nome)
+    print(f"Instantâneo {nome} construído em {time.perf_counter() - inicio:.1f}s")
+    for chave, info in manifesto['arquivos'].items():
+        tamanho = os.path.getsize(os.path.join(pasta, nome, info['arquivo'])) / 2**20
+        print(f"  {chave:<32}{info['linhas']:>12,} linhas{tamanho:>10.1f} MB".replace(',', '.'))
+    if ativar:
+        utils.ativar_instantaneo(pasta, nome)
+        print(f"Ativo: {nome}")
+    if manter:
+        for apagado in utils.descartar_instantaneos(pasta, manter):
+            print(f"Apagado: {apagado}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Constrói um instantâneo dos dados e artefatos do dashboard.")
+    parser.add_argument('--pasta', default=os.environ.get('DASHBOARD_INSTANTANEOS') or 'instantaneos',
+                        help="Pasta dos instantâneos (padrão: DASHBOARD_INSTANTANEOS ou instantaneos/).")
+    parser.add_argument('--sem-ativar', action='store_true', help="Não aponta o dashboard para o novo instantâneo.")
+    parser.add_argument('--manter', type=int, help="Quantos instantâneos manter (o ativo nunca é apagado).")
+    parser.add_argument('--listar', action='store_true', help="Lista os instantâneos existentes.")
+    parser.add_argument('--ativar', metavar='NOME', help="Aponta o dashboard para um instantâneo existente.")
+    args = parser.parse_args()
+
+    pasta = os.path.abspath(args.pasta)
+    # Os caminhos das fontes (data/...) são relativos à raiz do projeto
+    os.chdir(RAIZ)
+    utils = _importar_utils()
+    if args.listar:
+        listar(utils, pasta)
+    elif args.ativar:
+        utils.ativar_instantaneo(pasta, args.ativar)
+        print(f"Ativo: {args.ativar}")
+    else:
+        construir(utils, pasta, not args.sem_ativar, args.manter)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,391 @@
+# medir_desempenho.py
+# Benchmark das computações do dashboard, fora do Streamlit.
+#
+# Gera arquivos sintéticos (vendas.csv, comissao.csv, corretores_inativos.csv e
+# contas_a_pagar_set24_set25.csv) no mesmo formato dos reais, com cardinalidades
+# realistas de corretores, supervisores, operadoras e planos, e mede tempo e pico
+# de memória de cada etapa: carga dos dados (CSV frio e cache Parquet), filtro +
+# KPIs + agregações da Visão Geral, séries diárias reduzidas (LTTB), segmentação
+# (estática e em janelas móveis), drilldown de corretores da página 2, livro de caixa e projeções financeiras. Com o duckdb instalado, as agregações da
+# Visão Geral e do financeiro também são medidas no motor DuckDB.
+#
+# Uso:
+#   python medir_desempenho.py                                  # 10 mil e 100 mil linhas de vendas
+#   python medir_desempenho.py --linhas 10000 1000000 10000000  # outros tamanhos (até 10 milhões)
+#   python medir_desempenho.py --saida desempenho.jsonl         # acrescenta o resultado ao histórico e
+#                                                               # compara com a execução anterior
+#   python medir_desempenho.py --manter-dados /tmp/sintetico    # mantém os arquivos gerados
+#   python medir_desempenho.py --resumir-log logs/desempenho.jsonl   # p50/p95 por página e etapa,
+#                                                               # a partir do log de uso real
+import argparse
+import datetime
+import glob
+import importlib.util
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import types
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+RAIZ = os.path.dirname(os.path.abspath(__file__))
+TAMANHO_BLOCO_GERACAO = 1_000_000
+# Variação (para mais) a partir da qual uma etapa é marcada como regressão
+LIMITE_REGRESSAO = 0.20
+
+# --- Gerador de dados sintéticos ---
+# Proporções tiradas dos dados reais: ~30 vendas por corretor, ~2 pagamentos de
+# comissão por venda, 5 supervisores para ~600 corretores, 35 tipos de corretor,
+# 42 operadoras, 62 planos e valores com distribuição log-normal.
+def _cardinalidades(linhas):
+    corretores = max(50, linhas // 30)
+    return {
+        'corretores': corretores,
+        'supervisores': max(5, corretores // 120),
+        'tipos': 35,
+        'operadoras': 42,
+        'planos': 62,
+        'fornecedores': max(50, linhas // 80),
+        'categorias': 86,
+        'centros_custo': 8,
+    }
+
+def _nomes(prefixo, n):
+    return np.array([f"{prefixo} {i:06d}" for i in range(n)], dtype=object)
+
+def _datas(rng, n, inicio, dias):
+    return pd.Timestamp(inicio) + pd.to_timedelta(rng.integers(0, dias, n), unit='D')
+
+def _valores(rng, n, media_log, desvio_log):
+    return np.round(rng.lognormal(media_log, desvio_log, n), 2)
+
+def _escrever_em_blocos(caminho, total, gerar_bloco, **opcoes_csv):
+    """Gera e grava o arquivo em blocos, para não manter milhões de linhas em memória."""
+    for inicio in range(0, total, TAMANHO_BLOCO_GERACAO):
+        bloco = gerar_bloco(min(TAMANHO_BLOCO_GERACAO, total - inicio))
+        bloco.to_csv(caminho, mode='w' if inicio == 0 else 'a', header=inicio == 0, index=False, **opcoes_csv)
+
+def _moeda_ptbr(valores):
+    return pd.Series(valores).map('{:,.2f}'.format).str.translate(str.maketrans(',.', '.,'))
+
+def gerar_dados(pasta, linhas, semente=42):
+    """Grava os quatro arquivos de dados sintéticos em `pasta`/data, com `linhas` vendas."""
+    rng = np.random.default_rng(semente)
+    card = _cardinalidades(linhas)
+    pasta_dados = os.path.join(pasta, 'data')
+    os.makedirs(pasta_dados, exist_ok=True)
+
+    # Cada corretor tem um tipo e um supervisor fixos; poucos corretores concentram muitas vendas
+    corretores = _nomes("CORRETOR", card['corretores'])
+    tipo_corretor = _nomes("TIPO", card['tipos'])[rng.integers(0, card['tipos'], card['corretores'])]
+    supervisor_corretor = _nomes("SUPERVISOR", card['supervisores'])[rng.integers(0, card['supervisores'], card['corretores'])]
+    pesos = rng.lognormal(0, 1.2, card['corretores'])
+    pesos /= pesos.sum()
+    operadoras = _nomes("OPERADORA", card['operadoras'])
+    planos = _nomes("PLANO", card['planos'])
+
+    def bloco_vendas(n):
+        c = rng.choice(card['corretores'], n, p=pesos)
+        return pd.DataFrame({
+            'data_vigencia': _datas(rng, n, '2024-08-01', 396).strftime('%Y-%m-%d'),
+            'supervisor': supervisor_corretor[c],
+            'corretor': corretores[c],
+            'tipo_de_corretor': tipo_corretor[c],
+            'operadora': operadoras[rng.zipf(1.6, n) % card['operadoras']],
+            'plano': planos[rng.zipf(1.4, n) % card['planos']],
+            'valor_proposta': _valores(rng, n, 5.9, 0.8),
+        })
+
+    def bloco_comissoes(n):
+        c = rng.choice(card['corretores'], n, p=pesos)
+        return pd.DataFrame({
+            'data_baixa': _datas(rng, n, '2024-08-10', 380).strftime('%Y-%m-%d'),
+            'corretor': corretores[c],
+            'tipo_de_corretor': tipo_corretor[c],
+            'amount_to_pay': _valores(rng, n, 4.9, 1.0),
+        })
+
+    def bloco_inativos(n):
+        c = rng.integers(0, card['corretores'], n)
+        return pd.DataFrame({
+            'data': _datas(rng, n, '2024-08-01', 396).strftime('%Y-%m-%d'),
+            'corretor': corretores[c],
+            'tipo_de_corretor': tipo_corretor[c],
+        })
+
+    fornecedores = _nomes("FORNECEDOR", card['fornecedores'])
+    categorias = _nomes("CATEGORIA", card['categorias'])
+    centros_custo = _nomes("CENTRO", card['centros_custo'])
+
+    def bloco_contas(n):
+        vencimento = _datas(rng, n, '2024-09-01', 420)
+        valor = _valores(rng, n, 6.5, 1.3)
+        pago = np.where(rng.random(n) < 0.8, valor, 0.0)
+        parcela = rng.integers(1, 13, n)
+        recorrente = rng.random(n) < 0.12
+        return pd.DataFrame({
+            'Nome do fornecedor': fornecedores[rng.zipf(1.3, n) % card['fornecedores']],
+            'Data de competência': (vencimento - pd.Timedelta(days=30)).strftime('%d/%m/%Y'),
+            'Data de vencimento': vencimento.strftime('%d/%m/%Y'),
+            'Data prevista': vencimento.strftime('%d/%m/%Y'),
+            'Recorrência': np.where(recorrente, pd.Series(parcela).astype(str) + '/12', '1'),
+            'Descrição': 'DESPESA ' + pd.Series(rng.integers(0, 1500, n)).astype(str),
+            'Valor original da parcela (R$)': _moeda_ptbr(valor),
+            'Valor pago da parcela (R$)': _moeda_ptbr(pago),
+            'Juros realizado (R$)': '0,00',
+            'Valor total pago da parcela (R$)': _moeda_ptbr(pago),
+            'Conta bancária': 'BANCO 1',
+            'Data do último pagamento': np.where(pago > 0, vencimento.strftime('%d/%m/%Y'), ''),
+            'Categoria 1': categorias[rng.zipf(1.5, n) % card['categorias']],
+            'Valor na Categoria 1': _moeda_ptbr(-pago),
+            'Centro de Custo 1': centros_custo[rng.integers(0, card['centros_custo'], n)],
+        })
+
+    _escrever_em_blocos(os.path.join(pasta_dados, 'vendas.csv'), linhas, bloco_vendas)
+    _escrever_em_blocos(os.path.join(pasta_dados, 'comissao.csv'), 2 * linhas, bloco_comissoes)
+    _escrever_em_blocos(os.path.join(pasta_dados, 'corretores_inativos.csv'), max(1, linhas // 20), bloco_inativos)
+    caminho_contas = os.path.join(pasta_dados, 'contas_a_pagar_set24_set25.csv')
+    with open(caminho_contas, 'w', encoding='utf-8') as f:
+        # Como na exportação real: uma linha só de separadores antes do cabeçalho
+        f.write(';' * 14 + '\n')
+    total_contas = max(1, linhas // 4)
+    for inicio in range(0, total_contas, TAMANHO_BLOCO_GERACAO):
+        bloco_contas(min(TAMANHO_BLOCO_GERACAO, total_contas - inicio)).to_csv(
+            caminho_contas, mode='a', header=inicio == 0, index=False, sep=';')
+    return card
+
+# --- Etapas medidas ---
+def _limpar_caches(st):
+    st.cache_data.clear()
+    st.cache_resource.clear()
+
+def _etapas(utils, st):
+    """Lista de (nome, preparar, executar). `preparar` não é medido e deixa o estado igual a cada repetição."""
+    estado = {}
+
+    def carga_fria():
+        shutil.rmtree(utils.PASTA_CACHE, ignore_errors=True)
+        _limpar_caches(st)
+
+    def carga_parquet():
+        _limpar_caches(st)
+
+    def carregar():
+        estado['dados'] = utils.load_data()
+
+    def motor_pandas():
+        vendas, pagamentos, inativos, contas_pagar = estado['dados']
+        return utils.MotorPandas(types.SimpleNamespace(vendas=vendas, pagamentos=pagamentos, inativos=inativos, contas_pagar=contas_pagar))
+
+    def motor_duckdb():
+        return utils.motor_duckdb(utils.versao_dados())
+
+    def visao_geral(criar_motor):
+        def executar():
+            df_vendas = estado['dados'][0]
+            versao = utils.versao_dados()
+            data_min, data_max = df_vendas['data_vigencia'].min(), df_vendas['data_vigencia'].max()
+            supervisor = df_vendas['supervisor'].iloc[0]
+            motor = criar_motor()
+            for filtros, inicio, fim in (({'supervisor': None, 'tipo_de_corretor': None}, data_min, data_max),
+                                         ({'supervisor': supervisor, 'tipo_de_corretor': None}, data_min + pd.Timedelta(days=45), data_max)):
+                # As linhas filtradas continuam sendo usadas pelas tabelas e pela segmentação
+                indice = utils.indexar_dados(df_vendas, 'vendas', 'data_vigencia', ('supervisor', 'tipo_de_corretor'), versao)
+                estado['df_filtrado'] = indice.linhas(indice.filtrar(filtros, inicio, fim))
+                motor.resumo_vendas(filtros, inicio, fim)
+                motor.vendas_mensais(filtros, inicio, fim)
+                for dimensao in ('operadora', 'plano', 'tipo_de_corretor', 'corretor'):
+                    motor.vendas_por(dimensao, filtros, inicio, fim)
+        return executar
+
+    def serie_diaria():
+        # Série diária de todo o período, reduzida para o gráfico como na Visão Geral
+        motor = motor_pandas()
+        for granularidade in ('dia', 'semana'):
+            utils.reduzir_serie(motor.vendas_por_periodo(granularidade, {'supervisor': None, 'tipo_de_corretor': None}))
+
+    def segmentacao():
+        df_vendas = estado['dados'][0]
+        utils.segmenta_corretores(df_vendas, df_base=df_vendas)
+        utils.segmenta_corretores(estado['df_filtrado'], df_base=df_vendas, chave={'benchmark': 1})
+
+    def segmentacao_temporal():
+        df_vendas = estado['dados'][0]
+        utils.segmentacao_temporal(df_vendas, utils.PERIODICIDADE_PADRAO, utils.JANELA_PADRAO_MESES, utils.versao_dados())
+
+    def drilldown():
+        df_vendas, df_pagamentos, df_inativos, _ = estado['dados']
+        perfis = utils.perfis_corretores(df_vendas, df_pagamentos, df_inativos, utils.versao_dados())
+        for corretor in perfis.corretores[:100]:
+            perfis.perfil(corretor)
+
+    def financeiro(criar_motor):
+        def executar():
+            df_contas = estado['dados'][3]
+            motor = criar_motor()
+            filtros = {'Categoria 1': None, 'Centro de Custo 1': None}
+            motor.totais_financeiros(filtros)
+            for dimensao in ('Categoria 1', 'Centro de Custo 1', 'Nome do fornecedor'):
+                motor.despesas_por(dimensao, filtros)
+            hoje = df_contas['Data de vencimento'].min() + (df_contas['Data de vencimento'].max() - df_contas['Data de vencimento'].min()) / 2
+            livro = utils.livro_caixa(df_contas, utils.versao_dados())
+            livro.total(hoje, hoje + pd.Timedelta(days=30))
+            livro.mensal(hoje)
+        return executar
+
+    def livro_caixa():
+        utils.livro_caixa(estado['dados'][3], utils.versao_dados())
+
+    sem_preparo = lambda: None
+    etapas = [
+        ('carga_csv', carga_fria, carregar),
+        ('carga_parquet', carga_parquet, carregar),
+        ('visao_geral', lambda: _limpar_caches(st), visao_geral(motor_pandas)),
+        ('serie_diaria', sem_preparo, serie_diaria),
+        ('segmentacao', lambda: _limpar_caches(st), segmentacao),
+        ('segmentacao_temporal', lambda: _limpar_caches(st), segmentacao_temporal),
+        ('drilldown_corretor', lambda: _limpar_caches(st), drilldown),
+        ('livro_caixa', lambda: _limpar_caches(st), livro_caixa),
+        ('financeiro', sem_preparo, financeiro(motor_pandas)),
+    ]
+    if importlib.util.find_spec('duckdb'):
+        # O pico medido pelo tracemalloc só inclui o Python: a memória do DuckDB fica de fora
+        etapas += [
+            ('visao_geral_duckdb', lambda: _limpar_caches(st), visao_geral(motor_duckdb)),
+            ('financeiro_duckdb', sem_preparo, financeiro(motor_duckdb)),
+        ]
+    return etapas
+
+def medir(pasta, repeticoes):
+    """Executa as etapas sobre os dados de `pasta` e devolve {etapa: {segundos, pico_mb}}."""
+    diretorio_original = os.getcwd()
+    os.chdir(pasta)
+    sys.path.insert(0, RAIZ)
+    os.environ['DASHBOARD_CACHE_DIR'] = os.path.join(pasta, 'data', '.cache')
+    # Mede as computações diretamente, sem a thread de atualização em segundo plano
+    os.environ['DASHBOARD_ATUALIZACAO_SEGUNDOS'] = '0'
+    try:
+        import streamlit as st
+        from streamlit import logger
+        # Fora do servidor, os caches do Streamlit avisam a cada chamada que não há runtime
+        logger.set_log_level('error')
+        import utils
+        resultados = {}
+        for nome, preparar, executar in _etapas(utils, st):
+            # Aquecimento fora da medição: imports tardios (ex.: scikit-learn) não entram no tempo
+            preparar()
+            executar()
+            tempos = []
+            for _ in range(repeticoes):
+                preparar()
+                inicio = time.perf_counter()
+                executar()
+                tempos.append(time.perf_counter() - inicio)
+            # Pico de memória numa execução à parte: o tracemalloc deixa o código mais lento
+            preparar()
+            tracemalloc.start()
+            executar()
+            _, pico = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            resultados[nome] = {'segundos': round(min(tempos), 4), 'pico_mb': round(pico / 2**20, 1)}
+        return resultados
+    finally:
+        os.chdir(diretorio_original)
+
+def _ultima_execucao(caminho, linhas):
+    """Resultado mais recente do histórico para o mesmo tamanho de dados."""
+    try:
+        with open(caminho, encoding='utf-8') as f:
+            registros = [json.loads(linha) for linha in f if linha.strip()]
+    except OSError:
+        return None
+    for registro in reversed(registros):
+        if registro.get('linhas') == linhas:
+            return registro
+    return None
+
+def _imprimir(linhas, resultados, anterior):
+    print(f"\n{linhas:,} linhas de vendas".replace(',', '.'))
+    print(f"  {'etapa':<22}{'tempo':>10}{'pico':>12}   comparação")
+    for etapa, r in resultados.items():
+        comparacao = ''
+        if anterior and etapa in anterior['resultados']:
+            antes = anterior['resultados'][etapa]['segundos']
+            variacao = (r['segundos'] - antes) / antes if antes else 0
+            marca = '  <-- REGRESSÃO' if variacao > LIMITE_REGRESSAO else ''
+            comparacao = f"{variacao:+.0%} vs. {anterior['commit']}{marca}"
+        print(f"  {etapa:<22}{r['segundos']:>9.3f}s{r['pico_mb']:>9.1f} MB   {comparacao}")
+
+def resumir_log(caminho):
+    """Imprime p50/p95 (ms) por página e etapa a partir do log de desempenho (incluindo os arquivos rotacionados)."""
+    registros = []
+    for arquivo in sorted(glob.glob(f"{caminho}*")):
+        with open(arquivo, encoding='utf-8') as f:
+            registros.extend(json.loads(linha) for linha in f if linha.strip())
+    if not registros:
+        print(f"Nenhum registro em {caminho}")
+        return
+    df = pd.DataFrame(registros)
+    resumo = df.groupby(['pagina', 'etapa'])['ms'].agg(
+        execucoes='count', p50=lambda ms: ms.quantile(0.5), p95=lambda ms: ms.quantile(0.95))
+    # O tempo total de cada rerun aparece primeiro em cada página
+    resumo = resumo.reset_index()
+    resumo['ordem'] = resumo['etapa'] != 'rerun'
+    resumo = resumo.sort_values(['pagina', 'ordem', 'p95'], ascending=[True, True, False]).drop(columns='ordem')
+    print(resumo.to_string(index=False, float_format=lambda v: f"{v:.1f}"))
+
+def main():
+    parser = argparse.ArgumentParser(description="Mede tempo e memória das computações do dashboard com dados sintéticos.")
+    parser.add_argument('--linhas', type=int, nargs='+', default=[10_000, 100_000],
+                        help="Tamanhos (linhas de vendas) a medir, de 10 mil a 10 milhões.")
+    parser.add_argument('--repeticoes', type=int, default=3, help="Repetições por etapa (vale o menor tempo).")
+    parser.add_argument('--semente', type=int, default=42, help="Semente do gerador de dados.")
+    parser.add_argument('--saida', help="Arquivo JSONL onde acrescentar o resultado (histórico entre versões).")
+    parser.add_argument('--manter-dados', help="Pasta onde gerar (e manter) os dados sintéticos.")
+    parser.add_argument('--resumir-log', help="Em vez de medir, resume o log de desempenho do dashboard (p50/p95).")
+    args = parser.parse_args()
+
+    if args.resumir_log:
+        resumir_log(args.resumir_log)
+        return
+
+    commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, cwd=RAIZ).stdout.strip()
+    for linhas in args.linhas:
+        if not 10_000 <= linhas <= 10_000_000:
+            parser.error("--linhas deve ficar entre 10000 e 10000000")
+        base = args.manter_dados or tempfile.mkdtemp(prefix='dashboard_benchmark_')
+        pasta = os.path.join(base, str(linhas))
+        try:
+            inicio = time.perf_counter()
+            cardinalidades = gerar_dados(pasta, linhas, args.semente)
+            print(f"\nDados gerados em {time.perf_counter() - inicio:.1f}s ({pasta})")
+            # Cada tamanho roda num processo novo: os módulos e caches não passam de um tamanho para outro
+            processo = subprocess.run([sys.executable, os.path.abspath(__file__), '--_medir', pasta, str(args.repeticoes)],
+                                      capture_output=True, text=True)
+            if processo.returncode != 0:
+                print(processo.stderr)
+                continue
+            resultados = json.loads(processo.stdout.strip().splitlines()[-1])
+        finally:
+            if not args.manter_dados:
+                shutil.rmtree(base, ignore_errors=True)
+
+        anterior = _ultima_execucao(args.saida, linhas) if args.saida else None
+        _imprimir(linhas, resultados, anterior)
+        if args.saida:
+            with open(args.saida, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({'data': datetime.datetime.now().strftime('%Y-%m-%dT%H:%M:%S'), 'commit': commit,
+                                    'linhas': linhas, 'cardinalidades': cardinalidades, 'resultados': resultados},
+                                   ensure_ascii=False) + '\n')
+
+if __name__ == '__main__':
+    if len(sys.argv) == 4 and sys.argv[1] == '--_medir':
+        print(json.dumps(medir(sys.argv[2], int(sys.argv[3]))))
+    else:
+        main()
@@ -0,0 +1,92 @@
+# medir_inicializacao.py
+# Relatório de tempo de inicialização do dashboard.
+#
+# Para app.py e cada página, abre um processo Python novo (imports "frios"),
+# executa o script uma vez em modo headless com o AppTest do Streamlit e mede
+# o tempo até o fim da primeira renderização. Com -X importtime, lista também
+# os pacotes mais caros de importar naquele processo.
+#
+# Uso:
+#   python medir_inicializacao.py                 # tabela no terminal
+#   python medir_inicializacao.py --top 5         # mostra só os 5 imports mais caros por script
+#   python medir_inicializacao.py --saida inicializacao.jsonl   # acrescenta o resultado ao histórico
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import time
+
+# Código executado no processo filho: mede imports + primeira execução do script
+CODIGO_FILHO = """
+import json, sys, time
+inicio = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file(sys.argv[1], default_timeout=600)
+at.run()
+print(json.dumps({'segundos': time.perf_counter() - inicio, 'erro': [e.value for e in at.exception]}))
+"""
+
+PACOTES_DESTAQUE = ('sklearn', 'matplotlib', 'plotly', 'scipy', 'pyarrow', 'pandas', 'numpy', 'streamlit')
+
+def scripts_do_app():
+    return ['app.py'] + sorted(glob.glob(os.path.join('pages', '*.py')))
+
+def _imports_mais_caros(stderr, top):
+    """Extrai do -X importtime os pacotes de primeiro nível com maior tempo acumulado (em segundos)."""
+    custos = {}
+    for linha in stderr.splitlines():
+        if not linha.startswith('import time:') or '|' not in linha:
+            continue
+        partes = linha.split('|')
+        nome = partes[2].rstrip()
+        if nome.startswith(' ' * 2) or not partes[1].strip().isdigit():
+            continue
+        pacote = nome.strip().split('.')[0]
+        custos[pacote] = max(custos.get(pacote, 0), int(partes[1]) / 1e6)
+    return sorted(custos.items(), key=lambda item: item[1], reverse=True)[:top]
+
+def medir_script(script, top):
+    inicio = time.perf_counter()
+    processo = subprocess.run([sys.executable, '-X', 'importtime', '-c', CODIGO_FILHO, os.path.abspath(script)],
+                              capture_output=True, text=True)
+    total = time.perf_counter() - inicio
+    resultado = {'script': script, 'processo_segundos': round(total, 3)}
+    try:
+        saida = json.loads(processo.stdout.strip().splitlines()[-1])
+        resultado['primeira_renderizacao_segundos'] = round(saida['segundos'], 3)
+        resultado['erro'] = saida['erro']
+    except (IndexError, ValueError):
+        resultado['erro'] = [processo.stderr.strip().splitlines()[-1] if processo.stderr.strip() else 'sem saída']
+    imports = _imports_mais_caros(processo.stderr, top=100)
+    resultado['imports'] = {nome: round(segundos, 3) for nome, segundos in imports[:top]}
+    resultado['pesados'] = sorted(nome for nome, _ in imports if nome in PACOTES_DESTAQUE)
+    return resultado
+
+def main():
+    parser = argparse.ArgumentParser(description="Mede o tempo até a primeira renderização do app e de cada página.")
+    parser.add_argument('--top', type=int, default=8, help="Quantos imports mais caros mostrar por script.")
+    parser.add_argument('--saida', help="Arquivo JSONL onde acrescentar o resultado (histórico entre versões).")
+    args = parser.parse_args()
+
+    resultados = []
+    for script in scripts_do_app():
+        r = medir_script(script, args.top)
+        resultados.append(r)
+        print(f"\n{script}")
+        print(f"  primeira renderização: {r.get('primeira_renderizacao_segundos', float('nan')):.2f}s "
+              f"(processo: {r['processo_segundos']:.2f}s)")
+        if r['erro']:
+            print(f"  ERRO: {r['erro']}")
+        print(f"  pacotes pesados importados: {', '.join(r['pesados']) or '-'}")
+        for nome, segundos in r['imports'].items():
+            print(f"    {nome:<24} {segundos:6.3f}s")
+
+    if args.saida:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True).stdout.strip()
+        with open(args.saida, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'data': time.strftime('%Y-%m-%dT%H:%M:%S'), 'commit': commit, 'resultados': resultados}, ensure_ascii=False) + '\n')
+
+if __name__ == '__main__':
+    main()
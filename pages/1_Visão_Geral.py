@@ -1,20 +1,23 @@
 import pandas as pd
 import streamlit as st
-import matplotlib.pyplot as plt
-import matplotlib.ticker as mticker
 import plotly.express as px
-from utils import load_data, segmenta_corretores, format_currency, format_integer, render_sidebar
+from utils import (DadosLazy, segmenta_corretores, format_currency, format_integer, contar_valores, render_sidebar, exibir_grafico, medir,
+                   versao_dados, indexar_dados, figura_em_cache, png_em_cache, tabela_paginada, botoes_exportacao, motor_consultas, matriz_atividade,
+                   reduzir_serie, seletor_granularidade, FORMATOS_PERIODO, segmentacao_temporal, JANELA_PADRAO_MESES)
 
 st.set_page_config(layout="wide", page_title="Dashboard | Visão Geral")
 
-render_sidebar()
+render_sidebar('visao_geral')
 
-# --- Funções de Gráfico (sem alteração) ---
-def criar_grafico_top_corretores(df):
-    if df.empty:
-        st.warning("Não há dados de vendas para a seleção atual.")
+# --- Funções de Gráfico ---
+# Recebem as séries já agregadas pelo motor de consultas.
+def criar_grafico_top_corretores(vendas_corretor):
+    if vendas_corretor.empty:
         return None
-    top_10 = df.groupby('corretor')['valor_proposta'].sum().nlargest(10).sort_values()
+    top_10 = vendas_corretor.nlargest(10).sort_values()
+    # matplotlib só é importado quando o gráfico é de fato gerado
+    import matplotlib.pyplot as plt
+    import matplotlib.ticker as mticker
     fig, ax = plt.subplots(figsize=(10, 6))
     colors = ['lightgray'] * (len(top_10) - 1) + ['#f63366']
     bars = ax.barh(top_10.index, top_10.values, color=colors)
@@ -24,38 +27,85 @@ def criar_grafico_top_corretores(df):
     plt.tight_layout()
     return fig
 
-def criar_treemap_planos(df):
-    if df.empty: return None
-    vendas_plano = df.groupby('plano')['valor_proposta'].sum().reset_index()
+def criar_treemap_planos(vendas_por_plano):
+    if vendas_por_plano.empty: return None
+    vendas_plano = vendas_por_plano.rename('valor_proposta').reset_index()
     vendas_plano['valor_formatado'] = vendas_plano['valor_proposta'].apply(format_currency)
     fig = px.treemap(vendas_plano, path=['plano'], values='valor_proposta', custom_data=['valor_formatado'],
                      title='Distribuição de Vendas por Plano', color_discrete_sequence=px.colors.qualitative.Pastel)
     fig.update_traces(textinfo='label+percent entry', hovertemplate='<b>%{label}</b><br>Vendas: %{customdata[0]}<extra></extra>')
     return fig
 
-def criar_treemap_operadoras(df):
-    if df.empty: return None
-    vendas_operadora = df.groupby('operadora')['valor_proposta'].sum().reset_index()
+def criar_treemap_operadoras(vendas_por_operadora):
+    if vendas_por_operadora.empty: return None
+    vendas_operadora = vendas_por_operadora.rename('valor_proposta').reset_index()
     vendas_operadora['valor_formatado'] = vendas_operadora['valor_proposta'].apply(format_currency)
     fig = px.treemap(vendas_operadora, path=['operadora'], values='valor_proposta', custom_data=['valor_formatado'],
                      title='Distribuição de Vendas por Operadora', color_discrete_sequence=px.colors.qualitative.Pastel2)
     fig.update_traces(textinfo='label+percent entry', hovertemplate='<b>%{label}</b><br>Vendas: %{customdata[0]}<extra></extra>')
     return fig
 
-def criar_grafico_vendas_tempo(df):
-    if df.empty: return None
-    vendas_mensais = df.set_index('data_vigencia').resample('M')['valor_proposta'].sum().reset_index()
-    fig = px.line(vendas_mensais, x='data_vigencia', y='valor_proposta', markers=True,
-                  labels={'data_vigencia': 'Mês', 'valor_proposta': 'Total de Vendas'}, color_discrete_sequence=["#f63366"])
-    fig.update_traces(hovertemplate='<b>Mês</b>: %{x|%B de %Y}<br><b>Vendas</b>: %{y:,.2f}<extra></extra>')
+def criar_grafico_vendas_tempo(serie, granularidade='mes'):
+    if serie.empty: return None
+    rotulo = {'dia': 'Dia', 'semana': 'Semana', 'mes': 'Mês'}[granularidade]
+    # Séries diárias longas chegam ao Plotly já reduzidas, com os picos preservados
+    df_periodo = reduzir_serie(serie).rename('valor_proposta').rename_axis('data_vigencia').reset_index()
+    fig = px.line(df_periodo, x='data_vigencia', y='valor_proposta', markers=granularidade == 'mes',
+                  labels={'data_vigencia': rotulo, 'valor_proposta': 'Total de Vendas'}, color_discrete_sequence=["#f63366"])
+    fig.update_traces(hovertemplate=f'<b>{rotulo}</b>: %{{x|{FORMATOS_PERIODO[granularidade]}}}<br><b>Vendas</b>: %{{y:,.2f}}<extra></extra>')
     fig.update_layout(title_text="Evolução das Vendas no Período", title_x=0)
     return fig
 
+def criar_grafico_inativos_tipo(df_inativos_periodo):
+    df_inativos_tipo = contar_valores(df_inativos_periodo['tipo_de_corretor']).reset_index().sort_values(by='count', ascending=True)
+    fig = px.bar(df_inativos_tipo.nlargest(10, 'count'), 
+                 x='count', 
+                 y='tipo_de_corretor', 
+                 orientation='h', 
+                 text='count',
+                 title="Top 10 Tipos de Corretor com Mais Inativos")
+    fig.update_traces(texttemplate='%{text:,.0f}'.replace(",", "."), textposition='outside', marker_color='#FF8C00')
+    fig.update_layout(yaxis_title=None, xaxis_title="Número de Corretores Inativos")
+    return fig
+
+def criar_grafico_atividade_tipo(df_atividade):
+    df_taxa = df_atividade.sort_values('taxa_atividade', ascending=True)
+    fig = px.bar(df_taxa, x='taxa_atividade', y='tipo_de_corretor', orientation='h', text='taxa_atividade',
+                 custom_data=['ativos', 'num_corretores'], title="Taxa de Atividade por Tipo de Corretor")
+    fig.update_traces(texttemplate='%{text:.1f}%', textposition='outside', marker_color='#f63366',
+                      hovertemplate='<b>%{y}</b><br>Ativos: %{customdata[0]} de %{customdata[1]}<extra></extra>')
+    fig.update_layout(yaxis_title=None, xaxis_title="Corretores Ativos no Período (%)")
+    return fig
+
+def criar_grafico_coortes(retencao):
+    if retencao.empty: return None
+    fig = px.imshow(retencao, x=[str(k) for k in retencao.columns], y=retencao.index.strftime('%Y-%m'),
+                    color_continuous_scale='RdPu', text_auto='.0f', aspect='auto',
+                    labels={'x': 'Meses desde a primeira venda', 'y': 'Coorte (mês da primeira venda)', 'color': '% que vendeu'})
+    fig.update_layout(title_text="Retenção por Coorte de Corretores", title_x=0)
+    return fig
+
+def criar_grafico_distribuicao_perfis(distribuicao):
+    df_distribuicao = distribuicao.reset_index().melt(id_vars='periodo', var_name='Perfil', value_name='Corretores')
+    fig = px.bar(df_distribuicao, x='periodo', y='Corretores', color='Perfil', title="Corretores por Perfil em Cada Período")
+    fig.update_layout(xaxis_title=None, title_x=0)
+    return fig
+
+def criar_grafico_transicoes(transicoes):
+    # Percentual por linha: de cada perfil, para onde os corretores foram no período seguinte
+    totais = transicoes.sum(axis=1)
+    percentuais = transicoes.div(totais.where(totais > 0), axis=0) * 100
+    fig = px.imshow(percentuais, color_continuous_scale='RdPu', text_auto='.0f', aspect='auto',
+                    labels={'x': 'Perfil no período seguinte', 'y': 'Perfil no período', 'color': '% dos corretores'})
+    fig.update_layout(title_text="Transições entre Perfis", title_x=0)
+    return fig
+
 # --- Carregamento dos Dados ---
-# <<< CORREÇÃO AQUI: Adicionado '_' para receber o quarto dataframe (df_contas_pagar)
-df_vendas, df_pagamentos, df_inativos, _ = load_data()
+dados = DadosLazy()
+df_vendas = dados.vendas
 if df_vendas is None:
     st.stop()
+df_inativos = dados.inativos
 
 # --- Layout ---
 st.title("🚀 Dashboard de Performance de Vendas")
@@ -77,15 +127,22 @@ with st.expander("FILTROS", expanded=True):
         data_fim = st.date_input("Data Fim", data_max, min_value=data_min, max_value=data_max)
 
 # --- Filtragem dos Dados ---
-df_filtrado = df_vendas.copy()
-if supervisor_selecionado != "Todos":
-    df_filtrado = df_filtrado[df_filtrado['supervisor'] == supervisor_selecionado]
-if tipo_selecionado != "Todos":
-    df_filtrado = df_filtrado[df_filtrado['tipo_de_corretor'] == tipo_selecionado]
-if data_inicio and data_fim:
-    df_filtrado = df_filtrado[(df_filtrado['data_vigencia'].dt.date >= data_inicio) & (df_filtrado['data_vigencia'].dt.date <= data_fim)]
-
-df_base_corretores = pd.concat([df_vendas[['corretor', 'tipo_de_corretor']], df_inativos[['corretor', 'tipo_de_corretor']]]).drop_duplicates(subset='corretor').reset_index(drop=True)
+versao = versao_dados()
+filtros = {
+    'supervisor': None if supervisor_selecionado == "Todos" else supervisor_selecionado,
+    'tipo_de_corretor': None if tipo_selecionado == "Todos" else tipo_selecionado,
+}
+indice_vendas = indexar_dados(df_vendas, 'vendas', 'data_vigencia', ('supervisor', 'tipo_de_corretor'), versao)
+df_filtrado = indice_vendas.linhas(indice_vendas.filtrar(filtros, data_inicio, data_fim))
+
+# KPIs e gráficos saem do motor de consultas; as linhas filtradas ficam para tabelas, segmentação e exportação
+motor = motor_consultas(dados)
+resumo = motor.resumo_vendas(filtros, data_inicio, data_fim)
+estado_filtros = {**filtros, 'inicio': data_inicio, 'fim': data_fim}
+
+# Base de corretores e atividade mensal pré-calculadas (bitmaps corretor x mês)
+matriz = matriz_atividade(df_vendas, df_inativos, versao)
+df_base_corretores = matriz.base
 st.markdown(f"Exibindo dados de **{data_inicio.strftime('%d/%m/%Y')}** a **{data_fim.strftime('%d/%m/%Y')}**")
 st.markdown("---")
 
@@ -94,9 +151,9 @@ tab1, tab2, tab3, tab4, tab5 = st.tabs(["📊 Visão Geral", "📄 Análise de P
 
 with tab1:
     st.header("Principais Indicadores de Vendas")
-    total_vendas = df_filtrado['valor_proposta'].sum()
-    num_vendas = len(df_filtrado)
-    ticket_medio = total_vendas / num_vendas if num_vendas > 0 else 0
+    total_vendas = resumo['total_vendas']
+    num_vendas = resumo['num_vendas']
+    ticket_medio = resumo['ticket_medio']
     col1, col2, col3 = st.columns(3)
     col1.metric("Total de Vendas", format_currency(total_vendas), help="Soma do 'valor_proposta' de todas as vendas que atendem aos filtros selecionados.")
     col2.metric("Número de Vendas", format_integer(num_vendas), help="Contagem total de propostas de venda realizadas no período e filtros selecionados.")
@@ -105,7 +162,7 @@ with tab1:
     
     st.header("Indicadores de Atividade da Equipe")
     total_corretores_base = len(df_base_corretores)
-    corretores_ativos_no_periodo = df_filtrado['corretor'].nunique()
+    corretores_ativos_no_periodo = resumo['corretores_ativos']
     corretores_que_nao_venderam = total_corretores_base - corretores_ativos_no_periodo
     taxa_atividade = (corretores_ativos_no_periodo / total_corretores_base) * 100 if total_corretores_base > 0 else 0
     colA, colB, colC, colD = st.columns(4)
@@ -115,61 +172,89 @@ with tab1:
     colD.metric("Taxa de Atividade", f"{taxa_atividade:.1f}%", help="Percentual de corretores da base que estiveram ativos no período (Ativos no Período / Total da Base).")
     st.markdown("---")
 
-    fig_vendas_tempo = criar_grafico_vendas_tempo(df_filtrado)
+    granularidade = seletor_granularidade('granularidade_vendas')
+    fig_vendas_tempo = figura_em_cache('visao_geral', 'vendas_tempo', {**estado_filtros, 'granularidade': granularidade},
+                                       lambda: criar_grafico_vendas_tempo(motor.vendas_por_periodo(granularidade, filtros, data_inicio, data_fim), granularidade))
     if fig_vendas_tempo:
-        st.plotly_chart(fig_vendas_tempo, use_container_width=True)
+        exibir_grafico(fig_vendas_tempo)
     st.markdown("---")
     st.subheader("Desempenho dos Corretores")
-    fig_top_corretores = criar_grafico_top_corretores(df_filtrado)
-    if fig_top_corretores: 
-        st.pyplot(fig_top_corretores)
+    png_top_corretores = png_em_cache('visao_geral', 'top_corretores', estado_filtros,
+                                      lambda: criar_grafico_top_corretores(motor.vendas_por('corretor', filtros, data_inicio, data_fim)))
+    if png_top_corretores:
+        st.image(png_top_corretores, width="stretch")
+    else:
+        st.warning("Não há dados de vendas para a seleção atual.")
 
 with tab2:
     st.header("Análise de Vendas por Plano e Operadora")
     col_graf1, col_graf2 = st.columns(2)
     with col_graf1:
         st.info("Use o treemap para identificar os planos mais vendidos.")
-        fig_treemap_planos = criar_treemap_planos(df_filtrado)
+        fig_treemap_planos = figura_em_cache('visao_geral', 'treemap_planos', estado_filtros,
+                                             lambda: criar_treemap_planos(motor.vendas_por('plano', filtros, data_inicio, data_fim)))
         if fig_treemap_planos:
-            st.plotly_chart(fig_treemap_planos, use_container_width=True)
+            exibir_grafico(fig_treemap_planos)
     with col_graf2:
         st.info("Use o treemap para identificar as operadoras com maior volume.")
-        fig_treemap_operadoras = criar_treemap_operadoras(df_filtrado)
+        fig_treemap_operadoras = figura_em_cache('visao_geral', 'treemap_operadoras', estado_filtros,
+                                                 lambda: criar_treemap_operadoras(motor.vendas_por('operadora', filtros, data_inicio, data_fim)))
         if fig_treemap_operadoras: 
-            st.plotly_chart(fig_treemap_operadoras, use_container_width=True)
+            exibir_grafico(fig_treemap_operadoras)
 
 with tab3:
     st.header("Análise de Corretores Inativos no Período")
     st.info("Esta seção exibe os corretores da base que não registraram vendas no período e filtros selecionados.")
     
-    set_corretores_ativos = set(df_filtrado['corretor'].unique())
-    df_inativos_periodo = df_base_corretores[~df_base_corretores['corretor'].isin(set_corretores_ativos)]
-
-    if tipo_selecionado != "Todos":
-        df_inativos_periodo = df_inativos_periodo[df_inativos_periodo['tipo_de_corretor'] == tipo_selecionado]
+    # Sem filtro de dimensão e com meses inteiros, os ativos saem direto do bitmap;
+    # senão, dos corretores com venda que atendem aos filtros
+    with medir('atividade'):
+        ativos = None
+        if all(valor is None for valor in filtros.values()):
+            ativos = matriz.ativos_no_periodo(data_inicio, data_fim)
+        if ativos is None:
+            ativos = matriz.mascara(motor.vendas_por('corretor', filtros, data_inicio, data_fim).index)
+        inativos = ~ativos
+        if tipo_selecionado != "Todos":
+            inativos &= (df_base_corretores['tipo_de_corretor'] == tipo_selecionado).to_numpy()
+        df_inativos_periodo = df_base_corretores.loc[inativos, ['corretor', 'tipo_de_corretor']]
 
     st.subheader(f"Total de Inativos no Período: {format_integer(len(df_inativos_periodo))}")
     st.markdown("---")
     
     st.subheader("Distribuição de Inativos por Tipo de Corretor")
-    df_inativos_tipo = df_inativos_periodo['tipo_de_corretor'].value_counts().reset_index().sort_values(by='count', ascending=True)
-    fig_inativos = px.bar(df_inativos_tipo.nlargest(10, 'count'), 
-                           x='count', 
-                           y='tipo_de_corretor', 
-                           orientation='h', 
-                           text='count',
-                           title="Top 10 Tipos de Corretor com Mais Inativos")
-    fig_inativos.update_traces(texttemplate='%{text:,.0f}'.replace(",", "."), textposition='outside', marker_color='#FF8C00')
-    fig_inativos.update_layout(yaxis_title=None, xaxis_title="Número de Corretores Inativos")
-    st.plotly_chart(fig_inativos, use_container_width=True)
+    fig_inativos = figura_em_cache('visao_geral', 'inativos_tipo', estado_filtros,
+                                   lambda: criar_grafico_inativos_tipo(df_inativos_periodo))
+    exibir_grafico(fig_inativos)
     
     with st.expander("Ver lista de todos os corretores inativos no período"):
         st.dataframe(df_inativos_periodo)
 
+    st.markdown("---")
+    st.subheader("Taxa de Atividade por Tipo de Corretor")
+    fig_atividade = figura_em_cache('visao_geral', 'atividade_tipo', estado_filtros,
+                                    lambda: criar_grafico_atividade_tipo(matriz.atividade_por_tipo(ativos)))
+    exibir_grafico(fig_atividade)
+
+    st.markdown("---")
+    st.subheader("Retenção de Corretores por Coorte")
+    st.info("Cada linha agrupa os corretores pelo mês da primeira venda e mostra o percentual que voltou a vender nos meses seguintes. Considera todo o histórico, filtrando apenas o tipo de corretor.")
+    linhas_tipo = None if tipo_selecionado == "Todos" else (df_base_corretores['tipo_de_corretor'] == tipo_selecionado).to_numpy()
+    retencao, resumo_coortes = matriz.coortes(linhas_tipo)
+    if not resumo_coortes.empty:
+        permanencia_media = (resumo_coortes['permanencia_media'] * resumo_coortes['corretores']).sum() / resumo_coortes['corretores'].sum()
+        st.metric("Permanência Média", f"{permanencia_media:.1f} meses".replace(".", ","),
+                  help="Média de meses entre a primeira e a última venda de cada corretor (inclusive).")
+    fig_coortes = figura_em_cache('visao_geral', 'coortes', {'tipo': tipo_selecionado}, lambda: criar_grafico_coortes(retencao))
+    if fig_coortes:
+        exibir_grafico(fig_coortes)
+    else:
+        st.warning("Não há vendas para montar as coortes com a seleção atual.")
+
 with tab4:
     st.header("Segmentação de Corretores com Machine Learning")
     st.info("O modelo de IA analisou e agrupou os corretores em perfis de desempenho com base nos filtros aplicados.")
-    df_segmentado, df_analise_cluster = segmenta_corretores(df_filtrado)
+    df_segmentado, df_analise_cluster = segmenta_corretores(df_filtrado, df_base=df_vendas, chave=estado_filtros)
     if df_segmentado is not None:
         st.subheader("Resumo dos Perfis Encontrados")
         df_analise_cluster_styled = df_analise_cluster.style.format({"total_vendas": format_currency, "ticket_medio": format_currency, "num_vendas": format_integer})
@@ -192,19 +277,35 @@ with tab4:
         df_segmentado_filtrado = df_segmentado.copy()
         if perfil_selecionado != "Todos os Perfis":
             df_segmentado_filtrado = df_segmentado[df_segmentado['perfil_corretor'] == perfil_selecionado]
-        df_segmentado_styled = df_segmentado_filtrado[['corretor', 'perfil_corretor', 'total_vendas', 'num_vendas', 'ticket_medio']].style.format({"total_vendas": format_currency, "ticket_medio": format_currency, "num_vendas": format_integer})
-        st.dataframe(df_segmentado_styled)
-        @st.cache_data
-        def convert_df_to_csv(df):
-            return df.to_csv(index=False).encode('utf-8')
-        csv_segmentacao = convert_df_to_csv(df_segmentado_filtrado)
-        st.download_button(label="📥 Baixar Lista de Segmentação como CSV", data=csv_segmentacao, file_name=f'segmentacao_{perfil_selecionado.lower().replace(" ", "_")}.csv', mime='text/csv')
+        tabela_paginada(df_segmentado_filtrado[['corretor', 'perfil_corretor', 'total_vendas', 'num_vendas', 'ticket_medio']], 'segmentacao',
+                        {"total_vendas": 'moeda', "ticket_medio": 'moeda', "num_vendas": 'inteiro'})
+        botoes_exportacao(df_segmentado_filtrado, f'segmentacao_{perfil_selecionado.lower().replace(" ", "_")}',
+                          {**estado_filtros, 'perfil': perfil_selecionado}, "Baixar Lista de Segmentação")
     else:
         st.warning("Não há dados suficientes para realizar a segmentação com a seleção de filtros atual.")
 
+    st.markdown("---")
+    st.subheader("Evolução dos Perfis ao Longo do Tempo")
+    st.info("A segmentação é refeita a cada período com as vendas dos últimos meses, sobre todo o histórico (sem os filtros acima).")
+    col_periodicidade, col_janela = st.columns(2)
+    with col_periodicidade:
+        periodicidade = {'Mensal': 'mes', 'Trimestral': 'trimestre'}[st.radio("Periodicidade", ['Mensal', 'Trimestral'], horizontal=True)]
+    with col_janela:
+        meses_janela = st.slider("Janela (meses de vendas considerados)", 1, 12, JANELA_PADRAO_MESES)
+    segmentacao = segmentacao_temporal(df_vendas, periodicidade, meses_janela, versao)
+    if segmentacao.historico.empty:
+        st.warning("Nenhum período tem corretores suficientes para a segmentação com essa janela.")
+    else:
+        estado_temporal = {'periodicidade': periodicidade, 'meses_janela': meses_janela}
+        gcol1, gcol2 = st.columns(2)
+        with gcol1:
+            exibir_grafico(figura_em_cache('visao_geral', 'distribuicao_perfis', estado_temporal,
+                                           lambda: criar_grafico_distribuicao_perfis(segmentacao.distribuicao())))
+        with gcol2:
+            exibir_grafico(figura_em_cache('visao_geral', 'transicoes_perfis', estado_temporal,
+                                           lambda: criar_grafico_transicoes(segmentacao.transicoes())))
+
 with tab5:
     st.header("Explore os Dados Detalhados")
-    df_filtrado_styled = df_filtrado.style.format({"valor_proposta": format_currency})
-    st.dataframe(df_filtrado_styled)
-    csv_geral = convert_df_to_csv(df_filtrado)
-    st.download_button(label="📥 Baixar dados gerais como CSV", data=csv_geral, file_name='dados_filtrados.csv', mime='text/csv')
\ No newline at end of file
+    tabela_paginada(df_filtrado, 'dados_detalhados', {"valor_proposta": 'moeda'})
+    botoes_exportacao(df_filtrado, 'dados_filtrados', estado_filtros, "Baixar dados gerais")
\ No newline at end of file
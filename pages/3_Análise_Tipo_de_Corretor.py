@@ -1,50 +1,14 @@
 import pandas as pd
 import streamlit as st
 import plotly.express as px
-from utils import load_data, format_currency, format_integer, render_sidebar
+from utils import DadosLazy, figura_em_cache, format_currency, format_integer, render_sidebar, exibir_grafico, motor_consultas
 
 st.set_page_config(layout="wide", page_title="Análise por Tipo de Corretor")
 
-render_sidebar()
+render_sidebar('tipo_corretor')
 
-# --- Carrega os dados ---
-# <<< CORREÇÃO AQUI: Adicionado '_' para receber os dataframes que não usamos nesta página
-df_vendas, _, df_inativos, _ = load_data()
-if df_vendas is None:
-    st.stop()
-
-st.title("🏢 Análise por Tipo de Corretor")
-st.markdown("Compare a performance entre os diferentes tipos de corretores e explore as características de cada um.")
-
-# --- Cálculos Gerais para a Visão Comparativa ---
-# 1. Cria uma base de corretores única para contagem
-df_base_corretores = pd.concat([
-    df_vendas[['corretor', 'tipo_de_corretor']],
-    df_inativos[['corretor', 'tipo_de_corretor']]
-]).drop_duplicates(subset='corretor').reset_index(drop=True)
-
-# 2. Agrega métricas de vendas por tipo de corretor
-df_vendas_por_tipo = df_vendas.groupby('tipo_de_corretor').agg(
-    total_vendas=('valor_proposta', 'sum'),
-    ticket_medio=('valor_proposta', 'mean')
-).reset_index()
-
-# 3. Conta o número total de corretores em cada tipo
-df_corretores_por_tipo = df_base_corretores.groupby('tipo_de_corretor').agg(
-    num_corretores=('corretor', 'count')
-).reset_index()
-
-# 4. Junta tudo em um dataframe de performance
-df_performance = pd.merge(df_vendas_por_tipo, df_corretores_por_tipo, on='tipo_de_corretor')
-df_performance['vendas_por_corretor'] = df_performance['total_vendas'] / df_performance['num_corretores']
-
-# --- Visão Comparativa ---
-st.header("Visão Comparativa entre Tipos de Corretor")
-
-col1, col2 = st.columns(2)
-
-with col1:
-    st.subheader("Ranking por Total de Vendas")
+# --- Funções de Gráfico ---
+def criar_ranking_vendas(df_performance):
     df_ranking_vendas = df_performance.sort_values('total_vendas', ascending=True).tail(15)
     fig1 = px.bar(df_ranking_vendas, 
                   x='total_vendas', 
@@ -53,10 +17,9 @@ with col1:
                   text='total_vendas',
                   labels={'total_vendas': 'Total de Vendas (R$)', 'tipo_de_corretor': 'Tipo de Corretor'})
     fig1.update_traces(texttemplate='%{text:,.2s}', textposition='outside', marker_color='#f63366')
-    st.plotly_chart(fig1, use_container_width=True)
+    return fig1
 
-with col2:
-    st.subheader("Ranking por Produtividade (Vendas/Corretor)")
+def criar_ranking_produtividade(df_performance):
     df_ranking_produtividade = df_performance.sort_values('vendas_por_corretor', ascending=True).tail(15)
     fig2 = px.bar(df_ranking_produtividade, 
                   x='vendas_por_corretor', 
@@ -65,7 +28,45 @@ with col2:
                   text='vendas_por_corretor',
                   labels={'vendas_por_corretor': 'Média de Vendas por Corretor (R$)', 'tipo_de_corretor': 'Tipo de Corretor'})
     fig2.update_traces(texttemplate='%{text:,.2s}', textposition='outside', marker_color='#FF8C00')
-    st.plotly_chart(fig2, use_container_width=True)
+    return fig2
+
+def criar_grafico_operadoras(contagem_operadoras):
+    df_operadora = contagem_operadoras.nlargest(10).reset_index().sort_values(by='count')
+    fig_op = px.bar(df_operadora, x='count', y='operadora', orientation='h', text='count', labels={'count': 'Nº de Vendas'})
+    fig_op.update_traces(textposition='outside')
+    return fig_op
+
+def criar_grafico_planos(contagem_planos):
+    df_plano = contagem_planos.nlargest(10).reset_index().sort_values(by='count')
+    fig_pl = px.bar(df_plano, x='count', y='plano', orientation='h', text='count', labels={'count': 'Nº de Vendas'})
+    fig_pl.update_traces(textposition='outside')
+    return fig_pl
+
+# --- Carrega os dados ---
+# As agregações vêm do motor de consultas. No DuckDB, elas rodam em SQL sobre o Parquet de vendas:
+# só os corretores distintos das vendas e o arquivo (pequeno) de inativos vão para a memória, para o alinhamento
+motor = motor_consultas(DadosLazy())
+df_performance = motor.desempenho_por_tipo()
+if df_performance is None:
+    st.stop()
+
+st.title("🏢 Análise por Tipo de Corretor")
+st.markdown("Compare a performance entre os diferentes tipos de corretores e explore as características de cada um.")
+
+# --- Visão Comparativa ---
+st.header("Visão Comparativa entre Tipos de Corretor")
+
+col1, col2 = st.columns(2)
+
+with col1:
+    st.subheader("Ranking por Total de Vendas")
+    fig1 = figura_em_cache('tipo_corretor', 'ranking_vendas', {}, lambda: criar_ranking_vendas(df_performance))
+    exibir_grafico(fig1)
+
+with col2:
+    st.subheader("Ranking por Produtividade (Vendas/Corretor)")
+    fig2 = figura_em_cache('tipo_corretor', 'ranking_produtividade', {}, lambda: criar_ranking_produtividade(df_performance))
+    exibir_grafico(fig2)
 
 
 # --- Mergulho Profundo ---
@@ -76,8 +77,7 @@ st.header("Análise Detalhada de um Tipo Específico")
 tipos_disponiveis = sorted(df_performance['tipo_de_corretor'].unique())
 tipo_selecionado = st.selectbox("Selecione um Tipo de Corretor para analisar", tipos_disponiveis)
 
-# Filtra os dataframes para o tipo selecionado
-df_vendas_filtrado = df_vendas[df_vendas['tipo_de_corretor'] == tipo_selecionado]
+filtro_tipo = {'tipo_de_corretor': tipo_selecionado}
 df_performance_filtrado = df_performance[df_performance['tipo_de_corretor'] == tipo_selecionado].iloc[0]
 
 # KPIs do grupo selecionado
@@ -111,19 +111,15 @@ chart1, chart2 = st.columns(2)
 
 with chart1:
     st.subheader("Operadoras Mais Vendidas")
-    df_operadora = df_vendas_filtrado['operadora'].value_counts().nlargest(10).reset_index().sort_values(by='count')
-    fig_op = px.bar(df_operadora, x='count', y='operadora', orientation='h', text='count', labels={'count': 'Nº de Vendas'})
-    fig_op.update_traces(textposition='outside')
-    st.plotly_chart(fig_op, use_container_width=True)
+    fig_op = figura_em_cache('tipo_corretor', 'operadoras', {'tipo': tipo_selecionado}, lambda: criar_grafico_operadoras(motor.contagem_por('operadora', filtro_tipo)))
+    exibir_grafico(fig_op)
 
 with chart2:
     st.subheader("Planos Mais Vendidos")
-    df_plano = df_vendas_filtrado['plano'].value_counts().nlargest(10).reset_index().sort_values(by='count')
-    fig_pl = px.bar(df_plano, x='count', y='plano', orientation='h', text='count', labels={'count': 'Nº de Vendas'})
-    fig_pl.update_traces(textposition='outside')
-    st.plotly_chart(fig_pl, use_container_width=True)
+    fig_pl = figura_em_cache('tipo_corretor', 'planos', {'tipo': tipo_selecionado}, lambda: criar_grafico_planos(motor.contagem_por('plano', filtro_tipo)))
+    exibir_grafico(fig_pl)
 
 # Ranking de corretores dentro do grupo
 with st.expander(f"Ver ranking de corretores do tipo '{tipo_selecionado}'"):
-    df_ranking_corretores = df_vendas_filtrado.groupby('corretor')['valor_proposta'].sum().sort_values(ascending=False).reset_index()
+    df_ranking_corretores = motor.vendas_por('corretor', filtro_tipo).rename('valor_proposta').sort_values(ascending=False).reset_index()
     st.dataframe(df_ranking_corretores.style.format({'valor_proposta': format_currency}))
\ No newline at end of file
@@ -2,14 +2,48 @@ import pandas as pd
 import streamlit as st
 import plotly.express as px
 import datetime
-from utils import load_data, format_currency, format_integer, render_sidebar
+from utils import DadosLazy, versao_dados, indexar_dados, motor_consultas, livro_caixa, figura_em_cache, tabela_paginada, COLUNAS_VALOR_CONTAS, format_currency, format_integer, render_sidebar, exibir_grafico
 
 st.set_page_config(layout="wide", page_title="Análise Financeira")
 
-render_sidebar()
+render_sidebar('financeiro')
+
+# --- Funções de Gráfico ---
+# Recebem as séries já agregadas pelo motor de consultas.
+def criar_grafico_categorias(despesas_categoria):
+    df_categoria = despesas_categoria.nlargest(10).sort_values()
+    fig_cat = px.bar(df_categoria, x=df_categoria.values, y=df_categoria.index, orientation='h', text=df_categoria.values)
+    fig_cat.update_traces(texttemplate='%{text:,.2s}', textposition='outside', marker_color='#f63366')
+    fig_cat.update_layout(yaxis_title=None, xaxis_title="Total Pago (R$)")
+    return fig_cat
+
+def criar_grafico_centros_custo(despesas_centro_custo):
+    df_cc = despesas_centro_custo.sort_values()
+    fig_cc = px.bar(df_cc, x=df_cc.values, y=df_cc.index, orientation='h', text=df_cc.values)
+    fig_cc.update_traces(texttemplate='%{text:,.2s}', textposition='outside')
+    fig_cc.update_layout(yaxis_title=None, xaxis_title="Total Pago (R$)")
+    return fig_cc
+
+def criar_grafico_fluxo(fluxo_mensal):
+    df_fluxo = fluxo_mensal.reset_index().melt(id_vars='mes', var_name='Parcelas', value_name='Valor original da parcela (R$)')
+    df_fluxo['Mês'] = df_fluxo['mes'].dt.strftime('%Y-%m')
+
+    fig_fluxo = px.bar(df_fluxo, x='Mês', y='Valor original da parcela (R$)', color='Parcelas', text='Valor original da parcela (R$)',
+                       color_discrete_map={'Lançadas': '#636EFA', 'Projetadas': '#B6BCF9'})
+    fig_fluxo.update_traces(texttemplate='%{text:,.2s}', textposition='inside')
+    fig_fluxo.update_layout(yaxis_title="Total a Pagar (R$)", xaxis_title="Mês de Vencimento")
+    return fig_fluxo
+
+def criar_grafico_fornecedores(despesas_fornecedor):
+    df_fornecedores = despesas_fornecedor.nlargest(20).sort_values()
+    fig_fornec = px.bar(df_fornecedores, x=df_fornecedores.values, y=df_fornecedores.index, orientation='h', text=df_fornecedores.values)
+    fig_fornec.update_traces(texttemplate='%{text:,.2s}', textposition='outside')
+    fig_fornec.update_layout(yaxis_title=None, xaxis_title="Total Pago (R$)")
+    return fig_fornec
 
 # --- Carrega os dados ---
-_, _, _, df_contas_pagar = load_data()
+dados = DadosLazy()
+df_contas_pagar = dados.contas_pagar
 if df_contas_pagar is None:
     st.stop()
 
@@ -32,13 +66,16 @@ with st.expander("FILTROS", expanded=True):
         data_fim = st.date_input("Vencimento Fim", data_max, min_value=data_min, max_value=data_max)
 
 # --- Filtragem dos Dados ---
-df_filtrado = df_contas_pagar.copy()
-if cat_selecionada != "Todas":
-    df_filtrado = df_filtrado[df_filtrado['Categoria 1'] == cat_selecionada]
-if cc_selecionado != "Todos":
-    df_filtrado = df_filtrado[df_filtrado['Centro de Custo 1'] == cc_selecionado]
-if data_inicio and data_fim:
-    df_filtrado = df_filtrado[(df_filtrado['Data de vencimento'].dt.date >= data_inicio) & (df_filtrado['Data de vencimento'].dt.date <= data_fim)]
+filtros = {
+    'Categoria 1': None if cat_selecionada == "Todas" else cat_selecionada,
+    'Centro de Custo 1': None if cc_selecionado == "Todos" else cc_selecionado,
+}
+indice_contas = indexar_dados(df_contas_pagar, 'contas_pagar', 'Data de vencimento', ('Categoria 1', 'Centro de Custo 1'), versao_dados())
+df_filtrado = indice_contas.linhas(indice_contas.filtrar(filtros, data_inicio, data_fim))
+estado_filtros = {**filtros, 'inicio': data_inicio, 'fim': data_fim}
+motor = motor_consultas(dados)
+# Vencimentos por dia (com as parcelas recorrentes projetadas), montado uma vez por versão dos dados
+livro = livro_caixa(df_contas_pagar, versao_dados())
 
 # --- Layout com Abas ---
 st.markdown(f"Exibindo dados de **{data_inicio.strftime('%d/%m/%Y')}** a **{data_fim.strftime('%d/%m/%Y')}**")
@@ -50,12 +87,11 @@ with tab1:
     st.header("Indicadores do Período")
     
     # KPIs
-    total_pago = df_filtrado['Valor total pago da parcela (R$)'].sum()
-    total_juros = df_filtrado['Juros realizado (R$)'].sum()
-    proximos_30_dias = df_contas_pagar[
-        (df_contas_pagar['Data de vencimento'] >= pd.to_datetime('today')) &
-        (df_contas_pagar['Data de vencimento'] <= pd.to_datetime('today') + datetime.timedelta(days=30))
-    ]['Valor original da parcela (R$)'].sum()
+    totais = motor.totais_financeiros(filtros, data_inicio, data_fim)
+    total_pago = totais['total_pago']
+    total_juros = totais['total_juros']
+    agora = pd.to_datetime('today')
+    proximos_30_dias = livro.total(agora, agora + datetime.timedelta(days=30))
     
     col1, col2, col3 = st.columns(3)
     col1.metric(
@@ -71,7 +107,7 @@ with tab1:
     col3.metric(
         "A Vencer (Próx. 30 dias)",
         format_currency(proximos_30_dias),
-        help="Soma do 'Valor original da parcela' de todas as contas com vencimento nos próximos 30 dias a partir de hoje."
+        help="Soma do 'Valor original da parcela' de todas as contas com vencimento nos próximos 30 dias a partir de hoje, incluindo as parcelas projetadas das contas recorrentes."
     )
     st.markdown("---")
     
@@ -79,43 +115,34 @@ with tab1:
     gcol1, gcol2 = st.columns(2)
     with gcol1:
         st.subheader("Top 10 Despesas por Categoria")
-        df_categoria = df_filtrado.groupby('Categoria 1')['Valor total pago da parcela (R$)'].sum().nlargest(10).sort_values()
-        fig_cat = px.bar(df_categoria, x=df_categoria.values, y=df_categoria.index, orientation='h', text=df_categoria.values)
-        fig_cat.update_traces(texttemplate='%{text:,.2s}', textposition='outside', marker_color='#f63366')
-        fig_cat.update_layout(yaxis_title=None, xaxis_title="Total Pago (R$)")
-        st.plotly_chart(fig_cat, use_container_width=True)
+        fig_cat = figura_em_cache('financeiro', 'categorias', estado_filtros, lambda: criar_grafico_categorias(motor.despesas_por('Categoria 1', filtros, data_inicio, data_fim)))
+        exibir_grafico(fig_cat)
 
     with gcol2:
         st.subheader("Despesas por Centro de Custo")
-        df_cc = df_filtrado.groupby('Centro de Custo 1')['Valor total pago da parcela (R$)'].sum().sort_values()
-        fig_cc = px.bar(df_cc, x=df_cc.values, y=df_cc.index, orientation='h', text=df_cc.values)
-        fig_cc.update_traces(texttemplate='%{text:,.2s}', textposition='outside')
-        fig_cc.update_layout(yaxis_title=None, xaxis_title="Total Pago (R$)")
-        st.plotly_chart(fig_cc, use_container_width=True)
+        fig_cc = figura_em_cache('financeiro', 'centros_custo', estado_filtros, lambda: criar_grafico_centros_custo(motor.despesas_por('Centro de Custo 1', filtros, data_inicio, data_fim)))
+        exibir_grafico(fig_cc)
 
 with tab2:
     st.header("Projeção de Contas a Pagar")
-    st.info("Este gráfico mostra o valor original das parcelas com vencimento nos próximos meses, independentemente dos filtros.")
+    st.info("Este gráfico mostra o valor original das parcelas com vencimento nos próximos meses. As parcelas que ainda não estão no arquivo são projetadas a partir da recorrência das contas (ex.: 7/12).")
+    aplicar_filtros = st.checkbox("Aplicar os filtros de categoria e centro de custo", value=False)
+    filtros_fluxo = filtros if aplicar_filtros else {}
 
-    df_futuro = df_contas_pagar[df_contas_pagar['Data de vencimento'].dt.date >= datetime.date.today()]
-    df_fluxo = df_futuro.set_index('Data de vencimento').resample('M')['Valor original da parcela (R$)'].sum().reset_index()
-    df_fluxo['Mês'] = df_fluxo['Data de vencimento'].dt.strftime('%Y-%m')
-
-    fig_fluxo = px.bar(df_fluxo, x='Mês', y='Valor original da parcela (R$)', text='Valor original da parcela (R$)')
-    fig_fluxo.update_traces(texttemplate='%{text:,.2s}', textposition='outside')
-    fig_fluxo.update_layout(yaxis_title="Total a Pagar (R$)", xaxis_title="Mês de Vencimento")
-    st.plotly_chart(fig_fluxo, use_container_width=True)
+    fig_fluxo = figura_em_cache('financeiro', 'fluxo_futuro', {**filtros_fluxo, 'hoje': datetime.date.today()},
+                                lambda: criar_grafico_fluxo(livro.mensal(datetime.date.today(), filtros_fluxo)))
+    exibir_grafico(fig_fluxo)
+    if not livro.projetadas.empty:
+        with st.expander(f"Ver as {format_integer(len(livro.projetadas))} parcelas projetadas"):
+            tabela_paginada(livro.projetadas, 'parcelas_projetadas', {'Valor original da parcela (R$)': 'moeda'})
 
 with tab3:
     st.header("Análise de Fornecedores")
     
     st.subheader("Top 20 Fornecedores por Valor Pago")
-    df_fornecedores = df_filtrado.groupby('Nome do fornecedor')['Valor total pago da parcela (R$)'].sum().nlargest(20).sort_values()
-    fig_fornec = px.bar(df_fornecedores, x=df_fornecedores.values, y=df_fornecedores.index, orientation='h', text=df_fornecedores.values)
-    fig_fornec.update_traces(texttemplate='%{text:,.2s}', textposition='outside')
-    fig_fornec.update_layout(yaxis_title=None, xaxis_title="Total Pago (R$)")
-    st.plotly_chart(fig_fornec, use_container_width=True)
+    fig_fornec = figura_em_cache('financeiro', 'fornecedores', estado_filtros, lambda: criar_grafico_fornecedores(motor.despesas_por('Nome do fornecedor', filtros, data_inicio, data_fim)))
+    exibir_grafico(fig_fornec)
 
 with tab4:
     st.header("Dados Detalhados")
-    st.dataframe(df_filtrado)
\ No newline at end of file
+    tabela_paginada(df_filtrado, 'contas_detalhadas', {col: 'moeda' for col in COLUNAS_VALOR_CONTAS})
\ No newline at end of file
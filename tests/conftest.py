@@ -0,0 +1,21 @@
+import os
+import sys
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Os testes importam os módulos da raiz do projeto (utils.py), sem a thread de atualização
+sys.path.insert(0, RAIZ)
+os.environ.setdefault('DASHBOARD_ATUALIZACAO_SEGUNDOS', '0')
+
+
+@pytest.fixture
+def pasta_dados(tmp_path, monkeypatch):
+    """Diretório de trabalho com as primeiras linhas de cada arquivo de data/ (sem corretores_inativos.csv)."""
+    os.makedirs(tmp_path / 'data')
+    for nome in ('vendas.csv', 'comissao.csv', 'contas_a_pagar_set24_set25.csv'):
+        with open(os.path.join(RAIZ, 'data', nome), 'rb') as origem, open(tmp_path / 'data' / nome, 'wb') as destino:
+            destino.writelines(linha for _, linha in zip(range(300), origem))
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
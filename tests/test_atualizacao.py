@@ -0,0 +1,66 @@
+"""Atualização em segundo plano: falhas ao montar uma versão não derrubam as páginas."""
+import os
+
+import pytest
+
+import utils
+
+
+@pytest.fixture
+def fontes(pasta_dados, monkeypatch):
+    """Versão das fontes controlada pelo teste; `erro` faz a próxima leitura falhar."""
+    estado = {'versao': 'v1', 'erro': None}
+
+    def versao_fontes(self):
+        if estado['erro'] is not None:
+            utils.avisar('warning', "aviso durante a atualização")
+            raise estado['erro']
+        return estado['versao']
+
+    monkeypatch.setattr(utils.AtualizadorDados, '_versao_fontes', versao_fontes)
+    return estado
+
+
+def test_falha_na_construcao_nao_publica_nada_e_guarda_o_erro(fontes):
+    fontes['erro'] = FileNotFoundError("data/vendas.csv")
+
+    atualizador = utils.AtualizadorDados(3600)
+
+    assert atualizador.atual is None
+    assert 'data/vendas.csv' in atualizador.erro
+    assert atualizador.avisos == [('warning', "aviso durante a atualização")]
+
+    fontes['erro'] = None
+    atualizador._tentar_atualizar()
+    assert atualizador.atual.versao == 'v1'
+    assert atualizador.erro is None and atualizador.avisos == []
+
+
+def test_falha_numa_atualizacao_mantem_a_versao_anterior(fontes):
+    atualizador = utils.AtualizadorDados(3600)
+    anterior = atualizador.atual
+    assert anterior.versao == 'v1' and atualizador.erro is None
+
+    fontes['versao'], fontes['erro'] = 'v2', OSError("fonte indisponível")
+    atualizador._tentar_atualizar()
+
+    assert atualizador.atual is anterior
+    assert atualizador.erro == "fonte indisponível"
+
+    fontes['erro'] = None
+    atualizador._tentar_atualizar()
+    assert atualizador.atual.versao == 'v2'
+    assert atualizador.erro is None
+
+
+def test_conjunto_indisponivel_na_nova_versao_mantem_a_anterior(fontes):
+    atualizador = utils.AtualizadorDados(3600)
+    anterior = atualizador.atual
+    assert len(anterior.frames['contas_pagar']) > 0
+
+    os.remove(os.path.join('data', 'contas_a_pagar_set24_set25.csv'))
+    fontes['versao'] = 'v2'
+    atualizador._tentar_atualizar()
+
+    assert atualizador.atual is anterior
+    assert atualizador.erro
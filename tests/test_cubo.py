@@ -0,0 +1,103 @@
+"""O cubo mensal (e o caminho pelas linhas, nos meses cortados) dá os mesmos números que um groupby nas linhas brutas."""
+import types
+import uuid
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import utils
+
+
+@pytest.fixture
+def vendas():
+    gerador = np.random.default_rng(3)
+    n = 600
+    datas = pd.Timestamp('2024-01-01') + pd.to_timedelta(gerador.integers(0, 182 * 24, n), unit='h')
+    df = pd.DataFrame({
+        'data_vigencia': datas,
+        'supervisor': gerador.choice(['SUP A', 'SUP B', 'SUP C'], n),
+        'tipo_de_corretor': gerador.choice(['ESCRITÓRIO 1', 'REPASSE'], n),
+        'corretor': gerador.choice([f'CORRETOR {i}' for i in range(12)], n),
+        'operadora': gerador.choice(['OP X', 'OP Y', 'OP Z'], n),
+        'plano': gerador.choice(['PLANO 1', 'PLANO 2'], n),
+        'valor_proposta': gerador.integers(5000, 90000, n) / 100,
+    })
+    # Vendas nas bordas dos meses, onde o corte por data e o cubo podem divergir
+    bordas = df.head(4).assign(data_vigencia=pd.to_datetime(['2024-02-01 00:00', '2024-02-29 23:00', '2024-03-15 00:00', '2024-04-30 18:00']))
+    return pd.concat([df, bordas], ignore_index=True)
+
+
+@pytest.fixture
+def motor(vendas, monkeypatch):
+    # Versão única: cubo e índices ficam em cache por versão dos dados
+    monkeypatch.setattr(utils, 'versao_dados', lambda: uuid.uuid4().hex)
+    return utils.MotorPandas(types.SimpleNamespace(vendas=vendas))
+
+
+def _linhas(vendas, filtros, inicio, fim):
+    mascara = pd.Series(True, index=vendas.index)
+    for col, valor in filtros.items():
+        if valor is not None:
+            mascara &= vendas[col] == valor
+    dias = vendas['data_vigencia'].dt.normalize()
+    if inicio is not None:
+        mascara &= dias >= pd.Timestamp(inicio)
+    if fim is not None:
+        mascara &= dias <= pd.Timestamp(fim)
+    return vendas[mascara]
+
+
+FILTROS = [
+    {},
+    {'supervisor': 'SUP A', 'tipo_de_corretor': None},
+    {'supervisor': None, 'tipo_de_corretor': 'REPASSE'},
+    {'supervisor': 'SUP B', 'tipo_de_corretor': 'ESCRITÓRIO 1'},
+]
+JANELAS = [
+    (None, None),
+    ('2024-02-01', '2024-04-30'),   # meses inteiros: responde pelo cubo
+    ('2024-02-15', '2024-04-30'),   # começa no meio do mês
+    ('2024-02-01', '2024-03-15'),   # termina no meio do mês
+    ('2024-01-10', '2024-05-20'),
+    ('2024-03-15', '2024-03-15'),
+]
+
+
+@pytest.mark.parametrize('inicio, fim', JANELAS)
+@pytest.mark.parametrize('filtros', FILTROS)
+def test_agregados_iguais_ao_groupby_das_linhas(motor, vendas, filtros, inicio, fim):
+    linhas = _linhas(vendas, filtros, inicio, fim)
+
+    resumo = motor.resumo_vendas(filtros, inicio, fim)
+    assert resumo['num_vendas'] == len(linhas)
+    assert resumo['total_vendas'] == pytest.approx(linhas['valor_proposta'].sum())
+    assert resumo['ticket_medio'] == pytest.approx(linhas['valor_proposta'].mean() if len(linhas) else 0)
+    assert resumo['corretores_ativos'] == linhas['corretor'].nunique()
+
+    mensal = linhas.set_index('data_vigencia')['valor_proposta'].resample('ME').sum()
+    pd.testing.assert_series_equal(motor.vendas_mensais(filtros, inicio, fim), mensal,
+                                   check_names=False, check_freq=False, check_index_type=False, check_dtype=len(linhas) > 0)
+
+    for dimensao in ('corretor', 'operadora', 'plano'):
+        esperado = linhas.groupby(dimensao)['valor_proposta'].sum()
+        pd.testing.assert_series_equal(motor.vendas_por(dimensao, filtros, inicio, fim).sort_index(), esperado,
+                                       check_names=False)
+        contagem = motor.contagem_por(dimensao, filtros, inicio, fim)
+        assert contagem.sort_index().to_dict() == linhas[dimensao].value_counts().sort_index().to_dict()
+
+
+@pytest.mark.parametrize('inicio, fim, cubo', [
+    ('2024-01-01', '2024-06-30', True),
+    ('2024-02-01', '2024-04-30', True),
+    ('2024-02-15', '2024-04-30', False),
+    ('2024-02-01', '2024-03-15', False),
+])
+def test_fatiar_cubo_so_responde_meses_inteiros(vendas, inicio, fim, cubo):
+    indice = utils.IndiceFiltro(utils._agregar_cubo(utils.fatos_de_linhas(vendas)), 'mes', ['supervisor', 'tipo_de_corretor'])
+    fatia = utils.fatiar_cubo(indice, {}, inicio, fim, vendas['data_vigencia'].min(), vendas['data_vigencia'].max())
+    assert (fatia is not None) == cubo
+    if cubo:
+        linhas = _linhas(vendas, {}, inicio, fim)
+        assert fatia['num_vendas'].sum() == len(linhas)
+        assert fatia['valor_total'].sum() == pytest.approx(linhas['valor_proposta'].sum())
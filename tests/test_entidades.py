@@ -0,0 +1,109 @@
+"""Resolução de entidades: chaves normalizadas, ids estáveis e o alinhamento por um erro de digitação."""
+import hashlib
+
+import pandas as pd
+import pytest
+
+import utils
+
+
+@pytest.mark.parametrize('nome, chave', [
+    ('José da Silva', 'JOSE DA SILVA'),
+    ('  jose  da   silva ', 'JOSE DA SILVA'),
+    ('CONCEIÇÃO CORRETORA LTDA.', 'CONCEICAO CORRETORA'),
+    ('Conceição Corretora Ltda - ME', 'CONCEICAO CORRETORA'),
+    ('VIDA SEGUROS S/A', 'VIDA SEGUROS'),
+    ('VIDA SEGUROS S.A.', 'VIDA SEGUROS'),
+    ('ANA SÁ', 'ANA SA'),
+    ('ME', 'ME'),
+    ('FILIAL 01 (CENTRO)', 'FILIAL 01 CENTRO'),
+])
+def test_normalizar_nome(nome, chave):
+    assert utils.normalizar_nome(nome) == chave
+
+
+def test_id_entidade_e_estavel_positivo_e_de_64_bits():
+    chave = 'JOSE DA SILVA'
+    esperado = int.from_bytes(hashlib.blake2b(chave.encode(), digest_size=8).digest(), 'big') >> 1
+
+    assert utils._id_entidade(chave) == esperado
+    assert 0 <= utils._id_entidade(chave) < 2 ** 63
+    assert utils._id_entidade('JOSE DA SILVA') != utils._id_entidade('JOSE DA SILVA FILHO')
+
+
+@pytest.mark.parametrize('a, b, esperado', [
+    ('FERREIRA', 'FEREIRA', True),      # letra faltando
+    ('FEREIRA', 'FERREIRA', True),      # letra sobrando
+    ('FERREIRA', 'FERREIRO', True),     # letra trocada
+    ('FERREIRA', 'FEREIRO', False),     # duas edições
+    ('FERREIRA', 'PEREIRAS', False),
+    ('SILVA', 'SILVANA', False),
+])
+def test_uma_edicao(a, b, esperado):
+    assert utils._uma_edicao(a, b) is esperado
+
+
+@pytest.mark.parametrize('chave, candidata, esperado', [
+    ('MARIA APARECIDA FEREIRA', 'MARIA APARECIDA FERREIRA', True),
+    ('MARIA APARECIDA FERREIRA', 'MARIA APARECIDA PEREIRA', False),  # letra a mais e trocada
+    ('JOAO LIMO', 'JOAO LIMA', False),                                # palavra curta demais
+    ('MARIA APARECDA FEREIRA', 'MARIA APARECIDA FERREIRA', False),   # duas palavras diferentes
+])
+def test_semelhantes(chave, candidata, esperado):
+    assert utils._semelhantes(chave, candidata) is esperado
+
+
+def test_bloco_separa_digitos_e_numero_de_palavras():
+    assert utils._bloco('CORRETOR 00001') != utils._bloco('CORRETOR 00002')
+    assert utils._bloco('MARIA DA SILVA') != utils._bloco('MARIA SILVA')
+    assert utils._bloco('MARIA DA SILVA') == utils._bloco('MARIA DA SILVO')
+
+
+def test_chavear_agrupa_grafias_e_usa_a_mais_frequente():
+    df = pd.DataFrame({'corretor': ['José Silva', 'JOSE SILVA', 'JOSE SILVA', 'Jose Silva ME', 'JOSE PEREIRA', 'JOSE FERREIRA']})
+
+    utils.chavear_entidades(df, 'corretor', 'id_corretor')
+
+    assert list(df['corretor'][:4]) == ['JOSE SILVA'] * 4
+    assert df['id_corretor'][:4].nunique() == 1
+    assert df['id_corretor'].iloc[0] == utils._id_entidade('JOSE SILVA')
+    # Nomes parecidos dentro da mesma fonte continuam separados
+    assert df['id_corretor'].nunique() == 3
+
+
+def test_chavear_com_id_de_origem():
+    df = pd.DataFrame({'corretor': ['ANA LIMA', 'Ana Lima ', 'ANA LIMA'], 'broker_id': [7, 7, 8]})
+
+    utils.chavear_entidades(df, 'corretor', 'id_corretor', coluna_origem='broker_id')
+
+    assert 'broker_id' not in df.columns
+    assert list(df['id_corretor']) == [7, 7, 8]
+
+
+def test_alinhar_leva_variantes_para_a_referencia():
+    vendas = utils.chavear_entidades(pd.DataFrame({'corretor': ['MARIA APARECIDA FERREIRA', 'CORRETOR 00001', 'JOAO LIMA']}), 'corretor', 'id_corretor')
+    inativos = utils.chavear_entidades(pd.DataFrame({'corretor': [
+        'Maria Aparecida Fereira',   # um erro de digitação: vai para a entidade das vendas
+        'MARIA APARECIDA FERREIRA LTDA',  # mesma chave
+        'CORRETOR 00002',            # outro número: outra entidade
+        'JOAO LIMO',                 # palavra curta: não junta
+    ]}), 'corretor', 'id_corretor')
+    ids_vendas = dict(zip(vendas['corretor'], vendas['id_corretor']))
+
+    utils.alinhar_entidades(vendas, [inativos])
+
+    assert list(inativos['corretor'][:2]) == ['MARIA APARECIDA FERREIRA'] * 2
+    assert list(inativos['id_corretor'][:2]) == [ids_vendas['MARIA APARECIDA FERREIRA']] * 2
+    assert inativos['id_corretor'].iloc[2] not in ids_vendas.values()
+    assert inativos['id_corretor'].iloc[3] not in ids_vendas.values()
+    assert list(inativos['corretor'][2:]) == ['CORRETOR 00002', 'JOAO LIMO']
+
+
+def test_alinhar_nao_aceita_semelhanca_ambigua():
+    vendas = utils.chavear_entidades(pd.DataFrame({'corretor': ['ANA PAULA SOUZA', 'ANA PAULA SOUSA']}), 'corretor', 'id_corretor')
+    inativos = utils.chavear_entidades(pd.DataFrame({'corretor': ['ANA PAULA SOUXA']}), 'corretor', 'id_corretor')
+    id_original = inativos['id_corretor'].iloc[0]
+
+    utils.alinhar_entidades(vendas, [inativos])
+
+    assert inativos['id_corretor'].iloc[0] == id_original
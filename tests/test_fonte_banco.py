@@ -0,0 +1,120 @@
+"""Leitura de vendas e comissões pelo caminho do banco (consultas de CONSULTA_VENDAS/CONSULTA_COMISSOES).
+
+O esquema do PostgreSQL é montado num SQLite em memória, com os mesmos dados
+gravados num CSV no formato dos arquivos exportados, e as duas leituras têm de
+trazer as mesmas linhas e os mesmos totais.
+"""
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import utils
+
+CORRETORES = [
+    (1, 'ANA PAULA SILVA', 'ESCRITÓRIO 1', 'MARIA JOSE'),
+    (2, 'VOOGUE CORRETORA', 'ESCRITÓRIO 2', 'MARIA JOSE'),
+    (3, 'JOSE CARLOS LIMA', 'REPASSE 3', 'JOAO PEDRO'),
+]
+PLANOS = [(1, 'ADESAO', 'HAPVIDA'), (2, 'QUALICORP', 'BLUE SAUDE')]
+VENDAS = [
+    ('2024-08-01', 1, 1, 590.57),
+    ('2024-08-01', 2, 2, 675.17),
+    ('2024-08-15', 1, 2, 418.32),
+    ('2024-09-02', 3, 1, 1008.27),
+    ('2024-09-20', 2, 1, 250.00),
+    ('2024-10-05', 1, 1, 99.90),
+]
+COMISSOES = [
+    ('2024-08-12', 1, 134.07),
+    ('2024-08-12', 2, 229.82),
+    ('2024-09-12', 3, 254.82),
+    ('2024-10-12', 1, 376.98),
+]
+
+
+@pytest.fixture
+def conexao():
+    conexao = sqlite3.connect(':memory:')
+    conexao.executescript("""
+        CREATE TABLE broker_types (id INTEGER PRIMARY KEY, description TEXT);
+        CREATE TABLE brokers (id INTEGER PRIMARY KEY, name TEXT, broker_type_id INTEGER);
+        CREATE TABLE supervisors (id INTEGER PRIMARY KEY, name TEXT);
+        CREATE TABLE operators (id INTEGER PRIMARY KEY, name TEXT);
+        CREATE TABLE plans (id INTEGER PRIMARY KEY, description TEXT, operator_id INTEGER);
+        CREATE TABLE proposals (effective_date TEXT, broker_id INTEGER, supervisor_id INTEGER, plan_id INTEGER, proposal_value REAL);
+        CREATE TABLE receipts (discharge_date TEXT, broker_id INTEGER, amount_to_pay REAL);
+    """)
+    tipos = {tipo: i for i, tipo in enumerate(sorted({c[2] for c in CORRETORES}), start=1)}
+    supervisores = {nome: i for i, nome in enumerate(sorted({c[3] for c in CORRETORES}), start=1)}
+    operadoras = {nome: i for i, nome in enumerate(sorted({p[2] for p in PLANOS}), start=1)}
+    conexao.executemany("INSERT INTO broker_types VALUES (?, ?)", [(i, t) for t, i in tipos.items()])
+    conexao.executemany("INSERT INTO supervisors VALUES (?, ?)", [(i, n) for n, i in supervisores.items()])
+    conexao.executemany("INSERT INTO operators VALUES (?, ?)", [(i, n) for n, i in operadoras.items()])
+    conexao.executemany("INSERT INTO brokers VALUES (?, ?, ?)", [(id_, nome, tipos[tipo]) for id_, nome, tipo, _ in CORRETORES])
+    conexao.executemany("INSERT INTO plans VALUES (?, ?, ?)", [(id_, plano, operadoras[operadora]) for id_, plano, operadora in PLANOS])
+    supervisor_do_corretor = {id_: supervisores[sup] for id_, _, _, sup in CORRETORES}
+    conexao.executemany("INSERT INTO proposals VALUES (?, ?, ?, ?, ?)",
+                        [(data, corretor, supervisor_do_corretor[corretor], plano, valor) for data, corretor, plano, valor in VENDAS])
+    conexao.executemany("INSERT INTO receipts VALUES (?, ?, ?)", COMISSOES)
+    yield conexao
+    conexao.close()
+
+
+@pytest.fixture
+def csvs(tmp_path):
+    """Os mesmos dados no formato de data/vendas.csv e data/comissao.csv."""
+    corretores = {id_: (nome, tipo, sup) for id_, nome, tipo, sup in CORRETORES}
+    planos = {id_: (plano, operadora) for id_, plano, operadora in PLANOS}
+    vendas = pd.DataFrame([
+        {'data_vigencia': data, 'supervisor': corretores[c][2], 'corretor': corretores[c][0], 'tipo_de_corretor': corretores[c][1],
+         'operadora': planos[p][1], 'plano': planos[p][0], 'valor_proposta': valor}
+        for data, c, p, valor in VENDAS])
+    comissoes = pd.DataFrame([
+        {'data_baixa': data, 'corretor': corretores[c][0], 'tipo_de_corretor': corretores[c][1], 'amount_to_pay': valor}
+        for data, c, valor in COMISSOES])
+    vendas.to_csv(tmp_path / 'vendas.csv', index=False)
+    comissoes.to_csv(tmp_path / 'comissao.csv', index=False)
+    return utils._parse_vendas(tmp_path / 'vendas.csv'), utils._parse_pagamentos(tmp_path / 'comissao.csv')
+
+
+def _totais_por_corretor(df, coluna_valor):
+    return df.groupby(df['corretor'].astype(str))[coluna_valor].agg(['count', 'sum'])
+
+
+def test_banco_e_csv_trazem_as_mesmas_linhas_e_totais(conexao, csvs):
+    csv_vendas, csv_comissoes = csvs
+    vendas, comissoes = utils.carregar_fonte_banco(conexao, cursor_servidor=False)
+
+    assert len(vendas) == len(csv_vendas) == len(VENDAS)
+    assert len(comissoes) == len(csv_comissoes) == len(COMISSOES)
+    assert vendas['valor_proposta'].sum() == pytest.approx(csv_vendas['valor_proposta'].sum())
+    assert comissoes['amount_to_pay'].sum() == pytest.approx(csv_comissoes['amount_to_pay'].sum())
+    pd.testing.assert_frame_equal(_totais_por_corretor(vendas, 'valor_proposta'), _totais_por_corretor(csv_vendas, 'valor_proposta'))
+    pd.testing.assert_frame_equal(_totais_por_corretor(comissoes, 'amount_to_pay'), _totais_por_corretor(csv_comissoes, 'amount_to_pay'))
+    assert vendas['data_vigencia'].min() == csv_vendas['data_vigencia'].min()
+    assert vendas['data_vigencia'].max() == csv_vendas['data_vigencia'].max()
+
+
+def test_banco_usa_o_broker_id_como_id_corretor(conexao):
+    vendas, comissoes = utils.carregar_fonte_banco(conexao, cursor_servidor=False)
+
+    esperado = {nome: id_ for id_, nome, _, _ in CORRETORES}
+    for df in (vendas, comissoes):
+        assert 'broker_id' not in df.columns
+        assert dict(zip(df['corretor'].astype(str), df['id_corretor'])) == {nome: esperado[nome] for nome in df['corretor'].astype(str)}
+
+
+def test_leitura_incremental_traz_so_as_linhas_desde_a_data(conexao):
+    vendas, comissoes = utils.carregar_fonte_banco(conexao, cursor_servidor=False, desde=pd.Timestamp('2024-09-01'))
+
+    assert len(vendas) == sum(data >= '2024-09-01' for data, *_ in VENDAS)
+    assert len(comissoes) == sum(data >= '2024-09-01' for data, *_ in COMISSOES)
+    assert vendas['data_vigencia'].min() >= pd.Timestamp('2024-09-01')
+
+
+def test_consulta_sem_linhas_devolve_dataframe_vazio_com_as_colunas(conexao):
+    vendas = utils.ler_vendas_banco(conexao, cursor_servidor=False, desde=pd.Timestamp('2030-01-01'))
+
+    assert vendas.empty
+    assert {'data_vigencia', 'corretor', 'valor_proposta', 'id_corretor'} <= set(vendas.columns)
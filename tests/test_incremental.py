@@ -0,0 +1,92 @@
+"""Modo incremental (DASHBOARD_INCREMENTAL=1): leitura por conjunto e arquivos faltando."""
+import pytest
+
+import utils
+
+
+@pytest.fixture
+def incremental(pasta_dados, monkeypatch):
+    monkeypatch.setattr(utils, 'MODO_INCREMENTAL', True)
+    utils.repositorio_incremental.clear()
+    yield pasta_dados
+    utils.repositorio_incremental.clear()
+
+
+def _acrescentar(caminho, linhas):
+    with open(caminho, 'a', encoding='utf-8') as f:
+        f.writelines(linha + '\n' for linha in linhas)
+
+
+def test_cada_conjunto_so_e_lido_quando_pedido(incremental):
+    repositorio = utils.RepositorioIncremental()
+    assert repositorio.frames == {}
+
+    repositorio.conjuntos(['contas_pagar'])
+    assert set(repositorio.frames) == {'contas_pagar'}
+
+    # As comissões são alinhadas aos ids das vendas, que vêm junto
+    repositorio.conjuntos(['pagamentos'])
+    assert set(repositorio.frames) == {'contas_pagar', 'vendas', 'pagamentos'}
+
+
+def test_sem_arquivo_de_inativos_os_demais_conjuntos_carregam(incremental):
+    repositorio = utils.RepositorioIncremental()
+    frames = repositorio.conjuntos(list(utils.LEITORES))
+
+    assert frames['inativos'].empty
+    assert {'data', 'corretor', 'tipo_de_corretor', 'id_corretor'} <= set(frames['inativos'].columns)
+    assert [tipo for tipo, _ in repositorio.avisos['inativos']] == ['warning']
+    assert len(frames['vendas']) == 299
+    assert len(frames['contas_pagar']) > 0
+    assert repositorio.avisos['vendas'] == [] and repositorio.avisos['contas_pagar'] == []
+
+
+def test_arquivo_faltando_fica_restrito_ao_seu_conjunto(incremental):
+    (incremental / 'data' / 'comissao.csv').unlink()
+    repositorio = utils.RepositorioIncremental()
+    frames = repositorio.conjuntos(list(utils.LEITORES))
+
+    assert frames['pagamentos'] is None
+    assert [tipo for tipo, _ in repositorio.avisos['pagamentos']] == ['error']
+    assert len(frames['vendas']) == 299
+    assert len(frames['contas_pagar']) > 0
+
+
+def test_pagina_financeira_abre_sem_arquivo_de_inativos(incremental):
+    dados = utils.DadosLazy()
+
+    assert len(dados.contas_pagar) > 0
+    assert set(utils.repositorio_incremental().frames) == {'contas_pagar'}
+    assert dados.inativos.empty
+
+
+def test_arquivo_de_inativos_que_aparece_depois_e_lido_e_alinhado(incremental):
+    repositorio = utils.RepositorioIncremental()
+    repositorio.conjuntos(['inativos'])
+    vendas = repositorio.frames['vendas']
+    corretor, tipo = str(vendas['corretor'].iloc[0]), str(vendas['tipo_de_corretor'].iloc[0])
+    _acrescentar(incremental / 'data' / 'corretores_inativos.csv',
+                 ['data,corretor,tipo_de_corretor', f"2025-01-10,{corretor.lower()},{tipo}"])
+
+    versao = repositorio.versao
+    repositorio.atualizar()
+
+    inativos = repositorio.frames['inativos']
+    assert repositorio.versao > versao
+    assert len(inativos) == 1
+    assert inativos['id_corretor'].iloc[0] == vendas['id_corretor'].iloc[0]
+    assert repositorio.avisos['inativos'] == []
+
+
+def test_linhas_acrescentadas_entram_como_delta(incremental):
+    repositorio = utils.RepositorioIncremental()
+    total = repositorio.conjuntos(['vendas'])['vendas']['valor_proposta'].sum()
+    _acrescentar(incremental / 'data' / 'vendas.csv',
+                 ['2025-09-01,SUPERVISOR TESTE,CORRETOR TESTE,ESCRITÓRIO 1,OPERADORA TESTE,PLANO TESTE,100.00'])
+
+    repositorio.atualizar()
+
+    assert len(repositorio.frames['vendas']) == 300
+    assert repositorio.frames['vendas']['valor_proposta'].sum() == pytest.approx(total + 100)
+    assert repositorio.agregados['vendas_corretor']['total_vendas'].sum() == pytest.approx(total + 100)
+    assert set(repositorio.frames) == {'vendas'}
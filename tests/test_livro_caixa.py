@@ -0,0 +1,91 @@
+"""Livro de caixa: somas acumuladas e projeção das contas recorrentes num livro montado à mão."""
+import numpy as np
+import pandas as pd
+import pytest
+
+import utils
+
+COLUNAS = ['Data de vencimento', 'Nome do fornecedor', 'Descrição', 'Categoria 1', 'Centro de Custo 1', 'Recorrência',
+           utils.COLUNA_VALOR_ORIGINAL]
+CONTAS = [
+    ('2024-01-10', 'IMOBILIARIA', 'Aluguel sala', 'ADMINISTRATIVO', 'ESCRITÓRIO', '1/3', 1000.0),
+    ('2024-02-10', 'IMOBILIARIA', 'Aluguel sala', 'ADMINISTRATIVO', 'ESCRITÓRIO', '2/3', 1000.0),
+    ('2024-01-31', 'SOFTWARE SA', 'Licença', 'TECNOLOGIA', 'TI', '11/12', 300.0),
+    ('2024-01-05', 'LIMPA TUDO', 'Limpeza', 'ADMINISTRATIVO', 'ESCRITÓRIO', '2/4', 80.0),
+    ('2024-01-15', 'GRAFICA', 'Cartões', 'MARKETING', 'COMERCIAL', '3/3', 45.5),
+    ('2024-01-15', 'ENERGIA', 'Conta de luz', 'ADMINISTRATIVO', 'ESCRITÓRIO', '', 250.25),
+    ('2024-02-20', 'ENERGIA', 'Conta de luz', 'ADMINISTRATIVO', 'ESCRITÓRIO', np.nan, 260.75),
+    ('2024-02-20', 'POSTO', 'Combustível', 'MARKETING', np.nan, '', 120.0),
+]
+
+
+@pytest.fixture
+def contas():
+    df = pd.DataFrame(CONTAS, columns=COLUNAS)
+    df['Data de vencimento'] = pd.to_datetime(df['Data de vencimento'])
+    return df
+
+
+def test_projeta_parcelas_restantes_depois_do_ultimo_vencimento(contas):
+    projetadas = utils.projetar_recorrencias(contas)
+
+    obtidas = set(zip(projetadas['Nome do fornecedor'], projetadas['Recorrência'],
+                      projetadas['Data de vencimento'].dt.strftime('%Y-%m-%d'), projetadas[utils.COLUNA_VALOR_ORIGINAL]))
+    assert obtidas == {
+        ('IMOBILIARIA', '3/3', '2024-03-10', 1000.0),
+        # Dia 31 em fevereiro vira o último dia do mês
+        ('SOFTWARE SA', '12/12', '2024-02-29', 300.0),
+        # 3/4 venceria em 05/02, dentro do período exportado: foi cancelada e só a 4/4 é projetada
+        ('LIMPA TUDO', '4/4', '2024-03-05', 80.0),
+    }
+    linha = projetadas.set_index('Nome do fornecedor').loc['IMOBILIARIA']
+    assert (linha['Categoria 1'], linha['Centro de Custo 1']) == ('ADMINISTRATIVO', 'ESCRITÓRIO')
+
+
+def _lancamentos(contas, livro):
+    return pd.concat([contas.assign(projetada=False), livro.projetadas.assign(projetada=True)], ignore_index=True)
+
+
+@pytest.mark.parametrize('filtros', [
+    None,
+    {'Categoria 1': 'ADMINISTRATIVO', 'Centro de Custo 1': None},
+    {'Categoria 1': 'ADMINISTRATIVO', 'Centro de Custo 1': 'ESCRITÓRIO'},
+    {'Categoria 1': None, 'Centro de Custo 1': 'TI'},
+])
+@pytest.mark.parametrize('projetadas', [None, False, True])
+def test_saldo_acumulado_igual_a_soma_cumulativa(contas, filtros, projetadas):
+    livro = utils.LivroCaixa(contas)
+    lancamentos = _lancamentos(contas, livro)
+    for col, valor in (filtros or {}).items():
+        if valor is not None:
+            lancamentos = lancamentos[lancamentos[col] == valor]
+    if projetadas is not None:
+        lancamentos = lancamentos[lancamentos['projetada'] == projetadas]
+    dias = pd.date_range('2024-01-01', '2024-03-31', freq='D')
+    acumulado = lancamentos.groupby('Data de vencimento')[utils.COLUNA_VALOR_ORIGINAL].sum().reindex(dias, fill_value=0).cumsum()
+
+    for dia in dias:
+        assert livro.total('2023-12-01', dia, filtros, projetadas) == pytest.approx(acumulado[dia])
+    # Janelas no meio do período: diferença de dois acumulados
+    for inicio, fim in [('2024-01-15', '2024-01-15'), ('2024-01-11', '2024-02-29'), ('2024-02-21', '2024-03-09')]:
+        esperado = acumulado[fim] - acumulado[pd.Timestamp(inicio) - pd.Timedelta(days=1)]
+        assert livro.total(inicio, fim, filtros, projetadas) == pytest.approx(esperado)
+
+
+def test_total_fora_do_periodo_e_janela_invertida(contas):
+    livro = utils.LivroCaixa(contas)
+    assert livro.total('2023-01-01', '2023-12-31') == 0.0
+    assert livro.total('2024-04-01', '2024-12-31') == 0.0
+    assert livro.total('2024-02-20', '2024-01-01') == 0.0
+    assert livro.total('2024-02-20', '2024-02-20', {'Categoria 1': 'MARKETING', 'Centro de Custo 1': None}) == pytest.approx(120.0)
+
+
+def test_mensal_separa_lancadas_e_projetadas(contas):
+    livro = utils.LivroCaixa(contas)
+
+    mensal = livro.mensal('2024-01-12')
+
+    assert list(mensal.index) == list(pd.to_datetime(['2024-01-31', '2024-02-29', '2024-03-31']))
+    assert mensal['Lançadas'].tolist() == pytest.approx([300.0 + 45.5 + 250.25, 1000.0 + 260.75 + 120.0, 0.0])
+    assert mensal['Projetadas'].tolist() == pytest.approx([0.0, 300.0, 1000.0 + 80.0])
+    assert livro.mensal('2024-04-01').empty
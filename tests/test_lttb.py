@@ -0,0 +1,49 @@
+"""Redução de pontos dos gráficos pelo Largest-Triangle-Three-Buckets."""
+import numpy as np
+import pandas as pd
+import pytest
+
+import utils
+
+
+def _serie(n, semente=0):
+    datas = pd.date_range('2020-01-01', periods=n, freq='D')
+    return pd.Series(np.random.default_rng(semente).normal(1000, 200, n).cumsum(), index=datas)
+
+
+@pytest.mark.parametrize('n, limite', [(0, 10), (1, 10), (10, 10), (9, 10), (50, 2)])
+def test_lttb_devolve_todos_os_pontos_quando_cabem_no_limite(n, limite):
+    x = np.arange(n)
+    np.testing.assert_array_equal(utils.lttb(x, np.ones(n), limite), np.arange(n))
+
+
+@pytest.mark.parametrize('n, limite', [(11, 10), (1000, 3), (1000, 100), (5000, 800), (1001, 1000)])
+def test_lttb_mantem_pontas_tamanho_e_ordem(n, limite):
+    serie = _serie(n, semente=n)
+    x = serie.index.to_numpy().astype('datetime64[ns]').astype(np.int64)
+
+    escolhidos = utils.lttb(x, serie.to_numpy(), limite)
+
+    assert len(escolhidos) == limite
+    assert escolhidos[0] == 0 and escolhidos[-1] == n - 1
+    assert np.all(np.diff(escolhidos) > 0)
+    assert np.all(np.diff(x[escolhidos]) > 0)
+
+
+def test_lttb_preserva_picos():
+    y = np.zeros(1000)
+    y[[137, 512, 888]] = [50, -80, 120]
+    escolhidos = utils.lttb(np.arange(1000), y, 20)
+    assert {137, 512, 888} <= set(escolhidos)
+
+
+def test_reduzir_serie():
+    curta = _serie(30)
+    assert utils.reduzir_serie(curta, 30) is curta
+
+    longa = _serie(3000)
+    reduzida = utils.reduzir_serie(longa, 200)
+    assert len(reduzida) == 200
+    assert reduzida.index[0] == longa.index[0] and reduzida.index[-1] == longa.index[-1]
+    assert reduzida.index.is_monotonic_increasing and reduzida.index.is_unique
+    pd.testing.assert_series_equal(reduzida, longa.loc[reduzida.index])
@@ -0,0 +1,79 @@
+"""Bitmaps da matriz de atividade comparados com filtros diretos nas linhas."""
+import numpy as np
+import pandas as pd
+import pytest
+
+import utils
+
+N_CORRETORES = 30
+
+
+@pytest.fixture
+def dados():
+    gerador = np.random.default_rng(11)
+    # 20 meses de dados: as janelas cruzam as bordas dos bytes do packbits (8 meses por byte)
+    datas = pd.Timestamp('2023-01-01') + pd.to_timedelta(gerador.integers(0, 608, 700), unit='D')
+    ids = gerador.integers(0, N_CORRETORES - 5, 700)
+    # Cada corretor vende só numa faixa de meses, para haver ativos e inativos em cada janela
+    validas = (datas.month + ids) % 4 != 0
+    vendas = pd.DataFrame({
+        'data_vigencia': datas[validas],
+        'id_corretor': ids[validas],
+        'corretor': [f'CORRETOR {i}' for i in ids[validas]],
+        'tipo_de_corretor': np.where(ids[validas] % 2, 'REPASSE', 'ESCRITÓRIO 1'),
+        'valor_proposta': 100.0,
+    }).astype({'id_corretor': 'Int64'})
+    # Os 5 últimos corretores só aparecem nos inativos
+    ids_inativos = np.r_[np.arange(N_CORRETORES - 5, N_CORRETORES), [0, 3, 8]]
+    inativos = pd.DataFrame({
+        'data': pd.to_datetime(['2023-02-10', '2023-09-01', '2024-01-31', '2024-06-15', '2023-12-05', '2024-08-20', '2023-05-05', '2024-03-03']),
+        'id_corretor': ids_inativos,
+        'corretor': [f'CORRETOR {i}' for i in ids_inativos],
+        'tipo_de_corretor': 'REPASSE',
+    }).astype({'id_corretor': 'Int64'})
+    return vendas, inativos
+
+
+JANELAS = [
+    ('2023-01-01', '2024-08-31'),
+    ('2023-03-01', '2024-02-29'),
+    ('2023-06-01', '2024-07-31'),
+    ('2023-08-01', '2023-09-30'),
+    ('2023-09-01', '2023-09-30'),
+    ('2022-06-01', '2023-04-30'),
+]
+
+
+@pytest.mark.parametrize('inicio, fim', JANELAS)
+def test_ativos_e_inativos_iguais_ao_filtro_nas_linhas(dados, inicio, fim):
+    vendas, inativos = dados
+    matriz = utils.MatrizAtividade(vendas, inativos)
+
+    ativos = matriz.ativos_no_periodo(inicio, fim)
+
+    assert len(matriz.base) == N_CORRETORES
+    no_periodo = vendas[(vendas['data_vigencia'] >= inicio) & (vendas['data_vigencia'] <= fim)]
+    ids = matriz.base['id_corretor']
+    assert set(ids[ativos]) == set(no_periodo['id_corretor'])
+    assert set(ids[~ativos]) == set(range(N_CORRETORES)) - set(no_periodo['id_corretor'])
+    assert 0 < ativos.sum() < N_CORRETORES
+
+
+@pytest.mark.parametrize('inicio, fim', [('2023-03-15', '2024-02-29'), ('2023-03-01', '2024-02-20')])
+def test_periodo_que_corta_mes_nao_usa_bitmap(dados, inicio, fim):
+    assert utils.MatrizAtividade(*dados).ativos_no_periodo(inicio, fim) is None
+
+
+@pytest.mark.parametrize('id_corretor', [0, 3, 8, 13, 27])
+def test_status_mensal_igual_ao_filtro_nas_linhas(dados, id_corretor):
+    vendas, inativos = dados
+    matriz = utils.MatrizAtividade(vendas, inativos)
+
+    status = matriz.status(id_corretor, '2023-05-01', '2024-06-30')
+
+    meses = pd.date_range('2023-05-01', '2024-06-01', freq='MS')
+    vendeu = set(vendas.loc[vendas['id_corretor'] == id_corretor, 'data_vigencia'].dt.to_period('M').dt.to_timestamp())
+    inativo = set(inativos.loc[inativos['id_corretor'] == id_corretor, 'data'].dt.to_period('M').dt.to_timestamp())
+    esperado = [1 if mes in vendeu else -1 if mes in inativo else 0 for mes in meses]
+    assert list(status.index) == list(meses)
+    assert status.tolist() == esperado
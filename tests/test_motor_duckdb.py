@@ -0,0 +1,71 @@
+"""O motor DuckDB dá os mesmos números por tipo de corretor que o motor pandas sobre os dados alinhados."""
+import types
+import uuid
+
+import pandas as pd
+import pytest
+
+import utils
+
+pytest.importorskip('duckdb')
+
+VENDAS = """data_vigencia,supervisor,corretor,tipo_de_corretor,operadora,plano,valor_proposta
+2024-08-01,SUP A,MARIA APARECIDA FERREIRA,ESCRITÓRIO 1,OP X,PLANO 1,100.00
+2024-08-02,SUP A,JOAO CARLOS LIMA,ESCRITÓRIO 1,OP X,PLANO 1,250.50
+2024-08-03,SUP B,CORRETORA VIDA LTDA,REPASSE,OP Y,PLANO 2,80.00
+2024-09-01,SUP B,Corretora Vida,REPASSE,OP Y,PLANO 2,120.00
+2024-09-10,SUP A,MARIA APARECIDA FERREIRA,ESCRITÓRIO 1,OP X,PLANO 2,300.00
+"""
+INATIVOS = """data,corretor,tipo_de_corretor
+2024-10-01,Maria Aparecida Fereira,ESCRITÓRIO 2
+2024-10-01,ANA PAULA SOUZA,REPASSE
+2024-10-02,PEDRO HENRIQUE ALVES,ESCRITÓRIO 2
+2024-10-03,Pedro Henrique Alves,ESCRITÓRIO 1
+"""
+
+
+@pytest.fixture
+def fontes(tmp_path, monkeypatch):
+    (tmp_path / 'vendas.csv').write_text(VENDAS, encoding='utf-8')
+    (tmp_path / 'inativos.csv').write_text(INATIVOS, encoding='utf-8')
+    vendas = utils._parse_vendas(tmp_path / 'vendas.csv')
+    inativos = utils._parse_inativos(tmp_path / 'inativos.csv')
+    # Como o cache Parquet: cada arquivo com a própria resolução, antes do alinhamento
+    vendas.to_parquet(tmp_path / 'vendas.parquet')
+    inativos.to_parquet(tmp_path / 'inativos.parquet')
+    # Versão única: a matriz de atividade fica em cache por versão dos dados
+    monkeypatch.setattr(utils, 'versao_dados', lambda: uuid.uuid4().hex)
+    return tmp_path, vendas, inativos
+
+
+def _pandas(vendas, inativos):
+    utils.alinhar_corretores({'vendas': vendas, 'inativos': inativos})
+    dados = types.SimpleNamespace(vendas=vendas, pagamentos=None, inativos=inativos, contas_pagar=None)
+    return utils.MotorPandas(dados).desempenho_por_tipo()
+
+
+def _comparar(duckdb, pandas):
+    duckdb = duckdb.set_index('tipo_de_corretor').sort_index()
+    pandas = pandas.set_index('tipo_de_corretor').sort_index()
+    colunas = ['total_vendas', 'ticket_medio', 'num_corretores', 'vendas_por_corretor']
+    pd.testing.assert_frame_equal(duckdb[colunas], pandas[colunas], check_dtype=False, check_index_type=False)
+
+
+def test_desempenho_por_tipo_igual_ao_pandas_com_inativos_alinhados(fontes):
+    pasta, vendas, inativos = fontes
+    motor = utils.MotorDuckDB({'vendas': str(pasta / 'vendas.parquet'), 'inativos': str(pasta / 'inativos.parquet')})
+
+    resultado = motor.desempenho_por_tipo()
+    _comparar(resultado, _pandas(vendas, inativos))
+    # A inativa com erro de digitação é a corretora das vendas (que conta no ESCRITÓRIO 1)
+    assert resultado.set_index('tipo_de_corretor').loc['ESCRITÓRIO 1', 'num_corretores'] == 2
+    assert resultado.set_index('tipo_de_corretor').loc['REPASSE', 'num_corretores'] == 2
+
+
+def test_desempenho_por_tipo_sem_arquivo_de_inativos(fontes):
+    pasta, vendas, _ = fontes
+    motor = utils.MotorDuckDB({'vendas': str(pasta / 'vendas.parquet'), 'inativos': None})
+    vazio = pd.DataFrame({'data': pd.Series(dtype='datetime64[ns]'), 'corretor': pd.Series(dtype=object),
+                          'tipo_de_corretor': pd.Series(dtype=object), 'id_corretor': pd.Series(dtype='Int64')})
+
+    _comparar(motor.desempenho_por_tipo(), _pandas(vendas, vazio))
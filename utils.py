@@ -1,76 +1,2877 @@
+import contextlib
+import functools
+import gzip
+import hashlib
+import importlib.util
+import io
+import json
+import logging
+import logging.handlers
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unicodedata
+import uuid
+from collections import OrderedDict
+import numpy as np
 import pandas as pd
 import streamlit as st
-from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import KMeans
 
-@st.cache_data
-def load_data():
-    """Carrega e limpa os dados dos arquivos CSV da pasta 'data/'."""
-    try:
-        df_vendas = pd.read_csv('data/vendas.csv', parse_dates=['data_vigencia'])
-        df_pagamentos = pd.read_csv('data/comissao.csv', parse_dates=['data_baixa'])
-        df_inativos = pd.read_csv('data/corretores_inativos.csv', parse_dates=['data'])
-        
-        # --- CARREGANDO E TRATANDO O NOVO ARQUIVO FINANCEIRO ---
-        # Lendo o arquivo com separador ; e pulando as primeiras linhas vazias
-        df_contas_pagar = pd.read_csv('data/contas_a_pagar_set24_set25.csv', delimiter=';', skiprows=1)
-        
-        # Limpando nomes das colunas
-        df_contas_pagar.columns = df_contas_pagar.columns.str.strip()
-
-        # Convertendo colunas de data (formato dd/mm/aaaa)
-        date_cols = ['Data de competência', 'Data de vencimento', 'Data prevista', 'Data do último pagamento']
-        for col in date_cols:
-            df_contas_pagar[col] = pd.to_datetime(df_contas_pagar[col], format='%d/%m/%Y', errors='coerce')
-
-        # Convertendo colunas de valores (formato 1.234,56)
-        value_cols = ['Valor original da parcela (R$)', 'Valor pago da parcela (R$)', 
-                      'Juros realizado (R$)', 'Valor total pago da parcela (R$)', 'Valor na Categoria 1']
-        for col in value_cols:
-            df_contas_pagar[col] = df_contas_pagar[col].astype(str).str.replace('.', '', regex=False).str.replace(',', '.', regex=False)
-            df_contas_pagar[col] = pd.to_numeric(df_contas_pagar[col], errors='coerce').fillna(0)
+# --- Instrumentação ---
+# Etapas cronometradas (carga, filtro, agregações, segmentação, montagem e envio
+# dos gráficos) e acertos/falhas dos caches, coletados por execução da página.
+# render_sidebar abre a medição de cada rerun; o painel opcional na barra lateral
+# mostra a do rerun anterior. Com DASHBOARD_LOG_DESEMPENHO apontando para um
+# arquivo (ex.: logs/desempenho.jsonl), cada etapa também vai para um log JSONL
+# rotativo, para calcular p50/p95 por página. Sem a variável, nada é gravado.
+ARQUIVO_LOG_DESEMPENHO = os.environ.get('DASHBOARD_LOG_DESEMPENHO', '')
+TAMANHO_LOG_DESEMPENHO = 5 * 1024 * 1024
+ARQUIVOS_LOG_DESEMPENHO = 5
+_contexto_medicao = threading.local()
 
-    except FileNotFoundError as e:
-        st.error(f"Erro ao carregar dados: O arquivo '{e.filename}' não foi encontrado.")
-        return None, None, None, None
-    
-    # Limpando os outros dataframes
-    for df in [df_pagamentos, df_vendas, df_inativos]:
+class MedicaoRerun:
+    """Etapas cronometradas e acertos/falhas de cache de uma execução da página."""
+
+    def __init__(self, pagina, sessao):
+        self.pagina = pagina
+        self.sessao = sessao
+        self.rerun = uuid.uuid4().hex[:12]
+        self.inicio = time.perf_counter()
+        self.fim = self.inicio
+        self.etapas = {}
+        self.caches = {}
+
+    def registrar_etapa(self, nome, segundos):
+        ms, chamadas = self.etapas.get(nome, (0.0, 0))
+        self.etapas[nome] = (ms + segundos * 1000, chamadas + 1)
+        self.fim = max(self.fim, time.perf_counter())
+
+    def registrar_cache(self, nome, acerto):
+        acertos, falhas = self.caches.get(nome, (0, 0))
+        self.caches[nome] = (acertos + 1, falhas) if acerto else (acertos, falhas + 1)
+
+    def falhas(self, nome):
+        return self.caches.get(nome, (0, 0))[1]
+
+    @property
+    def total_ms(self):
+        return (self.fim - self.inicio) * 1000
+
+def _medicao_atual():
+    """Medição do rerun em andamento nesta thread (None fora de uma página)."""
+    return getattr(_contexto_medicao, 'medicao', None)
+
+@functools.lru_cache(maxsize=None)
+def _log_desempenho():
+    """Logger do arquivo JSONL rotativo de desempenho (None se desligado ou sem permissão de escrita)."""
+    if not ARQUIVO_LOG_DESEMPENHO:
+        return None
+    try:
+        os.makedirs(os.path.dirname(ARQUIVO_LOG_DESEMPENHO) or '.', exist_ok=True)
+        handler = logging.handlers.RotatingFileHandler(ARQUIVO_LOG_DESEMPENHO, maxBytes=TAMANHO_LOG_DESEMPENHO,
+                                                       backupCount=ARQUIVOS_LOG_DESEMPENHO, encoding='utf-8')
+    except OSError:
+        return None
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger = logging.getLogger('dashboard.desempenho')
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    logger.addHandler(handler)
+    return logger
+
+def _registrar_log(medicao, **campos):
+    logger = _log_desempenho()
+    if logger is not None:
+        logger.info(json.dumps({'ts': time.strftime('%Y-%m-%dT%H:%M:%S'), 'sessao': medicao.sessao, 'rerun': medicao.rerun,
+                                'pagina': medicao.pagina, **campos}, ensure_ascii=False))
+
+@contextlib.contextmanager
+def medir(etapa):
+    """Cronometra um trecho como etapa do rerun atual (sem efeito fora de uma página)."""
+    medicao = _medicao_atual()
+    if medicao is None:
+        yield
+        return
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        segundos = time.perf_counter() - inicio
+        medicao.registrar_etapa(etapa, segundos)
+        _registrar_log(medicao, etapa=etapa, ms=round(segundos * 1000, 2))
+
+def registrar_cache(nome, acerto):
+    """Conta um acerto ou falha de cache no rerun atual."""
+    medicao = _medicao_atual()
+    if medicao is not None:
+        medicao.registrar_cache(nome, acerto)
+
+def cache_contado(decorador, **opcoes):
+    """Como st.cache_data/st.cache_resource (`decorador`), contando acertos e falhas no rerun atual."""
+    def decorar(funcao):
+        nome = funcao.__name__
+
+        # Só roda quando o cache do Streamlit não tem o resultado
+        @functools.wraps(funcao)
+        def calcular(*args, **kwargs):
+            registrar_cache(nome, acerto=False)
+            with medir(f"calculo:{nome}"):
+                return funcao(*args, **kwargs)
+
+        em_cache = decorador(**opcoes)(calcular)
+
+        @functools.wraps(funcao)
+        def chamar(*args, **kwargs):
+            instantaneo = getattr(_contexto_execucao, 'instantaneo', None)
+            if instantaneo is not None:
+                # A próxima versão dos dados aquece o que foi pedido nesta
+                instantaneo.pedidos.add(nome)
+            medicao = _medicao_atual()
+            falhas = medicao.falhas(nome) if medicao is not None else 0
+            resultado = em_cache(*args, **kwargs)
+            if medicao is not None and medicao.falhas(nome) == falhas:
+                medicao.registrar_cache(nome, acerto=True)
+            return resultado
+
+        chamar.clear = em_cache.clear
+        return chamar
+    return decorar
+
+def iniciar_medicao(pagina):
+    """Abre a medição deste rerun e devolve a do rerun anterior da sessão (ou None)."""
+    sessao = st.session_state.setdefault('_sessao_desempenho', uuid.uuid4().hex[:8])
+    anterior = st.session_state.get('_medicao_desempenho')
+    if anterior is not None:
+        _registrar_log(anterior, etapa='rerun', ms=round(anterior.total_ms, 2))
+    atual = MedicaoRerun(pagina, sessao)
+    st.session_state['_medicao_desempenho'] = atual
+    _contexto_medicao.medicao = atual
+    return anterior
+
+def _memoria_sessao():
+    """Bytes ocupados pelos objetos guardados no session_state desta sessão."""
+    total = 0
+    for valor in st.session_state.values():
+        if isinstance(valor, pd.DataFrame):
+            total += int(valor.memory_usage(deep=True).sum())
+        elif isinstance(valor, MedicaoRerun):
+            total += sys.getsizeof(valor.etapas) + sys.getsizeof(valor.caches)
+        else:
+            total += sys.getsizeof(valor)
+    return total
+
+def _memoria_processo():
+    """Memória residente do processo do servidor, em bytes (None se indisponível)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def painel_desempenho(medicao):
+    """Painel da barra lateral com as etapas, os caches e a memória do último rerun."""
+    with st.sidebar.expander("⏱️ Desempenho do último rerun", expanded=True):
+        if medicao is None:
+            st.caption("Interaja com a página para ver a medição do rerun anterior.")
+            return
+        st.markdown(f"**{medicao.pagina}** — {medicao.total_ms:,.0f} ms no total".replace(',', '.'))
+        if medicao.etapas:
+            etapas = pd.DataFrame([(nome, ms, chamadas) for nome, (ms, chamadas) in medicao.etapas.items()],
+                                  columns=['etapa', 'ms', 'chamadas']).sort_values('ms', ascending=False)
+            st.dataframe(etapas.round({'ms': 1}), hide_index=True, width='stretch')
+        if medicao.caches:
+            caches = pd.DataFrame([(nome, acertos, falhas) for nome, (acertos, falhas) in medicao.caches.items()],
+                                  columns=['cache', 'acertos', 'falhas'])
+            st.dataframe(caches, hide_index=True, width='stretch')
+        memoria = f"Sessão: {_memoria_sessao() / 2**20:.2f} MB"
+        processo = _memoria_processo()
+        if processo is not None:
+            memoria += f" · Processo do servidor: {processo / 2**20:.0f} MB"
+        st.caption(memoria)
+
+# --- Avisos da carga dos dados ---
+# Os leitores avisam com avisar() em vez de chamar st.warning/st.error direto.
+# Numa leitura fora do rerun de uma sessão (thread de atualização, instantâneo
+# compartilhado), os avisos são guardados com os dados e cada sessão os mostra
+# quando usa o conjunto; sem isso, só a primeira sessão (ou nenhuma) os veria.
+_contexto_avisos = threading.local()
+
+def avisar(tipo, mensagem):
+    """Mostra um aviso (`tipo` 'warning' ou 'error') ou o guarda, dentro de coletar_avisos()."""
+    coletados = getattr(_contexto_avisos, 'avisos', None)
+    if coletados is not None:
+        coletados.append((tipo, mensagem))
+    else:
+        getattr(st, tipo)(mensagem)
+
+@contextlib.contextmanager
+def coletar_avisos():
+    """Guarda na lista devolvida os avisos emitidos no bloco, sem mostrá-los."""
+    anterior = getattr(_contexto_avisos, 'avisos', None)
+    coletados = _contexto_avisos.avisos = []
+    try:
+        yield coletados
+    finally:
+        _contexto_avisos.avisos = anterior
+
+def mostrar_avisos(avisos):
+    """Mostra na sessão atual os avisos guardados por coletar_avisos()."""
+    for tipo, mensagem in avisos:
+        getattr(st, tipo)(mensagem)
+
+# --- Cache colunar em disco ---
+# Os CSVs já limpos são gravados em Parquet. O cache é invalidado quando muda o
+# arquivo de origem (tamanho, data de modificação e hash do conteúdo) ou quando
+# muda a versão do esquema abaixo, que deve ser incrementada sempre que a
+# limpeza dos dados for alterada.
+PASTA_CACHE = os.environ.get('DASHBOARD_CACHE_DIR', os.path.join('data', '.cache'))
+VERSAO_ESQUEMA_CACHE = 3
+
+def _hash_arquivo(caminho, tamanho_bloco=1 << 20):
+    """Calcula o hash SHA-256 do conteúdo de um arquivo, lendo em blocos."""
+    h = hashlib.sha256()
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(tamanho_bloco), b''):
+            h.update(bloco)
+    return h.hexdigest()
+
+def _gravar_atomico(caminho, escrever):
+    """Grava um arquivo via arquivo temporário + rename, para nunca deixar cache pela metade."""
+    # Nome temporário único por escrita: a thread de atualização e as sessões podem gravar o mesmo arquivo ao mesmo tempo
+    descritor, temporario = tempfile.mkstemp(prefix=f"{os.path.basename(caminho)}.", suffix='.tmp', dir=os.path.dirname(caminho) or '.')
+    os.close(descritor)
+    try:
+        escrever(temporario)
+        os.replace(temporario, caminho)
+    finally:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+
+def _arquivos_cache(caminho):
+    """Caminhos do Parquet e do manifesto que guardam o cache de um arquivo de origem."""
+    nome = os.path.basename(caminho)
+    return os.path.join(PASTA_CACHE, f"{nome}.parquet"), os.path.join(PASTA_CACHE, f"{nome}.json")
+
+def _validar_cache(caminho, stat):
+    """Manifesto do cache, se ainda corresponde ao arquivo de origem (ou None), e o hash calculado no caminho."""
+    _, caminho_manifesto = _arquivos_cache(caminho)
+    manifesto = None
+    try:
+        with open(caminho_manifesto, encoding='utf-8') as f:
+            manifesto = json.load(f)
+    except (OSError, ValueError):
+        pass
+
+    sha256 = None
+    if manifesto and manifesto.get('versao_esquema') == VERSAO_ESQUEMA_CACHE and manifesto.get('tamanho') == stat.st_size:
+        # Mesma data de modificação: confia no cache sem reler o arquivo.
+        # Data diferente (ex.: novo deploy): só reaproveita se o conteúdo for o mesmo.
+        if manifesto.get('mtime_ns') == stat.st_mtime_ns:
+            return manifesto, None
+        sha256 = _hash_arquivo(caminho)
+        if manifesto.get('sha256') == sha256:
+            return manifesto, sha256
+    return None, sha256
+
+def _carregar_com_cache(caminho, parser):
+    """Lê o DataFrame limpo do cache Parquet ou, se estiver desatualizado, executa o parser e regrava o cache."""
+    stat = os.stat(caminho)
+    caminho_parquet, caminho_manifesto = _arquivos_cache(caminho)
+
+    manifesto, sha256 = _validar_cache(caminho, stat)
+    if manifesto:
+        try:
+            df = pd.read_parquet(caminho_parquet)
+        except Exception:
+            df = None
         if df is not None:
-            df.columns = df.columns.str.strip()
-            for col in df.select_dtypes(['object']).columns:
-                df[col] = df[col].str.strip()
-            
-    return df_vendas, df_pagamentos, df_inativos, df_contas_pagar
-
-@st.cache_data
-def segmenta_corretores(df):
-    """Executa a clusterização de corretores usando K-Means."""
+            if manifesto.get('mtime_ns') != stat.st_mtime_ns:
+                manifesto['mtime_ns'] = stat.st_mtime_ns
+                _salvar_manifesto(caminho_manifesto, manifesto)
+            return df
+
+    df = parser(caminho)
+    try:
+        os.makedirs(PASTA_CACHE, exist_ok=True)
+        _gravar_atomico(caminho_parquet, lambda destino: df.to_parquet(destino, index=False))
+        _salvar_manifesto(caminho_manifesto, {
+            'versao_esquema': VERSAO_ESQUEMA_CACHE,
+            'tamanho': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'sha256': sha256 or _hash_arquivo(caminho),
+        })
+    except (OSError, ImportError, ValueError):
+        # O cache é só uma otimização: sem permissão de escrita ou sem pyarrow, seguimos com o CSV.
+        pass
+    return df
+
+def _salvar_manifesto(caminho, manifesto):
+    """Grava o manifesto JSON que descreve a origem de um arquivo de cache."""
+    def escrever(destino):
+        with open(destino, 'w', encoding='utf-8') as f:
+            json.dump(manifesto, f)
+    try:
+        _gravar_atomico(caminho, escrever)
+    except OSError:
+        pass
+
+def _garantir_parquet(caminho, parser):
+    """Caminho do Parquet atualizado de um arquivo de origem; só executa o parser se o cache estiver desatualizado."""
+    stat = os.stat(caminho)
+    caminho_parquet, caminho_manifesto = _arquivos_cache(caminho)
+    manifesto, _ = _validar_cache(caminho, stat)
+    if manifesto and os.path.exists(caminho_parquet):
+        if manifesto.get('mtime_ns') != stat.st_mtime_ns:
+            manifesto['mtime_ns'] = stat.st_mtime_ns
+            _salvar_manifesto(caminho_manifesto, manifesto)
+        return caminho_parquet
+    _carregar_com_cache(caminho, parser)
+    manifesto, _ = _validar_cache(caminho, stat)
+    if not manifesto or not os.path.exists(caminho_parquet):
+        raise OSError(f"não foi possível gravar o cache Parquet de '{caminho}'")
+    return caminho_parquet
+
+# --- Modo compacto ---
+# As dimensões de texto viram colunas categóricas (códigos inteiros + dicionário).
+# Vendas, comissões e inativos compartilham o mesmo dicionário por dimensão, então
+# filtros, merges e group-bys entre eles comparam códigos em vez de strings.
+MODO_COMPACTO = os.environ.get('DASHBOARD_MODO_COMPACTO', '1') != '0'
+DIMENSOES_CORRETORES = ['supervisor', 'corretor', 'tipo_de_corretor', 'operadora', 'plano']
+DIMENSOES_FINANCEIRO = ['Categoria 1', 'Centro de Custo 1', 'Nome do fornecedor']
+
+def compactar_dimensoes(dfs, colunas):
+    """Converte as colunas indicadas em categóricas, com um único dicionário por dimensão para todos os DataFrames."""
+    for col in colunas:
+        presentes = [df for df in dfs if df is not None and col in df.columns]
+        if not presentes:
+            continue
+        valores = set()
+        for df in presentes:
+            valores.update(df[col].dropna().unique())
+        tipo = pd.CategoricalDtype(sorted(valores))
+        for df in presentes:
+            df[col] = df[col].astype(tipo)
+    return dfs
+
+def contar_valores(serie):
+    """Equivale a value_counts(), mas ignora categorias sem ocorrência nas colunas do modo compacto."""
+    contagem = serie.value_counts()
+    return contagem[contagem > 0]
+
+# --- Resolução de entidades ---
+# Vendas, comissões e inativos identificam o corretor só pelo nome digitado em cada
+# sistema, e o contas a pagar faz o mesmo com o fornecedor. Variações de grafia
+# (acentos, caixa, pontuação, sufixos como LTDA/LTD/ME) partiam uma entidade em
+# várias. Cada nome é reduzido a uma chave normalizada e cada chave é uma entidade,
+# com o nome canônico (a grafia mais frequente) e um id inteiro estável: o
+# broker_id do banco quando disponível, senão um hash da chave. Os conjuntos de
+# corretores se relacionam pelo id_corretor.
+# Comissões e inativos ainda são levados às entidades das vendas. O nome que não
+# tem a mesma chave lá é comparado por semelhança só dentro do bloco (mesma
+# primeira palavra, mesmos dígitos e mesmo número de palavras), aceitando uma
+# única letra trocada, sobrando ou faltando numa só palavra. Nomes parecidos
+# dentro de uma mesma fonte (PEREIRA/FERREIRA, SOUZA/SOUSA) costumam ser pessoas
+# diferentes e não são juntados.
+SUFIXOS_EMPRESA = ('LTDA', 'LTD', 'LITDA', 'ME', 'EPP', 'EIRELI')
+MINIMO_LETRAS_SEMELHANCA = 5
+
+@functools.lru_cache(maxsize=1 << 16)
+def normalizar_nome(nome):
+    """Chave de comparação de um nome: sem acentos, caixa, pontuação e sufixos societários."""
+    texto = unicodedata.normalize('NFKD', str(nome)).encode('ascii', 'ignore').decode('ascii').upper()
+    palavras = re.sub(r'[^A-Z0-9]+', ' ', texto).split()
+    # "S/A" e "S.A." viram as palavras "S A" (o sobrenome Sá fica como está)
+    if len(palavras) > 2 and palavras[-2:] == ['S', 'A']:
+        del palavras[-2:]
+    while len(palavras) > 1 and palavras[-1] in SUFIXOS_EMPRESA:
+        palavras.pop()
+    return ' '.join(palavras)
+
+def _id_entidade(chave):
+    """Id inteiro estável (o mesmo em qualquer processo e carga) de uma chave normalizada."""
+    return int.from_bytes(hashlib.blake2b(chave.encode(), digest_size=8).digest(), 'big') >> 1
+
+def _bloco(chave):
+    """Bloco de comparação: primeira palavra, dígitos e número de palavras ("FILIAL 01" nunca junta com "FILIAL 02")."""
+    palavras = chave.split()
+    return (palavras[0] if palavras else ''), ''.join(filter(str.isdigit, chave)), len(palavras)
+
+def _uma_edicao(a, b):
+    """Se as palavras diferem por uma única letra trocada, sobrando ou faltando."""
+    if abs(len(a) - len(b)) > 1:
+        return False
+    i = next((k for k, (x, y) in enumerate(zip(a, b)) if x != y), min(len(a), len(b)))
+    return a[i + 1:] == b[i + 1:] or a[i:] == b[i + 1:] or a[i + 1:] == b[i:]
+
+def _semelhantes(chave, candidata):
+    diferentes = [(a, b) for a, b in zip(chave.split(), candidata.split()) if a != b]
+    return (len(diferentes) == 1 and min(map(len, diferentes[0])) >= MINIMO_LETRAS_SEMELHANCA
+            and _uma_edicao(*diferentes[0]))
+
+def _procurar_semelhante(chave, blocos):
+    """A chave do bloco de `chave` que difere dela por um erro de digitação, se for a única (ou None)."""
+    candidatas = [candidata for candidata in blocos.get(_bloco(chave), ()) if _semelhantes(chave, candidata)]
+    return candidatas[0] if len(candidatas) == 1 else None
+
+def _grafia_mais_frequente(pares, n_grupos):
+    """Nome canônico de cada grupo (a grafia mais frequente; no empate, a primeira em ordem alfabética)."""
+    escolhidos = pares.sort_values(['n', 'nome'], ascending=[False, True]).drop_duplicates('grupo')
+    nomes = np.full(n_grupos, None, dtype=object)
+    nomes[escolhidos['grupo'].to_numpy()] = escolhidos['nome'].to_numpy()
+    return nomes
+
+def resolver_entidades(nomes, ids=None):
+    """Nome canônico e id inteiro de cada linha de uma coluna de nomes.
+
+    Com `ids` (ex.: broker_id do banco), cada id é uma entidade e o nome canônico é a
+    sua grafia mais frequente. Sem eles, os nomes são agrupados pela chave normalizada.
+    Devolve (nomes, ids) alinhados à coluna de entrada, com os nomes no mesmo tipo dela
+    (texto ou categórica).
+    """
+    if isinstance(nomes.dtype, pd.CategoricalDtype):
+        codigos, unicos = nomes.cat.codes.to_numpy(), np.asarray(nomes.cat.categories, dtype=object)
+    else:
+        codigos, unicos = pd.factorize(nomes)
+        unicos = np.asarray(unicos, dtype=object)
+    if ids is None:
+        ocorrencias = np.bincount(codigos[codigos >= 0], minlength=len(unicos))
+        grupo_do_nome, grupos_chave = pd.factorize(pd.Series([normalizar_nome(nome) for nome in unicos], dtype=object))
+        grupo_da_linha = np.append(grupo_do_nome, -1)[codigos]
+        pares = pd.DataFrame({'grupo': grupo_do_nome, 'nome': unicos, 'n': ocorrencias})
+        canonicos = _grafia_mais_frequente(pares, len(grupos_chave))
+        ids_grupo = np.array([_id_entidade(chave) for chave in grupos_chave], dtype='int64')
+    else:
+        grupo_da_linha, ids_grupo = pd.factorize(pd.Series(ids, index=nomes.index).astype('Int64'))
+        ids_grupo = np.asarray(ids_grupo, dtype='int64')
+        validas = (grupo_da_linha >= 0) & (codigos >= 0)
+        pares = (pd.DataFrame({'grupo': grupo_da_linha[validas], 'codigo': codigos[validas]})
+                 .value_counts().rename('n').reset_index())
+        pares['nome'] = unicos[pares['codigo'].to_numpy()]
+        canonicos = _grafia_mais_frequente(pares, len(ids_grupo))
+    categorias = pd.Index(pd.unique(canonicos[pd.notna(canonicos)])).sort_values()
+    codigo_nome = np.append(categorias.get_indexer(canonicos), -1)
+    resolvidos = pd.Series(pd.Categorical.from_codes(codigo_nome[grupo_da_linha], categorias), index=nomes.index)
+    if not isinstance(nomes.dtype, pd.CategoricalDtype):
+        resolvidos = resolvidos.astype(object)
+    ids_linha = pd.arrays.IntegerArray(np.append(ids_grupo, 0)[grupo_da_linha], grupo_da_linha < 0)
+    return resolvidos, pd.Series(ids_linha, index=nomes.index)
+
+def chavear_entidades(df, coluna_nome, coluna_id, coluna_origem=None):
+    """Troca os nomes da coluna pelo nome canônico e acrescenta o id inteiro da entidade.
+
+    Com `coluna_origem` (o id do sistema de origem), ela vira a `coluna_id`.
+    """
+    ids = df.pop(coluna_origem) if coluna_origem in df.columns else None
+    df[coluna_nome], df[coluna_id] = resolver_entidades(df[coluna_nome], ids)
+    return df
+
+def alinhar_entidades(referencia, outros, coluna_nome='corretor', coluna_id='id_corretor'):
+    """Leva os `outros` conjuntos para os ids e nomes canônicos da `referencia`.
+
+    As entidades com id da referência ficam com o nome dela. As demais são procuradas
+    pela chave normalizada e, sem ela, por um erro de digitação dentro do bloco; as que
+    não têm correspondente mantêm o próprio id e nome.
+    """
+    primeiras = referencia[coluna_id].dropna().drop_duplicates()
+    nomes_referencia = dict(zip(primeiras, referencia.loc[primeiras.index, coluna_nome].astype(object)))
+    por_chave, blocos = {}, {}
+    for df in outros:
+        if df is None or df.empty:
+            continue
+        primeiras = df[coluna_id].dropna().drop_duplicates()
+        trocas = {}
+        for id_entidade, nome in zip(primeiras, df.loc[primeiras.index, coluna_nome].astype(object)):
+            if id_entidade in nomes_referencia:
+                alvo = (id_entidade, nomes_referencia[id_entidade])
+            else:
+                if not por_chave:
+                    # Chaves da referência, montadas só quando aparece uma entidade fora dela
+                    for id_referencia, nome_referencia in nomes_referencia.items():
+                        chave = normalizar_nome(nome_referencia)
+                        if chave not in por_chave:
+                            por_chave[chave] = (id_referencia, nome_referencia)
+                            blocos.setdefault(_bloco(chave), []).append(chave)
+                chave = normalizar_nome(nome)
+                if chave not in por_chave:
+                    chave = _procurar_semelhante(chave, blocos)
+                alvo = por_chave.get(chave)
+            if alvo is not None and alvo != (id_entidade, nome):
+                trocas[id_entidade] = alvo
+        if not trocas:
+            continue
+        linhas = df[coluna_id].isin(list(trocas))
+        atuais = df.loc[linhas, coluna_id]
+        nomes_novos = atuais.map({i: nome for i, (_, nome) in trocas.items()})
+        if isinstance(df[coluna_nome].dtype, pd.CategoricalDtype):
+            faltantes = sorted(set(nomes_novos) - set(df[coluna_nome].cat.categories))
+            df[coluna_nome] = df[coluna_nome].cat.add_categories(faltantes)
+        df.loc[linhas, coluna_nome] = nomes_novos
+        df.loc[linhas, coluna_id] = atuais.map({i: novo for i, (novo, _) in trocas.items()}).astype('Int64')
+    return outros
+
+def _limpar_texto(df):
+    """Remove espaços extras dos nomes das colunas e dos valores de texto."""
+    df.columns = df.columns.str.strip()
+    for col in df.select_dtypes(['object']).columns:
+        df[col] = df[col].str.strip()
+    return df
+
+def _parse_vendas(caminho):
+    return chavear_entidades(_limpar_texto(pd.read_csv(caminho, parse_dates=['data_vigencia'])), 'corretor', 'id_corretor')
+
+def _parse_pagamentos(caminho):
+    return chavear_entidades(_limpar_texto(pd.read_csv(caminho, parse_dates=['data_baixa'])), 'corretor', 'id_corretor')
+
+def _parse_inativos(caminho):
+    return chavear_entidades(_limpar_texto(pd.read_csv(caminho, parse_dates=['data'])), 'corretor', 'id_corretor')
+
+# Colunas do contas a pagar no formato brasileiro (dd/mm/aaaa e 1.234,56)
+COLUNAS_DATA_CONTAS = ['Data de competência', 'Data de vencimento', 'Data prevista', 'Data do último pagamento']
+COLUNAS_VALOR_CONTAS = ['Valor original da parcela (R$)', 'Valor pago da parcela (R$)',
+                        'Juros realizado (R$)', 'Valor total pago da parcela (R$)', 'Valor na Categoria 1']
+
+def _converter_valor_ptbr(serie):
+    """Converte texto no formato 1.234,56 para float (NaN onde não for possível)."""
+    texto = serie.astype(str).str.replace('.', '', regex=False).str.replace(',', '.', regex=False)
+    return pd.to_numeric(texto, errors='coerce')
+
+def _parse_contas_pagar(caminho):
+    """Lê o contas a pagar já convertendo datas e valores pt-BR, contando as células que não puderam ser convertidas."""
+    # Separador ;, pulando a primeira linha vazia. Os valores 1.234,56 são
+    # convertidos pelo próprio leitor de CSV (decimal e milhar), sem cópias de texto.
+    df_contas_pagar = pd.read_csv(caminho, delimiter=';', skiprows=1, decimal=',', thousands='.')
+
+    # Limpando nomes das colunas e unificando as grafias de cada fornecedor
+    df_contas_pagar.columns = df_contas_pagar.columns.str.strip()
+    df_contas_pagar['Nome do fornecedor'] = df_contas_pagar['Nome do fornecedor'].str.strip()
+    chavear_entidades(df_contas_pagar, 'Nome do fornecedor', 'id_fornecedor')
+
+    celulas_invalidas = {}
+    for col in COLUNAS_DATA_CONTAS:
+        bruto = df_contas_pagar[col]
+        df_contas_pagar[col] = pd.to_datetime(bruto, format='%d/%m/%Y', errors='coerce')
+        celulas_invalidas[col] = int((df_contas_pagar[col].isna() & bruto.notna()).sum())
+
+    for col in COLUNAS_VALOR_CONTAS:
+        bruto = df_contas_pagar[col]
+        if pd.api.types.is_numeric_dtype(bruto):
+            valores = bruto
+        else:
+            # Alguma célula fora do formato: só esta coluna passa pela conversão de texto
+            valores = _converter_valor_ptbr(bruto)
+        celulas_invalidas[col] = int((valores.isna() & bruto.notna()).sum())
+        df_contas_pagar[col] = valores.fillna(0).astype('float64')
+
+    df_contas_pagar.attrs['celulas_invalidas'] = celulas_invalidas
+    return df_contas_pagar
+
+def _ler_contas_pagar(caminho='data/contas_a_pagar_set24_set25.csv'):
+    """Contas a pagar limpo (via cache Parquet), avisando quando há células que não puderam ser convertidas."""
+    df = _carregar_com_cache(caminho, _parse_contas_pagar)
+    # Os contadores vão no attrs (e no Parquet) só até aqui: attrs é copiado a cada operação do pandas
+    celulas_invalidas = df.attrs.pop('celulas_invalidas', {})
+    colunas = [f"{col} ({n})" for col, n in celulas_invalidas.items() if n]
+    if colunas:
+        avisar('warning', f"Contas a pagar: células que não puderam ser convertidas e ficaram vazias/zeradas: {', '.join(colunas)}.")
+    return df
+
+# --- Fonte PostgreSQL ---
+# Com DASHBOARD_FONTE=postgres, vendas e comissões são lidas direto do banco
+# (consultas de consultas_postgresql.txt, sem o filtro fixo de datas) em vez dos
+# CSVs exportados. A conexão vem de um pool configurado na seção [postgres] do
+# secrets.toml e o resultado é lido em blocos por um cursor do lado do servidor,
+# já convertido para colunas tipadas. Se o banco estiver indisponível, os CSVs
+# continuam sendo usados. Requer o pacote psycopg2 (ex.: psycopg2-binary).
+FONTE_DADOS = os.environ.get('DASHBOARD_FONTE', 'csv')
+TAMANHO_BLOCO_BANCO = 50_000
+
+CONSULTA_VENDAS = """
+SELECT
+    p.effective_date AS data_vigencia,
+    s.name AS supervisor,
+    b.id AS broker_id,
+    b.name AS corretor,
+    bt.description AS tipo_de_corretor,
+    o.name AS operadora,
+    pl.description AS plano,
+    p.proposal_value AS valor_proposta
+FROM proposals p
+JOIN brokers b ON p.broker_id = b.id
+JOIN broker_types bt ON b.broker_type_id = bt.id
+JOIN supervisors s ON p.supervisor_id = s.id
+JOIN plans pl ON p.plan_id = pl.id
+JOIN operators o ON pl.operator_id = o.id
+{filtro}
+ORDER BY p.effective_date
+"""
+
+CONSULTA_COMISSOES = """
+SELECT
+    r.discharge_date AS data_baixa,
+    b.id AS broker_id,
+    b.name AS corretor,
+    bt.description AS tipo_de_corretor,
+    r.amount_to_pay
+FROM receipts r
+JOIN brokers b ON r.broker_id = b.id
+JOIN broker_types bt ON b.broker_type_id = bt.id
+{filtro}
+ORDER BY r.discharge_date
+"""
+
+@st.cache_resource(show_spinner=False)
+def _pool_postgres():
+    """Pool de conexões compartilhado por todas as sessões do servidor."""
+    from psycopg2 import pool
+    config = dict(st.secrets["postgres"])
+    max_conexoes = config.pop('max_conexoes', 4)
+    return pool.ThreadedConnectionPool(1, max_conexoes, **config)
+
+@contextlib.contextmanager
+def conexao_postgres():
+    """Empresta uma conexão do pool e a devolve ao final, mesmo em caso de erro."""
+    pool = _pool_postgres()
+    conexao = pool.getconn()
+    try:
+        yield conexao
+    finally:
+        conexao.rollback()
+        pool.putconn(conexao)
+
+def _tipar_bloco(linhas, colunas, colunas_data, colunas_valor):
+    """Converte um bloco de tuplas do cursor em DataFrame com datas, números e textos categóricos."""
+    bloco = pd.DataFrame.from_records(linhas, columns=colunas)
+    for col in colunas:
+        if col in colunas_data:
+            bloco[col] = pd.to_datetime(bloco[col]).dt.normalize()
+        elif col in colunas_valor:
+            bloco[col] = pd.to_numeric(bloco[col], errors='coerce')
+        else:
+            bloco[col] = bloco[col].str.strip().astype('category')
+    return bloco
+
+def ler_consulta_em_blocos(conexao, sql, colunas_data=(), colunas_valor=(), tamanho_bloco=TAMANHO_BLOCO_BANCO, cursor_servidor=True):
+    """Executa a consulta e monta o DataFrame bloco a bloco, sem materializar todas as linhas como tuplas."""
+    # Cursor nomeado = cursor do lado do servidor no psycopg2; o SQLite (usado em
+    # testes locais) só tem o cursor comum, que também entrega os dados em blocos.
+    cursor = conexao.cursor(name='dashboard_stream') if cursor_servidor else conexao.cursor()
+    try:
+        if cursor_servidor:
+            cursor.itersize = tamanho_bloco
+        cursor.execute(sql)
+        blocos = []
+        colunas = None
+        while True:
+            linhas = cursor.fetchmany(tamanho_bloco)
+            if colunas is None:
+                colunas = [c[0] for c in cursor.description]
+            if not linhas:
+                break
+            blocos.append(_tipar_bloco(linhas, colunas, colunas_data, colunas_valor))
+    finally:
+        cursor.close()
+    if not blocos:
+        return _tipar_bloco([], colunas, colunas_data, colunas_valor)
+    return _concatenar(blocos)
+
+def _concatenar(dfs):
+    """pd.concat que preserva as colunas categóricas mesmo quando os dicionários diferem (une os dicionários)."""
+    df = pd.concat(dfs, ignore_index=True)
+    for col in df.columns:
+        if not isinstance(df[col].dtype, pd.CategoricalDtype) and all(isinstance(d[col].dtype, pd.CategoricalDtype) for d in dfs):
+            df[col] = pd.api.types.union_categoricals([d[col] for d in dfs])
+    return df
+
+def _filtro_desde(coluna, desde):
+    """Cláusula WHERE da leitura incremental (linhas com data igual ou posterior a `desde`)."""
+    if desde is None:
+        return ''
+    # A data vem de um Timestamp já validado, nunca de entrada do usuário
+    return f"WHERE {coluna} >= '{pd.Timestamp(desde).strftime('%Y-%m-%d')}'"
+
+def ler_vendas_banco(conexao, cursor_servidor=True, desde=None):
+    """Lê as vendas de uma conexão DB-API (PostgreSQL em produção, SQLite nos testes)."""
+    df = ler_consulta_em_blocos(conexao, CONSULTA_VENDAS.format(filtro=_filtro_desde('p.effective_date', desde)),
+                                colunas_data=['data_vigencia'], colunas_valor=['valor_proposta', 'broker_id'], cursor_servidor=cursor_servidor)
+    return chavear_entidades(df, 'corretor', 'id_corretor', coluna_origem='broker_id')
+
+def ler_comissoes_banco(conexao, cursor_servidor=True, desde=None):
+    """Lê as comissões pagas de uma conexão DB-API."""
+    df = ler_consulta_em_blocos(conexao, CONSULTA_COMISSOES.format(filtro=_filtro_desde('r.discharge_date', desde)),
+                                colunas_data=['data_baixa'], colunas_valor=['amount_to_pay', 'broker_id'], cursor_servidor=cursor_servidor)
+    return chavear_entidades(df, 'corretor', 'id_corretor', coluna_origem='broker_id')
+
+def carregar_fonte_banco(conexao, cursor_servidor=True, desde=None):
+    """Lê vendas e comissões de uma conexão DB-API.
+
+    Com `desde`, só traz as linhas com data igual ou posterior (leitura incremental).
+    """
+    return (ler_vendas_banco(conexao, cursor_servidor, desde),
+            ler_comissoes_banco(conexao, cursor_servidor, desde))
+
+def _ler_do_banco_ou_csv(leitor, caminho, parser):
+    """Lê do PostgreSQL quando configurado, com o CSV como alternativa."""
+    if FONTE_DADOS == 'postgres':
+        try:
+            with conexao_postgres() as conexao:
+                return leitor(conexao)
+        except Exception as e:
+            avisar('warning', f"Não foi possível ler os dados do banco ({e}). Usando os arquivos CSV.")
+    return _carregar_com_cache(caminho, parser)
+
+# --- Carregadores por conjunto de dados ---
+# Cada conjunto tem seu próprio carregador com cache, então uma página só paga
+# pela leitura do que usa. A falta do arquivo de inativos não derruba as
+# páginas: ele vira um DataFrame vazio com as colunas esperadas.
+def _carregar_conjunto(ler, dimensoes):
+    try:
+        df = ler()
+    except FileNotFoundError as e:
+        avisar('error', f"Erro ao carregar dados: O arquivo '{e.filename}' não foi encontrado.")
+        return None
+    if MODO_COMPACTO:
+        compactar_dimensoes([df], dimensoes)
+    return df
+
+def _ler_vendas():
+    return _carregar_conjunto(lambda: _ler_do_banco_ou_csv(ler_vendas_banco, 'data/vendas.csv', _parse_vendas), DIMENSOES_CORRETORES)
+
+def _ler_pagamentos():
+    return _carregar_conjunto(lambda: _ler_do_banco_ou_csv(ler_comissoes_banco, 'data/comissao.csv', _parse_pagamentos), DIMENSOES_CORRETORES)
+
+def _ler_inativos():
+    try:
+        df = _carregar_com_cache('data/corretores_inativos.csv', _parse_inativos)
+    except FileNotFoundError as e:
+        avisar('warning', f"Arquivo '{e.filename}' não encontrado: as análises de inatividade ficarão vazias.")
+        df = pd.DataFrame({'data': pd.Series(dtype='datetime64[ns]'),
+                           'corretor': pd.Series(dtype=object),
+                           'tipo_de_corretor': pd.Series(dtype=object),
+                           'id_corretor': pd.Series(dtype='Int64')})
+    if MODO_COMPACTO:
+        compactar_dimensoes([df], DIMENSOES_CORRETORES)
+    return df
+
+def _ler_contas():
+    return _carregar_conjunto(_ler_contas_pagar, DIMENSOES_FINANCEIRO)
+
+@cache_contado(st.cache_data, show_spinner=False)
+def carregar_vendas():
+    """Vendas (PostgreSQL ou data/vendas.csv)."""
+    return _ler_vendas()
+
+@cache_contado(st.cache_data, show_spinner=False)
+def carregar_pagamentos():
+    """Comissões pagas (PostgreSQL ou data/comissao.csv)."""
+    return _ler_pagamentos()
+
+@cache_contado(st.cache_data, show_spinner=False)
+def carregar_inativos():
+    """Registros de inatividade dos corretores (data/corretores_inativos.csv)."""
+    return _ler_inativos()
+
+@cache_contado(st.cache_data, show_spinner=False)
+def carregar_contas_pagar():
+    """Contas a pagar (data/contas_a_pagar_set24_set25.csv)."""
+    return _ler_contas()
+
+CARREGADORES = {
+    'vendas': carregar_vendas,
+    'pagamentos': carregar_pagamentos,
+    'inativos': carregar_inativos,
+    'contas_pagar': carregar_contas_pagar,
+}
+LEITORES = {
+    'vendas': _ler_vendas,
+    'pagamentos': _ler_pagamentos,
+    'inativos': _ler_inativos,
+    'contas_pagar': _ler_contas,
+}
+CONJUNTOS_CORRETORES = ('vendas', 'pagamentos', 'inativos')
+# Conjuntos lidos juntos num instantâneo: comissões e inativos precisam das vendas
+# para os ids e, no modo compacto, os três compartilham um dicionário por dimensão
+GRUPOS_CONJUNTOS = {'corretores': CONJUNTOS_CORRETORES, 'contas_pagar': ('contas_pagar',)}
+GRUPO_DO_CONJUNTO = {nome: grupo for grupo, nomes in GRUPOS_CONJUNTOS.items() for nome in nomes}
+
+def alinhar_corretores(frames):
+    """Leva os corretores de comissões e inativos para os ids das vendas (a referência), quando já carregadas."""
+    if frames.get('vendas') is not None:
+        alinhar_entidades(frames['vendas'], [frames.get('pagamentos'), frames.get('inativos')])
+    return frames
+
+class DadosLazy:
+    """Acesso preguiçoso aos conjuntos de dados: cada um só é carregado no primeiro acesso.
+
+    Os corretores de comissões e inativos são levados aos ids das vendas assim que
+    as duas pontas estão carregadas. No modo compacto, os conjuntos de corretores já
+    carregados passam a compartilhar o mesmo dicionário por dimensão sempre que um
+    novo conjunto é acessado.
+    """
+
+    def __init__(self):
+        self._frames = {}
+
+    def _obter(self, nome):
+        if nome not in self._frames:
+            with medir(f"carga:{nome}"):
+                instantaneo = instantaneo_dados()
+                if instantaneo is not None:
+                    df = instantaneo.frames[nome]
+                    mostrar_avisos(instantaneo.frames.avisos.get(nome, ()))
+                elif MODO_INCREMENTAL:
+                    repositorio = repositorio_incremental()
+                    repositorio.atualizar()
+                    df = repositorio.conjuntos([nome])[nome]
+                    mostrar_avisos(repositorio.avisos.get(nome, ()))
+                else:
+                    df = CARREGADORES[nome]()
+                    if df is not None and nome in CONJUNTOS_CORRETORES:
+                        carregados = {n: self._frames[n] for n in CONJUNTOS_CORRETORES if self._frames.get(n) is not None}
+                        alinhar_corretores({**carregados, nome: df})
+                        if MODO_COMPACTO:
+                            compactar_dimensoes(list(carregados.values()) + [df], DIMENSOES_CORRETORES)
+            self._frames[nome] = df
+        return self._frames[nome]
+
+    @property
+    def vendas(self):
+        return self._obter('vendas')
+
+    @property
+    def pagamentos(self):
+        return self._obter('pagamentos')
+
+    @property
+    def inativos(self):
+        return self._obter('inativos')
+
+    @property
+    def contas_pagar(self):
+        return self._obter('contas_pagar')
+
+def load_data():
+    """Carrega todos os conjuntos de dados de uma vez (vendas, comissões, inativos e contas a pagar)."""
+    dados = DadosLazy()
+    return dados.vendas, dados.pagamentos, dados.inativos, dados.contas_pagar
+
+ARQUIVOS_DADOS = ['data/vendas.csv', 'data/comissao.csv', 'data/corretores_inativos.csv', 'data/contas_a_pagar_set24_set25.csv']
+
+def versao_dados():
+    """Identifica a versão atual dos dados (arquivos de origem + esquema), usada como chave dos artefatos derivados."""
+    instantaneo = instantaneo_dados()
+    if instantaneo is not None:
+        return instantaneo.versao
+    if MODO_INCREMENTAL:
+        return f"inc-{repositorio_incremental().versao}"
+    return _versao_arquivos()
+
+def _versao_arquivos():
+    """Hash do esquema, do modo e do tamanho/data de modificação dos arquivos de origem."""
+    h = hashlib.sha1(f"{VERSAO_ESQUEMA_CACHE}|{MODO_COMPACTO}|{FONTE_DADOS}".encode())
+    for caminho in ARQUIVOS_DADOS:
+        try:
+            stat = os.stat(caminho)
+            h.update(f"|{caminho}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+        except OSError:
+            h.update(f"|{caminho}:-".encode())
+    return h.hexdigest()[:12]
+
+# Os artefatos derivados (índices, cubo, segmentação, perfis...) ficam em cache por
+# versão dos dados. Guardamos a versão atual e a anterior, que ainda pode estar em
+# uso por um rerun iniciado antes da troca; as mais antigas são descartadas.
+VERSOES_EM_CACHE = 2
+
+# --- Dados compartilhados entre processos ---
+# Cada grupo de conjuntos lido dos CSVs é publicado uma única vez em arquivos Arrow IPC
+# (data/.cache/compartilhado/<versão>/<grupo>/), e todos os processos do servidor os mapeiam
+# em memória em vez de manter cada um a sua cópia: colunas numéricas e de datas
+# sem nulos viram visões somente leitura sobre o mapeamento, e as páginas do
+# sistema operacional são as mesmas para todos os processos. Texto e categorias
+# ainda são convertidos para objetos do pandas em cada processo. O processo que
+# encontra a versão já publicada nem chega a ler os CSVs. Só vale para os CSVs:
+# as leituras do PostgreSQL e o modo incremental dependem de cada processo.
+COMPARTILHAR_DADOS = os.environ.get('DASHBOARD_COMPARTILHADO', '1') == '1'
+PASTA_COMPARTILHADA = os.path.join(PASTA_CACHE, 'compartilhado')
+
+def _compartilhavel():
+    return COMPARTILHAR_DADOS and FONTE_DADOS == 'csv' and not MODO_INCREMENTAL and not PASTA_INSTANTANEOS
+
+def gravar_arrow(df, caminho, preservar_indice=False):
+    """Grava um DataFrame em Arrow IPC (formato de arquivo, mapeável em memória)."""
+    import pyarrow as pa
+    tabela = pa.Table.from_pandas(df, preserve_index=preservar_indice)
+    with pa.OSFile(caminho, 'wb') as arquivo:
+        with pa.ipc.new_file(arquivo, tabela.schema) as escritor:
+            escritor.write_table(tabela)
+
+def mapear_arrow(caminho):
+    """DataFrame sobre um arquivo Arrow IPC mapeado em memória (colunas numéricas sem cópia, somente leitura)."""
+    import pyarrow as pa
+    # O mapeamento fica vivo enquanto algum DataFrame referenciar seus buffers
+    tabela = pa.ipc.open_file(pa.memory_map(caminho)).read_all()
+    return tabela.to_pandas(split_blocks=True)
+
+def mapear_compartilhado(versao, grupo, avisos=None):
+    """Conjuntos de um grupo já publicado, mapeados em memória (ou None se ainda não foi publicado).
+
+    Com `avisos` (dicionário), recebe também os avisos guardados na leitura de quem publicou.
+    """
+    pasta = os.path.join(PASTA_COMPARTILHADA, versao, grupo)
+    if not os.path.isdir(pasta):
+        return None
+    if avisos is not None and os.path.exists(os.path.join(pasta, 'avisos.json')):
+        with open(os.path.join(pasta, 'avisos.json'), encoding='utf-8') as f:
+            avisos.update({nome: [tuple(aviso) for aviso in lista] for nome, lista in json.load(f).items()})
+    return {nome: mapear_arrow(os.path.join(pasta, f"{nome}.arrow")) for nome in GRUPOS_CONJUNTOS[grupo]}
+
+def publicar_compartilhado(versao, grupo, frames, avisos=None):
+    """Grava os conjuntos de um grupo (e os avisos da leitura) em Arrow IPC, a menos que outro processo já tenha gravado."""
+    pasta_versao = os.path.join(PASTA_COMPARTILHADA, versao)
+    destino = os.path.join(pasta_versao, grupo)
+    if os.path.isdir(destino):
+        return
+    os.makedirs(pasta_versao, exist_ok=True)
+    temporaria = tempfile.mkdtemp(prefix=f"{grupo}.", suffix='.tmp', dir=pasta_versao)
+    try:
+        for nome, df in frames.items():
+            gravar_arrow(df, os.path.join(temporaria, f"{nome}.arrow"))
+        with open(os.path.join(temporaria, 'avisos.json'), 'w', encoding='utf-8') as f:
+            json.dump({nome: (avisos or {}).get(nome, []) for nome in frames}, f, ensure_ascii=False)
+        try:
+            # Renomear a pasta inteira publica os arquivos do grupo de uma vez
+            os.rename(temporaria, destino)
+        except OSError:
+            pass  # outro processo publicou o mesmo grupo primeiro
+    finally:
+        shutil.rmtree(temporaria, ignore_errors=True)
+    _descartar_versoes_compartilhadas()
+
+def _descartar_versoes_compartilhadas():
+    """Apaga as versões publicadas mais antigas, mantendo as VERSOES_EM_CACHE mais recentes."""
+    pastas = [os.path.join(PASTA_COMPARTILHADA, nome) for nome in os.listdir(PASTA_COMPARTILHADA) if not nome.endswith('.tmp')]
+    pastas.sort(key=os.path.getmtime, reverse=True)
+    for pasta in pastas[VERSOES_EM_CACHE:]:
+        # Quem ainda mapeia os arquivos continua lendo normalmente (no Windows a remoção falha e fica para depois)
+        shutil.rmtree(pasta, ignore_errors=True)
+
+def _frames_compartilhados(versao, grupo, ler, avisos=None):
+    """Mapeia o grupo publicado ou, se ainda não existe, lê (`ler`), publica e mapeia."""
+    try:
+        frames = mapear_compartilhado(versao, grupo, avisos)
+        if frames is None:
+            lidos = ler()
+            if any(df is None for df in lidos.values()):
+                return lidos
+            publicar_compartilhado(versao, grupo, lidos, avisos)
+            frames = mapear_compartilhado(versao, grupo)
+        return frames
+    except Exception:
+        _log_atualizacao.warning("Dados compartilhados indisponíveis; usando uma cópia própria", exc_info=True)
+        return ler()
+
+# --- Instantâneos pré-construídos ---
+# `python construir_instantaneo.py` faz fora do servidor a limpeza dos dados e as
+# agregações mais caras (cubo mensal, totais por corretor, segmentação e parcelas
+# projetadas) e grava tudo numa pasta versionada, em Arrow IPC, com um manifesto
+# de linhas e checksums. O arquivo ATUAL aponta para o instantâneo em uso; voltar
+# a um anterior é só reapontá-lo. Com DASHBOARD_INSTANTANEOS indicando a pasta
+# dos instantâneos, o dashboard mapeia o instantâneo ativo (somente leitura) em
+# vez de ler as fontes, e a atualização em segundo plano acompanha o ponteiro.
+PASTA_INSTANTANEOS = os.environ.get('DASHBOARD_INSTANTANEOS', '')
+ARQUIVO_PONTEIRO = 'ATUAL'
+VERSAO_FORMATO_INSTANTANEO = 2
+
+def _artefatos_calculados(frames):
+    """Artefatos derivados gravados junto com as tabelas de um instantâneo."""
+    df_vendas, df_contas = frames['vendas'], frames['contas_pagar']
+    agregados = {**_agregados_vendas(df_vendas), **_agregados_pagamentos(frames['pagamentos'])}
+    artefatos = {
+        'cubo_vendas': agregados['cubo'],
+        'vendas_corretor': agregados['vendas_corretor'],
+        'comissoes_corretor': agregados['comissoes_corretor'].to_frame(),
+        'parcelas_projetadas': projetar_recorrencias(df_contas),
+    }
+    servico = ServicoSegmentacao(df_vendas)
+    dados_corretores, cluster_analysis = servico.resultado_base
+    if dados_corretores is not None:
+        artefatos['segmentacao'] = dados_corretores
+        artefatos['segmentacao_clusters'] = cluster_analysis
+        artefatos['segmentacao_modelo'] = servico.modelo()
+    return artefatos
+
+def gerar_instantaneo(pasta):
+    """Lê as fontes, calcula os artefatos e grava um novo instantâneo em `pasta`; devolve o seu nome."""
+    frames = _ler_conjuntos()
+    faltando = [nome for nome, df in frames.items() if df is None]
+    if faltando:
+        raise FileNotFoundError(f"conjuntos de dados indisponíveis: {', '.join(faltando)}")
+    versao_origem = _versao_arquivos()
+    nome = f"{time.strftime('%Y%m%d-%H%M%S')}-{versao_origem}"
+    os.makedirs(pasta, exist_ok=True)
+    temporaria = tempfile.mkdtemp(prefix=f"{nome}.", suffix='.tmp', dir=pasta)
+    try:
+        # Tabelas sem o índice (sempre RangeIndex); artefatos com o índice que tiverem
+        conteudo = {f"tabelas/{nome_df}": (df, False) for nome_df, df in frames.items()}
+        conteudo.update({f"artefatos/{nome_df}": (df, None) for nome_df, df in _artefatos_calculados(frames).items()})
+        arquivos = {}
+        for chave, (df, preservar_indice) in conteudo.items():
+            relativo = f"{chave}.arrow"
+            caminho = os.path.join(temporaria, relativo)
+            os.makedirs(os.path.dirname(caminho), exist_ok=True)
+            gravar_arrow(df, caminho, preservar_indice)
+            arquivos[chave] = {'arquivo': relativo, 'linhas': len(df), 'sha256': _hash_arquivo(caminho)}
+        with open(os.path.join(temporaria, 'manifesto.json'), 'w', encoding='utf-8') as f:
+            json.dump({
+                'formato': VERSAO_FORMATO_INSTANTANEO,
+                'nome': nome,
+                'criado_em': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'versao_origem': versao_origem,
+                'fonte': FONTE_DADOS,
+                'modo_compacto': MODO_COMPACTO,
+                'arquivos': arquivos,
+            }, f, ensure_ascii=False, indent=2)
+        os.rename(temporaria, os.path.join(pasta, nome))
+    finally:
+        shutil.rmtree(temporaria, ignore_errors=True)
+    return nome
+
+def listar_instantaneos(pasta):
+    """Nomes dos instantâneos completos em `pasta`, do mais antigo ao mais recente."""
+    if not os.path.isdir(pasta):
+        return []
+    return sorted(nome for nome in os.listdir(pasta) if os.path.isfile(os.path.join(pasta, nome, 'manifesto.json')))
+
+def instantaneo_ativo(pasta):
+    """Nome do instantâneo apontado por ATUAL (FileNotFoundError se nenhum foi ativado)."""
+    with open(os.path.join(pasta, ARQUIVO_PONTEIRO), encoding='utf-8') as f:
+        return f.read().strip()
+
+def verificar_instantaneo(pasta, nome):
+    """Confere formato e checksums de um instantâneo; devolve o manifesto ou levanta ValueError."""
+    with open(os.path.join(pasta, nome, 'manifesto.json'), encoding='utf-8') as f:
+        manifesto = json.load(f)
+    if manifesto.get('formato') != VERSAO_FORMATO_INSTANTANEO:
+        raise ValueError(f"instantâneo '{nome}' em formato {manifesto.get('formato')}, esperado {VERSAO_FORMATO_INSTANTANEO}")
+    for chave, info in manifesto['arquivos'].items():
+        if _hash_arquivo(os.path.join(pasta, nome, info['arquivo'])) != info['sha256']:
+            raise ValueError(f"instantâneo '{nome}': o checksum de {chave} não confere")
+    return manifesto
+
+def ativar_instantaneo(pasta, nome):
+    """Aponta o dashboard para o instantâneo `nome`, depois de verificá-lo (também serve para voltar a um anterior)."""
+    verificar_instantaneo(pasta, nome)
+    def escrever(destino):
+        with open(destino, 'w', encoding='utf-8') as f:
+            f.write(nome + '\n')
+    _gravar_atomico(os.path.join(pasta, ARQUIVO_PONTEIRO), escrever)
+
+def descartar_instantaneos(pasta, manter):
+    """Apaga os instantâneos mais antigos, mantendo os `manter` mais recentes e o ativo; devolve os apagados."""
+    try:
+        ativo = instantaneo_ativo(pasta)
+    except FileNotFoundError:
+        ativo = None
+    nomes = listar_instantaneos(pasta)
+    apagados = [nome for nome in nomes[:max(len(nomes) - manter, 0)] if nome != ativo]
+    for nome in apagados:
+        shutil.rmtree(os.path.join(pasta, nome), ignore_errors=True)
+    return apagados
+
+def carregar_instantaneo(pasta, nome):
+    """Tabelas e artefatos de um instantâneo verificado, mapeados em memória."""
+    manifesto = verificar_instantaneo(pasta, nome)
+    frames, artefatos = {}, {}
+    for chave, info in manifesto['arquivos'].items():
+        grupo, nome_df = chave.split('/', 1)
+        destino = frames if grupo == 'tabelas' else artefatos
+        destino[nome_df] = mapear_arrow(os.path.join(pasta, nome, info['arquivo']))
+    return frames, artefatos
+
+def artefato_instantaneo(nome, versao):
+    """Artefato pré-calculado do instantâneo deste rerun, se ele for da `versao` pedida (senão None)."""
+    instantaneo = instantaneo_dados()
+    if instantaneo is None or instantaneo.versao != versao:
+        return None
+    return instantaneo.artefatos.get(nome)
+
+# --- Atualização em segundo plano ---
+# Uma thread do servidor confere as fontes a cada DASHBOARD_ATUALIZACAO_SEGUNDOS
+# (padrão 30; 0 desliga e volta à carga sob demanda). Com DASHBOARD_INSTANTANEOS,
+# confere o ponteiro do instantâneo ativo. Cada instantâneo guarda uma referência
+# por conjunto de dados, lida só quando alguma página pede o conjunto: a página
+# financeira nunca lê os corretores, e vice-versa. Quando algo muda, a thread
+# monta o novo instantâneo já com os conjuntos lidos no anterior e os artefatos
+# derivados que as páginas pediram nele (índices, cubo, perfis...), e só então o
+# publica, trocando uma única referência. Cada rerun fixa o instantâneo em
+# render_sidebar e o usa do início ao fim, mesmo que uma nova versão seja
+# publicada no meio. No PostgreSQL, sem como detectar mudanças, o instantâneo é
+# refeito a cada INTERVALO_BANCO_SEGUNDOS.
+INTERVALO_ATUALIZACAO = int(os.environ.get('DASHBOARD_ATUALIZACAO_SEGUNDOS', '30'))
+_contexto_execucao = threading.local()
+_log_atualizacao = logging.getLogger('dashboard.atualizacao')
+
+class ConjuntosInstantaneo:
+    """Conjuntos de dados de uma versão, lidos por grupo (GRUPOS_CONJUNTOS) no primeiro acesso.
+
+    Os avisos de cada leitura ficam em `avisos`, por conjunto, para cada sessão mostrar os seus.
+    """
+
+    def __init__(self, versao, frames=None):
+        self.versao = versao
+        self.avisos = {}
+        self._frames = dict(frames or {})
+        self._trava = threading.Lock()
+
+    def __getitem__(self, nome):
+        if nome not in self._frames:
+            with self._trava:
+                if nome not in self._frames:
+                    self._frames.update(self._ler_grupo(GRUPO_DO_CONJUNTO[nome]))
+        return self._frames[nome]
+
+    def _ler_grupo(self, grupo):
+        nomes = GRUPOS_CONJUNTOS[grupo]
+        if MODO_INCREMENTAL:
+            repositorio = repositorio_incremental()
+            frames = repositorio.conjuntos(nomes)
+            self.avisos.update({nome: repositorio.avisos.get(nome, []) for nome in nomes})
+            # Cópias rasas: o repositório troca colunas dos seus DataFrames ao receber novos deltas
+            return {nome: None if df is None else df.copy(deep=False) for nome, df in frames.items()}
+        if _compartilhavel():
+            return _frames_compartilhados(self.versao, grupo, lambda: _ler_conjuntos(nomes, self.avisos), self.avisos)
+        return _ler_conjuntos(nomes, self.avisos)
+
+    def carregados(self):
+        """Nomes dos conjuntos já lidos."""
+        return set(self._frames)
+
+    def carregar(self, nomes):
+        """Lê agora os conjuntos indicados (e os dos seus grupos)."""
+        for nome in nomes:
+            self[nome]
+
+    def values(self):
+        return list(self._frames.values())
+
+class InstantaneoDados:
+    """Os conjuntos de dados de uma versão, publicados juntos (com os artefatos pré-calculados, se houver).
+
+    `pedidos` registra as funções em cache chamadas pelos reruns que usaram este
+    instantâneo, para a próxima versão aquecer só o que as páginas de fato pedem.
+    """
+
+    def __init__(self, versao, frames, artefatos=None):
+        self.versao = versao
+        self.frames = frames if isinstance(frames, ConjuntosInstantaneo) else ConjuntosInstantaneo(versao, frames)
+        self.artefatos = artefatos or {}
+        self.pedidos = set()
+        self.criado_em = time.time()
+
+def _montar_instantaneo(versao):
+    """Instantâneo de uma versão; as fontes só são lidas quando um conjunto é pedido."""
+    if PASTA_INSTANTANEOS:
+        frames, artefatos = carregar_instantaneo(PASTA_INSTANTANEOS, versao.removeprefix('inst-'))
+        return InstantaneoDados(versao, frames, artefatos)
+    return InstantaneoDados(versao, None)
+
+def _ler_conjuntos(nomes=tuple(LEITORES), avisos=None):
+    """Lê os conjuntos indicados das fontes, sem passar pelo cache do Streamlit.
+
+    Com `avisos` (dicionário), os avisos de cada leitura são guardados nele por conjunto em vez de mostrados.
+    """
+    frames = {}
+    for nome in nomes:
+        if avisos is None:
+            frames[nome] = LEITORES[nome]()
+        else:
+            with coletar_avisos() as avisos[nome]:
+                frames[nome] = LEITORES[nome]()
+    alinhar_corretores(frames)
+    if MODO_COMPACTO:
+        compactar_dimensoes([frames[nome] for nome in CONJUNTOS_CORRETORES if frames.get(nome) is not None], DIMENSOES_CORRETORES)
+    return frames
+
+def _aquecer(instantaneo, pedidos):
+    """Calcula, para a nova versão, os artefatos derivados já pedidos na versão anterior."""
+    frames, versao = instantaneo.frames, instantaneo.versao
+    carregados = frames.carregados()
+    df_vendas = frames['vendas'] if 'vendas' in carregados else None
+    df_contas = frames['contas_pagar'] if 'contas_pagar' in carregados else None
+    if df_vendas is not None:
+        if 'indexar_dados' in pedidos:
+            indexar_dados(df_vendas, 'vendas', 'data_vigencia', ('supervisor', 'tipo_de_corretor'), versao)
+        if 'indexar_cubo_vendas' in pedidos:
+            indexar_cubo_vendas(df_vendas, versao)
+        if 'perfis_corretores' in pedidos and frames['pagamentos'] is not None:
+            perfis_corretores(df_vendas, frames['pagamentos'], frames['inativos'], versao)
+    if df_contas is not None:
+        if 'indexar_dados' in pedidos:
+            indexar_dados(df_contas, 'contas_pagar', 'Data de vencimento', ('Categoria 1', 'Centro de Custo 1'), versao)
+        if 'livro_caixa' in pedidos:
+            livro_caixa(df_contas, versao)
+    if 'motor_duckdb' in pedidos and MOTOR_CONSULTAS == 'duckdb' and FONTE_DADOS == 'csv' and not MODO_INCREMENTAL and not PASTA_INSTANTANEOS:
+        try:
+            motor_duckdb(versao)
+        except Exception:
+            pass
+
+class AtualizadorDados:
+    """Mantém o instantâneo publicado e o renova em segundo plano quando as fontes mudam.
+
+    Uma falha ao montar uma versão não derruba as páginas: a versão anterior continua
+    publicada (sem nenhuma, `atual` fica None e os dados são lidos sob demanda), e o
+    erro e os avisos da última tentativa ficam em `erro` e `avisos` para cada sessão.
+    """
+
+    def __init__(self, intervalo):
+        self.intervalo = intervalo
+        self.atualizando = False
+        self.erro = None
+        self.avisos = []
+        self.atual = None
+        self._numero_banco = 0
+        self._ultima_leitura_banco = time.time()
+        # A primeira versão é publicada sem ler nada: cada conjunto é lido quando uma página o pede
+        self._tentar_atualizar()
+        self._thread = threading.Thread(target=self._executar, name='atualizador-dados', daemon=True)
+        self._thread.start()
+
+    def _versao_fontes(self):
+        if PASTA_INSTANTANEOS:
+            return f"inst-{instantaneo_ativo(PASTA_INSTANTANEOS)}"
+        if MODO_INCREMENTAL:
+            repositorio = repositorio_incremental()
+            repositorio.atualizar()
+            return f"inc-{repositorio.versao}"
+        if FONTE_DADOS == 'postgres' and not MODO_INCREMENTAL:
+            if time.time() - self._ultima_leitura_banco >= INTERVALO_BANCO_SEGUNDOS:
+                self._numero_banco += 1
+                self._ultima_leitura_banco = time.time()
+            return f"{_versao_arquivos()}-b{self._numero_banco}"
+        return _versao_arquivos()
+
+    def _construir(self, versao, anterior):
+        """Monta a nova versão com os conjuntos lidos e os artefatos pedidos na `anterior`."""
+        instantaneo = _montar_instantaneo(versao)
+        contexto = getattr(_contexto_execucao, 'instantaneo', None)
+        _contexto_execucao.instantaneo = instantaneo
+        try:
+            instantaneo.frames.carregar(anterior.frames.carregados())
+            _aquecer(instantaneo, set(anterior.pedidos))
+        finally:
+            _contexto_execucao.instantaneo = contexto
+        return instantaneo
+
+    def atualizar(self):
+        """Monta e publica um novo instantâneo se as fontes mudaram; devolve True se publicou."""
+        versao = self._versao_fontes()
+        if self.atual is None:
+            self.atual = _montar_instantaneo(versao)
+            return True
+        if versao == self.atual.versao:
+            return False
+        self.atualizando = True
+        try:
+            novo = self._construir(versao, self.atual)
+        finally:
+            self.atualizando = False
+        if any(df is None for df in novo.frames.values()):
+            # Fonte indisponível no meio do caminho: continua servindo a versão anterior
+            raise FileNotFoundError("algum conjunto de dados não pôde ser lido")
+        self.atual = novo
+        _log_atualizacao.info("Dados atualizados para a versão %s", novo.versao)
+        return True
+
+    def _tentar_atualizar(self):
+        """atualizar() guardando o erro e os avisos em vez de deixá-los escapar."""
+        with coletar_avisos() as avisos:
+            try:
+                self.atualizar()
+                self.erro = None
+            except Exception as e:
+                self.erro = str(e)
+                _log_atualizacao.exception("Falha ao atualizar os dados")
+        self.avisos = avisos
+
+    def _executar(self):
+        while True:
+            time.sleep(self.intervalo)
+            self._tentar_atualizar()
+
+@st.cache_resource(show_spinner=False)
+def atualizador_dados():
+    """Atualizador único por processo do servidor."""
+    return AtualizadorDados(INTERVALO_ATUALIZACAO)
+
+def fixar_instantaneo():
+    """Fixa, para o rerun que está começando, o instantâneo publicado agora."""
+    _contexto_execucao.instantaneo = atualizador_dados().atual if INTERVALO_ATUALIZACAO > 0 else None
+
+def instantaneo_dados():
+    """Instantâneo deste rerun (o publicado, se nenhum foi fixado), ou None com a atualização desligada."""
+    if INTERVALO_ATUALIZACAO <= 0:
+        return None
+    instantaneo = getattr(_contexto_execucao, 'instantaneo', None)
+    return instantaneo if instantaneo is not None else atualizador_dados().atual
+
+def _formatar_idade(segundos):
+    if segundos < 60:
+        return "agora há pouco"
+    if segundos < 3600:
+        return f"há {int(segundos // 60)} min"
+    if segundos < 86400:
+        return f"há {int(segundos // 3600)} h"
+    return f"há {int(segundos // 86400)} dia(s)"
+
+def status_dados():
+    """Versão e idade dos dados deste rerun, para a barra lateral (None com a atualização desligada)."""
+    instantaneo = instantaneo_dados()
+    if instantaneo is None:
+        return None
+    atualizador = atualizador_dados()
+    texto = f"🗂️ Versão dos dados {instantaneo.versao} · carregada {_formatar_idade(time.time() - instantaneo.criado_em)}"
+    if atualizador.atualizando:
+        texto += " · atualizando…"
+    elif atualizador.atual is not instantaneo:
+        texto += " · nova versão disponível no próximo clique"
+    return texto
+
+def mostrar_avisos_atualizacao():
+    """Mostra nesta sessão os avisos e a falha da última atualização em segundo plano, se houver."""
+    if INTERVALO_ATUALIZACAO <= 0:
+        return
+    atualizador = atualizador_dados()
+    mostrar_avisos(atualizador.avisos)
+    if atualizador.erro:
+        if atualizador.atual is None:
+            avisar('warning', f"Não foi possível montar os dados compartilhados ({atualizador.erro}). Lendo direto das fontes.")
+        else:
+            avisar('warning', f"A última atualização dos dados falhou ({atualizador.erro}). A versão anterior continua em uso.")
+
+# --- Segmentação de corretores ---
+# O modelo (scaler + centróides) é ajustado uma vez por versão dos dados sobre
+# todas as vendas. Visões filtradas partem desses centróides (warm start, uma
+# única inicialização) em vez de reajustar do zero. Os clusters são sempre
+# renumerados pela média de total de vendas, então o rótulo 0 é sempre
+# "Superestrelas" e as personas não trocam de cluster entre ajustes.
+PERFIL_NOMES = ["🏆 Superestrelas", "🚀 Grande Potencial", "📈 Vendedores de Volume", "🛠️ Em Desenvolvimento"]
+COLUNAS_SEGMENTACAO = ['total_vendas', 'num_vendas', 'ticket_medio']
+LIMITE_MINIBATCH = int(os.environ.get('DASHBOARD_LIMITE_MINIBATCH', '5000'))
+LIMITE_RESULTADOS_SEGMENTACAO = 64
+
+def _dados_segmentacao(df):
+    """Métricas por corretor usadas na segmentação, ou None se não houver corretores suficientes."""
     if df is None or df.empty or len(df['corretor'].unique()) < 4:
-        return None, None
-    dados_corretores = df.groupby('corretor').agg(
+        return None
+    dados_corretores = df.groupby('corretor', observed=True).agg(
         total_vendas=('valor_proposta', 'sum'),
         num_vendas=('valor_proposta', 'count'),
         ticket_medio=('valor_proposta', 'mean')
     ).reset_index()
     dados_corretores = dados_corretores[dados_corretores['num_vendas'] > 3]
-    num_corretores_validos = len(dados_corretores)
-    if num_corretores_validos < 4:
-        return None, None
-    n_clusters = min(4, num_corretores_validos)
-    features = dados_corretores[['total_vendas', 'num_vendas', 'ticket_medio']]
-    scaler = StandardScaler()
-    features_scaled = scaler.fit_transform(features)
-    kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init='auto')
-    dados_corretores['cluster'] = kmeans.fit_predict(features_scaled)
-    cluster_analysis = dados_corretores.groupby('cluster')[['total_vendas', 'num_vendas', 'ticket_medio']].mean().sort_values(by='total_vendas', ascending=False)
-    personas = {}
-    perfil_nomes = ["🏆 Superestrelas", "🚀 Grande Potencial", "📈 Vendedores de Volume", "🛠️ Em Desenvolvimento"]
-    for i, row in enumerate(cluster_analysis.iterrows()):
-        personas[row[0]] = perfil_nomes[i]
+    if len(dados_corretores) < 4:
+        return None
+    return dados_corretores
+
+def _ajustar_kmeans(features_scaled, centroides=None):
+    """Ajusta o K-Means (MiniBatch acima de LIMITE_MINIBATCH corretores), partindo dos centróides se houver."""
+    # Importado aqui: o scikit-learn é pesado e só a segmentação precisa dele
+    from sklearn.cluster import KMeans, MiniBatchKMeans
+    n_clusters = min(len(PERFIL_NOMES), len(features_scaled))
+    if centroides is not None:
+        init, n_init = centroides[:n_clusters], 1
+    else:
+        init, n_init = 'k-means++', 'auto'
+    if len(features_scaled) > LIMITE_MINIBATCH:
+        modelo = MiniBatchKMeans(n_clusters=n_clusters, init=init, n_init=n_init, random_state=42)
+    else:
+        modelo = KMeans(n_clusters=n_clusters, init=init, n_init=n_init, random_state=42)
+    rotulos = modelo.fit_predict(features_scaled)
+    return rotulos, modelo.cluster_centers_
+
+def _ordenar_clusters(dados_corretores, rotulos, centroides):
+    """Renumera os clusters por total de vendas médio (decrescente) e atribui as personas."""
+    dados_corretores['cluster'] = rotulos
+    medias = dados_corretores.groupby('cluster')[COLUNAS_SEGMENTACAO].mean()
+    ordem = medias.sort_values(by='total_vendas', ascending=False).index.to_numpy()
+    # Clusters que ficaram vazios vão para o fim, na ordem original
+    ordem = np.concatenate([ordem, np.setdiff1d(np.arange(len(centroides)), ordem)])
+    novo_rotulo = np.empty(len(centroides), dtype=int)
+    novo_rotulo[ordem] = np.arange(len(centroides))
+    dados_corretores['cluster'] = novo_rotulo[rotulos]
+    personas = dict(enumerate(PERFIL_NOMES))
     dados_corretores['perfil_corretor'] = dados_corretores['cluster'].map(personas)
+    cluster_analysis = dados_corretores.groupby('cluster')[COLUNAS_SEGMENTACAO].mean().sort_values(by='total_vendas', ascending=False)
     cluster_analysis['perfil'] = cluster_analysis.index.map(personas)
-    return dados_corretores, cluster_analysis
+    return dados_corretores, cluster_analysis, centroides[ordem]
+
+class ServicoSegmentacao:
+    """Modelo de segmentação ajustado uma vez sobre todas as vendas de uma versão dos dados."""
+
+    def __init__(self, df_vendas):
+        self.scaler = None
+        self.centroides = None
+        self.resultado_base = (None, None)
+        self._resultados = CacheFiguras(LIMITE_RESULTADOS_SEGMENTACAO, nome='segmentacao_filtrada')
+        dados_corretores = _dados_segmentacao(df_vendas)
+        if dados_corretores is None:
+            return
+        from sklearn.preprocessing import StandardScaler
+        self.scaler = StandardScaler().fit(dados_corretores[COLUNAS_SEGMENTACAO])
+        features_scaled = self.scaler.transform(dados_corretores[COLUNAS_SEGMENTACAO])
+        rotulos, centroides = _ajustar_kmeans(features_scaled)
+        dados_corretores, cluster_analysis, self.centroides = _ordenar_clusters(dados_corretores, rotulos, centroides)
+        self.resultado_base = (dados_corretores, cluster_analysis)
+
+    def modelo(self):
+        """Scaler e centróides como tabela: linhas 'media', 'escala' e um centróide por cluster."""
+        return pd.DataFrame(np.vstack([self.scaler.mean_, self.scaler.scale_, self.centroides]), columns=COLUNAS_SEGMENTACAO,
+                            index=['media', 'escala'] + [f"centroide_{i}" for i in range(len(self.centroides))])
+
+    @classmethod
+    def restaurar(cls, dados_corretores, cluster_analysis, modelo):
+        """Serviço com o resultado e o modelo gravados num instantâneo, sem reajustar o K-Means."""
+        from sklearn.preprocessing import StandardScaler
+        servico = cls(None)
+        servico.scaler = StandardScaler()
+        servico.scaler.mean_ = modelo.loc['media'].to_numpy()
+        servico.scaler.scale_ = modelo.loc['escala'].to_numpy()
+        servico.scaler.var_ = servico.scaler.scale_ ** 2
+        servico.scaler.n_features_in_ = len(COLUNAS_SEGMENTACAO)
+        servico.scaler.feature_names_in_ = np.array(COLUNAS_SEGMENTACAO, dtype=object)
+        servico.scaler.n_samples_seen_ = len(dados_corretores)
+        servico.centroides = modelo.iloc[2:].to_numpy()
+        servico.resultado_base = (dados_corretores, cluster_analysis)
+        return servico
+
+    def segmentar(self, df, chave=None):
+        """Segmenta uma visão filtrada partindo dos centróides do modelo; `chave` (o estado dos filtros) guarda o resultado."""
+        if chave is None:
+            return self._segmentar(df)
+        return self._resultados.obter(_normalizar_filtros(chave), lambda: self._segmentar(df))
+
+    def _segmentar(self, df):
+        dados_corretores = _dados_segmentacao(df)
+        if dados_corretores is None:
+            return None, None
+        if self.centroides is None:
+            # Sem modelo base (poucos corretores no total): ajuste a frio na própria visão
+            from sklearn.preprocessing import StandardScaler
+            features_scaled = StandardScaler().fit_transform(dados_corretores[COLUNAS_SEGMENTACAO])
+            rotulos, centroides = _ajustar_kmeans(features_scaled)
+        else:
+            features_scaled = self.scaler.transform(dados_corretores[COLUNAS_SEGMENTACAO])
+            rotulos, centroides = _ajustar_kmeans(features_scaled, self.centroides)
+        dados_corretores, cluster_analysis, _ = _ordenar_clusters(dados_corretores, rotulos, centroides)
+        return dados_corretores, cluster_analysis
+
+@cache_contado(st.cache_resource, show_spinner=False, max_entries=VERSOES_EM_CACHE)
+def servico_segmentacao(_df_vendas, versao):
+    """Serviço de segmentação único por versão dos dados."""
+    modelo = artefato_instantaneo('segmentacao_modelo', versao)
+    if modelo is not None:
+        return ServicoSegmentacao.restaurar(artefato_instantaneo('segmentacao', versao), artefato_instantaneo('segmentacao_clusters', versao), modelo)
+    return ServicoSegmentacao(_df_vendas)
+
+@cache_contado(st.cache_data, show_spinner=False)
+def _segmentar_avulso(df):
+    """Segmentação de um DataFrame sem base de referência, em cache pelo conteúdo (como antes do modelo por versão)."""
+    return ServicoSegmentacao(df).resultado_base
+
+@medir('segmentacao')
+def segmenta_corretores(df, df_base=None, chave=None):
+    """Executa a clusterização de corretores usando K-Means.
+
+    Com `df_base` (todas as vendas), usa o modelo já ajustado para a versão atual dos dados.
+    """
+    if df_base is None:
+        return _segmentar_avulso(df)
+    servico = servico_segmentacao(df_base, versao_dados())
+    if df is df_base:
+        return servico.resultado_base
+    return servico.segmentar(df, chave)
+
+# --- Segmentação ao longo do tempo ---
+# Para ver corretores mudando de perfil, a segmentação é refeita em janelas
+# móveis: a cada fim de mês (ou de trimestre), sobre as vendas dos últimos
+# `meses_janela` meses. Cada janela é padronizada com o próprio scaler (os totais
+# de uma janela curta não são comparáveis aos do histórico) e o K-Means parte dos
+# centróides ordenados do modelo base, que também estão em desvios-padrão. Assim
+# cada cluster começa perto da persona correspondente e _ordenar_clusters fixa os
+# rótulos, que ficam consistentes entre as janelas. São dezenas de ajustes
+# independentes: com muitos corretores eles rodam num pool de processos (spawn,
+# seguro com as threads do servidor); com poucos, o custo de subir os processos
+# não compensa e os ajustes rodam em série. O resultado fica em cache por versão
+# dos dados e configuração.
+PERIODICIDADES_SEGMENTACAO = {'mes': pd.offsets.MonthEnd(), 'trimestre': pd.offsets.QuarterEnd()}
+PERIODICIDADE_PADRAO = 'mes'
+JANELA_PADRAO_MESES = 3
+PROCESSOS_SEGMENTACAO = int(os.environ.get('DASHBOARD_PROCESSOS_SEGMENTACAO', str(os.cpu_count() or 1)))
+# Soma de corretores de todas as janelas a partir da qual vale a pena usar o pool
+MINIMO_PARALELO_SEGMENTACAO = 20_000
+
+def _segmentar_janela(dados_corretores, centroides):
+    """Personas de uma janela (executada também nos processos do pool)."""
+    from sklearn.preprocessing import StandardScaler
+    features_scaled = StandardScaler().fit_transform(dados_corretores[COLUNAS_SEGMENTACAO])
+    n_clusters = min(len(PERFIL_NOMES), len(features_scaled))
+    rotulos, centroides_janela = _ajustar_kmeans(features_scaled, None if centroides is None or len(centroides) < n_clusters else centroides)
+    dados_corretores, _, _ = _ordenar_clusters(dados_corretores, rotulos, centroides_janela)
+    return dados_corretores[['corretor', 'cluster', 'perfil_corretor']]
+
+def _executar_janelas(tarefas):
+    """Executa _segmentar_janela para cada (dados_corretores, centroides), no pool se o volume justificar."""
+    total_corretores = sum(len(dados_corretores) for dados_corretores, _ in tarefas)
+    if PROCESSOS_SEGMENTACAO > 1 and len(tarefas) > 1 and total_corretores >= MINIMO_PARALELO_SEGMENTACAO:
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        from concurrent.futures.process import BrokenProcessPool
+        try:
+            with ProcessPoolExecutor(max_workers=min(PROCESSOS_SEGMENTACAO, len(tarefas)),
+                                     mp_context=multiprocessing.get_context('spawn')) as pool:
+                return list(pool.map(_segmentar_janela, *zip(*tarefas)))
+        except (OSError, BrokenProcessPool) as e:
+            avisar('warning', f"Não foi possível segmentar as janelas em paralelo ({e}); calculando em série.")
+    return [_segmentar_janela(dados_corretores, centroides) for dados_corretores, centroides in tarefas]
+
+class SegmentacaoTemporal:
+    """Personas de cada corretor em janelas móveis, com a matriz de transição entre períodos consecutivos."""
+
+    def __init__(self, indice, periodicidade, meses_janela, centroides):
+        datas = indice.df['data_vigencia'].dropna()
+        self.periodos = pd.DatetimeIndex([])
+        if not datas.empty:
+            # Períodos fechados ou em andamento, a partir do primeiro em que a janela já tem dados
+            self.periodos = pd.date_range(datas.min().normalize() + PERIODICIDADES_SEGMENTACAO[periodicidade],
+                                          datas.max().normalize() + PERIODICIDADES_SEGMENTACAO[periodicidade],
+                                          freq=PERIODICIDADES_SEGMENTACAO[periodicidade])
+        periodos, tarefas = [], []
+        for fim in self.periodos:
+            inicio = fim - pd.DateOffset(months=meses_janela) + pd.Timedelta(days=1)
+            dados_corretores = _dados_segmentacao(indice.linhas(indice.filtrar({}, inicio, fim)))
+            if dados_corretores is not None:
+                periodos.append(fim)
+                tarefas.append((dados_corretores, centroides))
+        with medir('segmentacao_temporal'):
+            resultados = _executar_janelas(tarefas)
+        self.historico = pd.concat([r.assign(periodo=p) for p, r in zip(periodos, resultados)], ignore_index=True) if resultados else \
+            pd.DataFrame(columns=['corretor', 'cluster', 'perfil_corretor', 'periodo'])
+        self.periodos = pd.DatetimeIndex(periodos)
+        self._posicoes = self.historico.groupby('corretor', observed=True, sort=False).indices
+
+    def historico_corretor(self, corretor):
+        """Persona do corretor em cada período segmentado (NaN onde ele não tinha vendas suficientes)."""
+        linhas = self.historico.iloc[self._posicoes.get(corretor, np.array([], dtype=np.intp))]
+        return linhas.set_index('periodo')['perfil_corretor'].reindex(self.periodos)
+
+    def transicoes(self):
+        """Quantos corretores passaram de cada persona (linhas) para cada persona (colunas) entre períodos consecutivos."""
+        proximo = dict(zip(self.periodos[:-1], self.periodos[1:]))
+        atual = self.historico.assign(periodo=self.historico['periodo'].map(proximo)).dropna(subset=['periodo'])
+        pares = atual.merge(self.historico, on=['corretor', 'periodo'], suffixes=('_antes', '_depois'))
+        matriz = pd.crosstab(pares['perfil_corretor_antes'], pares['perfil_corretor_depois'])
+        return matriz.reindex(index=PERFIL_NOMES, columns=PERFIL_NOMES, fill_value=0)
+
+    def distribuicao(self):
+        """Número de corretores por persona em cada período."""
+        contagem = pd.crosstab(self.historico['periodo'], self.historico['perfil_corretor'])
+        return contagem.reindex(columns=PERFIL_NOMES, fill_value=0)
+
+@cache_contado(st.cache_resource, show_spinner=False, max_entries=4 * VERSOES_EM_CACHE)
+def segmentacao_temporal(_df_vendas, periodicidade, meses_janela, versao):
+    """Segmentação em janelas móveis da versão atual dos dados."""
+    indice = indexar_dados(_df_vendas, 'vendas', 'data_vigencia', ('supervisor', 'tipo_de_corretor'), versao)
+    return SegmentacaoTemporal(indice, periodicidade, meses_janela, servico_segmentacao(_df_vendas, versao).centroides)
+
+# --- Motor de filtros indexado ---
+# Em vez de copiar o DataFrame e aplicar máscaras a cada rerun, os dados são
+# ordenados uma vez pela coluna de data. A janela de datas vira um intervalo de
+# posições obtido por busca binária, e cada valor das dimensões filtráveis tem
+# seu array de posições pré-calculado. Filtrar é só cortar e intersectar arrays
+# de inteiros; as páginas recebem uma fatia (sem cópia) quando não há filtro
+# de dimensão.
+class IndiceFiltro:
+    """Dados ordenados por data com posições pré-calculadas por valor de cada dimensão."""
+
+    def __init__(self, df, coluna_data, dimensoes):
+        ordem = np.argsort(df[coluna_data].to_numpy(), kind='stable')
+        self.df = df.iloc[ordem]
+        self.coluna_data = coluna_data
+        self.datas = self.df[coluna_data].to_numpy()
+        self.posicoes = {col: self.df.groupby(col, observed=True, sort=False).indices for col in dimensoes}
+
+    @medir('filtro')
+    def filtrar(self, filtros, data_inicio=None, data_fim=None):
+        """Retorna as posições (ordenadas) das linhas que atendem aos filtros; valores None são ignorados."""
+        inicio = 0
+        fim = len(self.datas)
+        if data_inicio is not None:
+            inicio = np.searchsorted(self.datas, np.datetime64(pd.Timestamp(data_inicio)), side='left')
+        if data_fim is not None:
+            # Inclui o dia inteiro de data_fim, como a comparação por .dt.date fazia
+            fim = np.searchsorted(self.datas, np.datetime64(pd.Timestamp(data_fim) + pd.Timedelta(days=1)), side='left')
+        resultado = None
+        for col, valor in filtros.items():
+            if valor is None:
+                continue
+            posicoes = self.posicoes[col].get(valor, np.empty(0, dtype=np.intp))
+            posicoes = posicoes[np.searchsorted(posicoes, inicio):np.searchsorted(posicoes, fim)]
+            resultado = posicoes if resultado is None else np.intersect1d(resultado, posicoes, assume_unique=True)
+        if resultado is None:
+            return slice(inicio, max(inicio, fim))
+        return resultado
+
+    def linhas(self, posicoes):
+        """Linhas correspondentes às posições; um slice devolve uma fatia sem cópia."""
+        return self.df.iloc[posicoes]
+
+@cache_contado(st.cache_resource, show_spinner=False, max_entries=2 * VERSOES_EM_CACHE)
+def indexar_dados(_df, nome, coluna_data, dimensoes, versao):
+    """Constrói o IndiceFiltro de um DataFrame uma única vez por versão dos dados."""
+    return IndiceFiltro(_df, coluna_data, list(dimensoes))
+
+# --- Cubo mensal de vendas ---
+# Vendas pré-agregadas por mês x supervisor x tipo x corretor x operadora x plano.
+# Os KPIs e gráficos da Visão Geral são respondidos somando fatias do cubo.
+# As funções de agregação abaixo aceitam tanto o cubo quanto as linhas brutas
+# convertidas por fatos_de_linhas, que é o caminho usado quando o filtro de data
+# não cobre meses inteiros.
+DIMENSOES_CUBO = ['supervisor', 'tipo_de_corretor', 'corretor', 'operadora', 'plano']
+
+def _fim_do_mes(datas):
+    """Rótulo do mês no mesmo padrão do resample('M'): último dia do mês, à meia-noite."""
+    return datas.dt.normalize() + pd.offsets.MonthEnd(0)
+
+@medir('agregacao_linhas')
+def fatos_de_linhas(df):
+    """Converte linhas de vendas para o formato do cubo (uma venda por linha)."""
+    return pd.DataFrame({
+        'mes': _fim_do_mes(df['data_vigencia']),
+        **{col: df[col] for col in DIMENSOES_CUBO},
+        'valor_total': df['valor_proposta'],
+        'num_vendas': 1,
+    })
+
+def _agregar_cubo(fatos):
+    """Soma fatos (linhas ou fatias de cubo) por mês e dimensões."""
+    return fatos.groupby(['mes'] + DIMENSOES_CUBO, observed=True, dropna=False, sort=True).agg(
+        valor_total=('valor_total', 'sum'),
+        num_vendas=('num_vendas', 'sum'),
+    ).reset_index()
+
+@cache_contado(st.cache_resource, show_spinner=False, max_entries=VERSOES_EM_CACHE)
+def construir_cubo_vendas(_df_vendas, versao):
+    """Monta o cubo mensal de vendas uma única vez por versão dos dados."""
+    cubo = artefato_instantaneo('cubo_vendas', versao)
+    if cubo is not None:
+        return cubo
+    if MODO_INCREMENTAL:
+        return repositorio_incremental().agregados['cubo']
+    return _agregar_cubo(fatos_de_linhas(_df_vendas))
+
+@cache_contado(st.cache_resource, show_spinner=False, max_entries=VERSOES_EM_CACHE)
+def indexar_cubo_vendas(_df_vendas, versao):
+    """IndiceFiltro sobre o cubo mensal, por mês, supervisor e tipo de corretor."""
+    return IndiceFiltro(construir_cubo_vendas(_df_vendas, versao), 'mes', ['supervisor', 'tipo_de_corretor'])
+
+@medir('cubo')
+def fatiar_cubo(indice_cubo, filtros, data_inicio, data_fim, data_min, data_max):
+    """Retorna a fatia do cubo para os filtros, ou None se o período corta algum mês ao meio."""
+    # Os meses do cubo são rotulados à meia-noite: o horário de data_min/data_max não pode excluir o mês das pontas
+    inicio, fim = pd.Timestamp(data_inicio).normalize(), pd.Timestamp(data_fim).normalize()
+    inicio_alinhado = inicio <= data_min or inicio.is_month_start
+    fim_alinhado = fim >= pd.Timestamp(data_max).normalize() or fim.is_month_end
+    if not (inicio_alinhado and fim_alinhado):
+        return None
+    posicoes = indice_cubo.filtrar(filtros, inicio + pd.offsets.MonthEnd(0), fim + pd.offsets.MonthEnd(0))
+    return indice_cubo.linhas(posicoes)
+
+def resumo_vendas(fatos):
+    """Total, número de vendas, ticket médio e corretores ativos de uma fatia do cubo."""
+    total_vendas = fatos['valor_total'].sum()
+    num_vendas = int(fatos['num_vendas'].sum())
+    return {
+        'total_vendas': total_vendas,
+        'num_vendas': num_vendas,
+        'ticket_medio': total_vendas / num_vendas if num_vendas > 0 else 0,
+        'corretores_ativos': fatos['corretor'].nunique(),
+    }
+
+# Séries por dia, semana ou mês. Cada período é rotulado pelo dia, pela
+# segunda-feira da semana ou pelo último dia do mês (como o resample('M')), e os
+# períodos sem registro entram com zero. O cubo só responde a granularidade mensal;
+# dia e semana somam as linhas filtradas.
+FREQUENCIAS_PERIODO = {'dia': 'D', 'semana': 'W-MON', 'mes': pd.offsets.MonthEnd()}
+
+def rotulo_periodo(datas, granularidade):
+    """Rótulo do período ('dia', 'semana' ou 'mes') de cada data."""
+    dias = datas.dt.normalize()
+    if granularidade == 'semana':
+        return dias - pd.to_timedelta(dias.dt.dayofweek, unit='D')
+    if granularidade == 'mes':
+        return dias + pd.offsets.MonthEnd(0)
+    return dias
+
+def _preencher_periodos(serie, granularidade='mes'):
+    """Completa uma série indexada pelo rótulo do período com zero nos períodos ausentes."""
+    if serie.empty:
+        return serie.rename_axis(granularidade)
+    periodos = pd.date_range(serie.index.min(), serie.index.max(), freq=FREQUENCIAS_PERIODO[granularidade])
+    return serie.reindex(periodos, fill_value=0).rename_axis(granularidade)
+
+def serie_por_periodo(datas, valores, granularidade):
+    """Soma de `valores` por período das `datas`, com os períodos sem registro preenchidos com zero."""
+    serie = valores.groupby(rotulo_periodo(datas, granularidade).to_numpy()).sum()
+    return _preencher_periodos(serie, granularidade)
+
+def vendas_mensais(fatos):
+    """Série mensal de vendas, com os meses sem venda preenchidos com zero."""
+    return _preencher_periodos(fatos.groupby('mes')['valor_total'].sum())
+
+def vendas_por(fatos, dimensao):
+    """Total de vendas por valor de uma dimensão do cubo (corretor, plano, operadora...)."""
+    return fatos.groupby(dimensao, observed=True)['valor_total'].sum()
+
+# --- Atualização incremental ---
+# Com DASHBOARD_INCREMENTAL=1, os dados ficam num repositório compartilhado pelo
+# servidor e cada chamada de load_data só processa o que mudou. Vendas, comissões
+# e inativos crescem por acréscimo no fim do arquivo. Guardamos quantos bytes já
+# foram lidos e conferimos o final do trecho já processado, para ler só as linhas
+# novas. No PostgreSQL, a marca d'água (maior data carregada) limita a consulta.
+# As linhas do dia da marca são relidas, porque ainda podem receber registros.
+# Os agregados (cubo mensal, totais por corretor usados na segmentação e nos
+# comparativos) recebem só a contribuição do delta. As contas a pagar mudam de
+# status e por isso são relidas inteiras quando o arquivo muda. Como no DadosLazy,
+# cada conjunto só é lido (e depois acompanhado) quando alguma página o pede.
+MODO_INCREMENTAL = os.environ.get('DASHBOARD_INCREMENTAL', '0') == '1'
+INTERVALO_BANCO_SEGUNDOS = 300
+_TAMANHO_CAUDA = 64 * 1024
+
+DATASETS_INCREMENTAIS = {
+    'vendas': ('data/vendas.csv', 'data_vigencia', _parse_vendas),
+    'pagamentos': ('data/comissao.csv', 'data_baixa', _parse_pagamentos),
+    'inativos': ('data/corretores_inativos.csv', 'data', _parse_inativos),
+}
+
+def _hash_cauda(caminho, offset):
+    """Hash dos últimos bytes já processados, para detectar se o início do arquivo foi reescrito."""
+    with open(caminho, 'rb') as f:
+        f.seek(max(0, offset - _TAMANHO_CAUDA))
+        return hashlib.sha256(f.read(offset - max(0, offset - _TAMANHO_CAUDA))).hexdigest()
+
+def _ler_acrescimo(caminho, offset, parser):
+    """Lê só as linhas acrescentadas depois de `offset` (reaproveitando o cabeçalho), ou None se não for possível."""
+    with open(caminho, 'rb') as f:
+        cabecalho = f.readline()
+        f.seek(offset - 1)
+        if f.read(1) != b'\n':
+            return None
+        novo = f.read()
+    return parser(io.BytesIO(cabecalho + novo)), offset + len(novo)
+
+def _agregados_vendas(df):
+    """Cubo mensal e totais por id de corretor (entradas das médias de comparação) de um bloco de vendas."""
+    return {
+        'cubo': _agregar_cubo(fatos_de_linhas(df)),
+        'vendas_corretor': df.groupby('id_corretor')['valor_proposta'].agg(total_vendas='sum', num_vendas='count'),
+    }
+
+def _agregados_pagamentos(df):
+    return {'comissoes_corretor': df.groupby('id_corretor')['amount_to_pay'].sum()}
+
+def _combinar_agregados(atual, delta, sinal=1):
+    """Soma (ou subtrai, com sinal=-1) a contribuição de um delta aos agregados existentes."""
+    resultado = dict(atual)
+    for nome, valor in delta.items():
+        if nome == 'cubo':
+            valor = valor.assign(valor_total=sinal * valor['valor_total'], num_vendas=sinal * valor['num_vendas'])
+            cubo = _agregar_cubo(_concatenar([atual['cubo'], valor]))
+            resultado['cubo'] = cubo[cubo['num_vendas'] != 0].reset_index(drop=True)
+        elif nome == 'vendas_corretor':
+            combinado = atual[nome].add(sinal * valor, fill_value=0)
+            combinado['num_vendas'] = combinado['num_vendas'].astype(int)
+            resultado[nome] = combinado[combinado['num_vendas'] != 0]
+        else:
+            resultado[nome] = atual[nome].add(sinal * valor, fill_value=0)
+    return resultado
+
+def _alinhar_dimensoes(frames, delta, colunas):
+    """Acrescenta aos dicionários compartilhados os valores novos do delta, sem recodificar o histórico."""
+    for col in colunas:
+        presentes = [nome for nome, df in frames.items() if col in df.columns and isinstance(df[col].dtype, pd.CategoricalDtype)]
+        if col not in delta.columns or not presentes:
+            continue
+        categorias = frames[presentes[0]][col].cat.categories
+        novos = sorted(set(delta[col].dropna().unique()) - set(categorias))
+        if novos:
+            for nome in presentes:
+                frames[nome][col] = frames[nome][col].cat.add_categories(novos)
+        delta[col] = delta[col].astype(frames[presentes[0]][col].dtype)
+    return delta
+
+class RepositorioIncremental:
+    """Conjuntos de dados e agregados mantidos em memória e atualizados por delta.
+
+    Cada conjunto só é lido quando pedido pela primeira vez (conjuntos()); comissões e
+    inativos levam as vendas junto, porque são alinhados aos ids delas. Só os conjuntos
+    já lidos são acompanhados em atualizar(). A falta de um arquivo fica restrita ao
+    seu conjunto, como nos carregadores sob demanda: ele vira None (inativos: DataFrame
+    vazio), o aviso fica em `avisos` e o conjunto é lido quando o arquivo aparecer.
+    """
+
+    def __init__(self):
+        self._trava = threading.RLock()
+        self.versao = 0
+        self.frames = {}
+        self.estado = {}
+        self.avisos = {}
+        self.agregados = {}
+        self.usa_banco = False
+        self._ultima_consulta_banco = 0.0
+
+    def conjuntos(self, nomes):
+        """Os conjuntos indicados ({nome: DataFrame ou None}), lendo os que ainda não foram lidos."""
+        with self._trava:
+            for nome in nomes:
+                if nome not in self.frames:
+                    self._carregar(nome)
+            return {nome: self.frames[nome] for nome in nomes}
+
+    def _carregar(self, nome):
+        if nome in CONJUNTOS_CORRETORES and nome != 'vendas' and 'vendas' not in self.frames:
+            self._carregar('vendas')
+            if nome in self.frames:
+                return  # vieram juntas do banco
+        if nome == 'contas_pagar':
+            self._carregar_contas_pagar()
+        elif nome == 'vendas' and FONTE_DADOS == 'postgres' and self._carregar_banco():
+            pass
+        else:
+            self._carregar_arquivo(nome)
+
+    def _carregar_banco(self):
+        """Vendas e comissões do PostgreSQL, juntas; False (com o aviso) se o banco estiver indisponível."""
+        try:
+            with conexao_postgres() as conexao:
+                df_vendas, df_pagamentos = carregar_fonte_banco(conexao)
+        except Exception as e:
+            with coletar_avisos() as self.avisos['vendas']:
+                avisar('warning', f"Não foi possível ler os dados do banco ({e}). Usando os arquivos CSV.")
+            return False
+        self.usa_banco = True
+        self._ultima_consulta_banco = time.time()
+        self.avisos['vendas'] = self.avisos['pagamentos'] = []
+        self._instalar('vendas', df_vendas)
+        self._instalar('pagamentos', df_pagamentos)
+        return True
+
+    def _carregar_arquivo(self, nome):
+        caminho, _, parser = DATASETS_INCREMENTAIS[nome]
+        with coletar_avisos() as avisos:
+            if nome == 'inativos':
+                df = _ler_inativos()
+            else:
+                df = _carregar_conjunto(lambda: _carregar_com_cache(caminho, parser), DIMENSOES_CORRETORES)
+        self.avisos[nome] = self.avisos.get(nome, []) + avisos
+        try:
+            stat = os.stat(caminho)
+            self.estado[nome] = {'offset': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'cauda': _hash_cauda(caminho, stat.st_size)}
+        except FileNotFoundError:
+            # Sem estado: o conjunto é lido de novo quando o arquivo aparecer
+            self.estado[nome] = None
+        self._instalar(nome, df)
+
+    def _instalar(self, nome, df):
+        """Guarda um conjunto de corretores recém-lido, com os ids das vendas e os dicionários dos já carregados."""
+        if df is not None:
+            if nome != 'vendas' and self.frames.get('vendas') is not None:
+                alinhar_entidades(self.frames['vendas'], [df])
+            if MODO_COMPACTO:
+                compactar_dimensoes(self._frames_corretores() + [df], DIMENSOES_CORRETORES)
+            if nome == 'vendas':
+                self.agregados = {**self.agregados, **_agregados_vendas(df)}
+            elif nome == 'pagamentos':
+                self.agregados = {**self.agregados, **_agregados_pagamentos(df)}
+        self.frames[nome] = df
+
+    def _frames_corretores(self):
+        return [self.frames[nome] for nome in CONJUNTOS_CORRETORES if self.frames.get(nome) is not None]
+
+    def _recarregar(self):
+        """Relê do zero os conjuntos já lidos (um arquivo foi reescrito ou apareceu)."""
+        carregados = [nome for nome in LEITORES if nome in self.frames]
+        self.frames, self.estado, self.avisos, self.agregados = {}, {}, {}, {}
+        self.usa_banco = False
+        self.conjuntos(carregados)
+        self.versao += 1
+
+    def _carregar_contas_pagar(self):
+        caminho = 'data/contas_a_pagar_set24_set25.csv'
+        with coletar_avisos() as self.avisos['contas_pagar']:
+            self.frames['contas_pagar'] = _carregar_conjunto(lambda: _ler_contas_pagar(caminho), DIMENSOES_FINANCEIRO)
+        try:
+            stat = os.stat(caminho)
+        except FileNotFoundError:
+            self.estado['contas_pagar'] = None
+            return
+        self.estado['contas_pagar'] = {'mtime_ns': stat.st_mtime_ns, 'tamanho': stat.st_size}
+
+    def marca_dagua(self, nome):
+        """Maior data já carregada de um conjunto de dados."""
+        return self.frames[nome][DATASETS_INCREMENTAIS[nome][1]].max()
+
+    def _nomes_em_arquivo(self):
+        nomes = ['inativos'] if self.usa_banco else list(DATASETS_INCREMENTAIS)
+        return [nome for nome in nomes if nome in self.frames]
+
+    def _anexar(self, nome, delta):
+        if nome != 'vendas' and self.frames.get('vendas') is not None:
+            alinhar_entidades(self.frames['vendas'], [delta])
+        delta = _alinhar_dimensoes({n: df for n, df in self.frames.items() if df is not None}, delta, DIMENSOES_CORRETORES)
+        self.frames[nome] = pd.concat([self.frames[nome], delta], ignore_index=True)
+        if nome == 'vendas':
+            self.agregados = _combinar_agregados(self.agregados, _agregados_vendas(delta))
+        elif nome == 'pagamentos':
+            self.agregados = _combinar_agregados(self.agregados, _agregados_pagamentos(delta))
+
+    def _remover_desde(self, nome, data):
+        """Remove (e desconta dos agregados) as linhas com data >= `data`, que serão relidas do banco."""
+        df = self.frames[nome]
+        removidas = df[df[DATASETS_INCREMENTAIS[nome][1]] >= data]
+        if removidas.empty:
+            return
+        self.frames[nome] = df.drop(removidas.index).reset_index(drop=True)
+        calcular = _agregados_vendas if nome == 'vendas' else _agregados_pagamentos
+        self.agregados = _combinar_agregados(self.agregados, calcular(removidas), sinal=-1)
+
+    def _atualizar_arquivo(self, nome):
+        caminho, _, parser = DATASETS_INCREMENTAIS[nome]
+        estado = self.estado[nome]
+        try:
+            stat = os.stat(caminho)
+        except FileNotFoundError:
+            return False  # o arquivo sumiu: continua valendo o que já foi lido
+        if estado is None:
+            # O arquivo apareceu: os demais conjuntos precisam ser alinhados a ele
+            self._recarregar()
+            return True
+        if stat.st_mtime_ns == estado['mtime_ns'] and stat.st_size == estado['offset']:
+            return False
+        lido = None
+        if stat.st_size > estado['offset'] and _hash_cauda(caminho, estado['offset']) == estado['cauda']:
+            lido = _ler_acrescimo(caminho, estado['offset'], parser)
+        if lido is None:
+            # O arquivo foi reescrito (não só acrescido): não há como aproveitar o que já foi lido
+            self._recarregar()
+            return True
+        delta, offset = lido
+        self._anexar(nome, delta)
+        self.estado[nome] = {'offset': offset, 'mtime_ns': stat.st_mtime_ns, 'cauda': _hash_cauda(caminho, offset)}
+        return True
+
+    def _atualizar_banco(self):
+        if time.time() - self._ultima_consulta_banco < INTERVALO_BANCO_SEGUNDOS:
+            return False
+        desde = min(self.marca_dagua('vendas'), self.marca_dagua('pagamentos'))
+        with conexao_postgres() as conexao:
+            df_vendas, df_pagamentos = carregar_fonte_banco(conexao, desde=desde)
+        self._ultima_consulta_banco = time.time()
+        for nome, delta in (('vendas', df_vendas), ('pagamentos', df_pagamentos)):
+            self._remover_desde(nome, desde)
+            self._anexar(nome, delta)
+        return True
+
+    def atualizar(self):
+        """Incorpora o que mudou nas fontes desde a última chamada."""
+        with self._trava:
+            mudou = False
+            for nome in self._nomes_em_arquivo():
+                mudou = self._atualizar_arquivo(nome) or mudou
+            if self.usa_banco:
+                try:
+                    mudou = self._atualizar_banco() or mudou
+                except Exception as e:
+                    avisar('warning', f"Não foi possível atualizar os dados do banco ({e}).")
+            if 'contas_pagar' in self.frames:
+                mudou = self._atualizar_contas_pagar() or mudou
+            if mudou:
+                self.versao += 1
+
+    def _atualizar_contas_pagar(self):
+        try:
+            stat = os.stat('data/contas_a_pagar_set24_set25.csv')
+        except FileNotFoundError:
+            return False  # o arquivo sumiu: continua valendo o que já foi lido
+        estado = self.estado['contas_pagar']
+        if estado is not None and (stat.st_mtime_ns, stat.st_size) == (estado['mtime_ns'], estado['tamanho']):
+            return False
+        self._carregar_contas_pagar()
+        return True
+
+@st.cache_resource(show_spinner=False)
+def repositorio_incremental():
+    """Repositório incremental único por processo do servidor."""
+    return RepositorioIncremental()
+
+@cache_contado(st.cache_resource, show_spinner=False, max_entries=VERSOES_EM_CACHE)
+def agregados_dados(_df_vendas, _df_pagamentos, versao):
+    """Totais por corretor (vendas e comissões) e cubo mensal da versão atual dos dados."""
+    if artefato_instantaneo('cubo_vendas', versao) is not None:
+        return {
+            'cubo': artefato_instantaneo('cubo_vendas', versao),
+            'vendas_corretor': artefato_instantaneo('vendas_corretor', versao),
+            'comissoes_corretor': artefato_instantaneo('comissoes_corretor', versao).squeeze(axis='columns'),
+        }
+    if MODO_INCREMENTAL:
+        return repositorio_incremental().agregados
+    return {**_agregados_vendas(_df_vendas), **_agregados_pagamentos(_df_pagamentos)}
+
+# --- Matriz de atividade ---
+# Cada corretor da base (vendas e inativos pelo id_corretor, no tipo em que aparece
+# primeiro) é uma linha e cada mês é uma coluna de dois bitmaps compactados com np.packbits: "vendeu
+# no mês" e "teve registro de inatividade no mês" (1 bit por corretor x mês). A base
+# de corretores, os inativos do período, a taxa de atividade por tipo, a linha do
+# tempo de status e a retenção por coorte saem de operações vetorizadas sobre eles.
+class MatrizAtividade:
+    """Bitmaps corretor x mês de vendas e de inatividade, montados uma vez por versão dos dados."""
+
+    def __init__(self, df_vendas, df_inativos):
+        colunas = ['id_corretor', 'corretor', 'tipo_de_corretor']
+        # Conjuntos vazios (ex.: sem arquivo de inativos) ficam fora dos concats
+        base = pd.concat([df[colunas] for df in (df_vendas, df_inativos) if not df.empty] or [df_vendas[colunas]])
+        self.base = base[base['id_corretor'].notna()].drop_duplicates(subset='id_corretor').reset_index(drop=True)
+        self._indice = pd.Index(self.base['id_corretor'])
+        datas = pd.concat([serie for serie in (df_vendas['data_vigencia'], df_inativos['data']) if not serie.empty]
+                          or [df_vendas['data_vigencia']]).dropna()
+        if datas.empty:
+            self.meses = pd.DatetimeIndex([])
+        else:
+            self.meses = pd.date_range(datas.min().to_period('M').to_timestamp(), datas.max(), freq='MS')
+        self.data_min, self.data_max = df_vendas['data_vigencia'].min(), df_vendas['data_vigencia'].max()
+        self._vendeu = self._bitmap(df_vendas['id_corretor'], df_vendas['data_vigencia'])
+        self._inativo = self._bitmap(df_inativos['id_corretor'], df_inativos['data'])
+
+    def _bitmap(self, ids, datas):
+        linhas = self._indice.get_indexer(ids)
+        colunas = self.meses.get_indexer(datas.dt.to_period('M').dt.to_timestamp())
+        validas = (linhas >= 0) & (colunas >= 0)
+        bits = np.zeros((len(self._indice), len(self.meses)), dtype=bool)
+        bits[linhas[validas], colunas[validas]] = True
+        return np.packbits(bits, axis=1)
+
+    def _colunas(self, data_inicio, data_fim):
+        """Intervalo [c0, c1) das colunas dos meses que tocam a janela de datas (None = sem limite)."""
+        c0 = 0 if data_inicio is None else self.meses.searchsorted(pd.Timestamp(data_inicio).to_period('M').to_timestamp())
+        c1 = len(self.meses) if data_fim is None else self.meses.searchsorted(pd.Timestamp(data_fim), side='right')
+        return c0, max(c0, c1)
+
+    @staticmethod
+    def _bits(bitmap, c0, c1):
+        """Desempacota só os bytes que cobrem as colunas [c0, c1)."""
+        b0 = c0 // 8
+        return np.unpackbits(bitmap[:, b0:(c1 + 7) // 8], axis=1)[:, c0 - 8 * b0:c1 - 8 * b0].astype(bool)
+
+    def ativos_no_periodo(self, data_inicio, data_fim):
+        """Máscara (por corretor da base) de quem vendeu no período, ou None se o período corta algum mês ao meio."""
+        inicio, fim = pd.Timestamp(data_inicio), pd.Timestamp(data_fim)
+        inicio_alinhado = inicio <= self.data_min or inicio.is_month_start
+        fim_alinhado = fim >= self.data_max.normalize() or fim.is_month_end
+        if not (inicio_alinhado and fim_alinhado):
+            return None
+        return self._bits(self._vendeu, *self._colunas(inicio, fim)).any(axis=1)
+
+    def mascara(self, corretores):
+        """Máscara (por corretor da base) dos corretores informados pelo nome."""
+        return self.base['corretor'].astype(object).isin(pd.Index(corretores).astype(object)).to_numpy()
+
+    def atividade_por_tipo(self, ativos):
+        """Corretores da base, ativos e taxa de atividade (%) por tipo, dada a máscara de ativos."""
+        df = pd.DataFrame({'tipo_de_corretor': self.base['tipo_de_corretor'], 'ativos': ativos})
+        resumo = df.groupby('tipo_de_corretor', observed=True)['ativos'].agg(num_corretores='size', ativos='sum').reset_index()
+        resumo['taxa_atividade'] = resumo['ativos'] / resumo['num_corretores'] * 100
+        return resumo
+
+    def status(self, id_corretor, data_inicio=None, data_fim=None):
+        """Linha do tempo mensal do corretor: 1 ativo (vendeu), -1 inativo, 0 sem registro."""
+        c0, c1 = self._colunas(data_inicio, data_fim)
+        linha = self._indice.get_indexer([id_corretor])[0] if id_corretor is not None else -1
+        if linha < 0:
+            return pd.Series(np.zeros(c1 - c0, dtype=np.int8), index=self.meses[c0:c1])
+        vendeu = self._bits(self._vendeu[linha:linha + 1], c0, c1)[0]
+        inativo = self._bits(self._inativo[linha:linha + 1], c0, c1)[0]
+        return pd.Series(np.where(vendeu, 1, np.where(inativo, -1, 0)).astype(np.int8), index=self.meses[c0:c1])
+
+    def coortes(self, linhas=None):
+        """Retenção por coorte do mês da primeira venda: % dos corretores que venderam k meses depois.
+
+        Devolve a tabela de retenção (coorte x k) e, por coorte, o número de corretores e a
+        permanência média em meses (da primeira à última venda). `linhas` restringe a base.
+        """
+        n_meses = len(self.meses)
+        vendeu = self._bits(self._vendeu, 0, n_meses)
+        if linhas is not None:
+            vendeu = vendeu[linhas]
+        vendeu = vendeu[vendeu.any(axis=1)]
+        primeira = vendeu.argmax(axis=1)
+        ultima = n_meses - 1 - vendeu[:, ::-1].argmax(axis=1)
+        # Realinha cada linha para começar no mês da primeira venda (k = 0, 1, 2...)
+        colunas = primeira[:, None] + np.arange(n_meses)[None, :]
+        dentro = colunas < n_meses
+        alinhado = vendeu[np.arange(len(vendeu))[:, None], np.minimum(colunas, n_meses - 1)] & dentro
+        ativos = np.zeros((n_meses, n_meses), dtype=np.int64)
+        np.add.at(ativos, primeira, alinhado)
+        tamanho = np.bincount(primeira, minlength=n_meses)
+        permanencia = np.bincount(primeira, weights=ultima - primeira + 1, minlength=n_meses)
+        com_coorte = tamanho > 0
+        with np.errstate(invalid='ignore', divide='ignore'):
+            retencao = ativos / tamanho[:, None] * 100
+        # Meses além do fim dos dados ainda não aconteceram para a coorte
+        retencao[np.arange(n_meses)[:, None] + np.arange(n_meses)[None, :] >= n_meses] = np.nan
+        retencao = pd.DataFrame(retencao[com_coorte], index=self.meses[com_coorte].rename('coorte'))
+        resumo = pd.DataFrame({
+            'corretores': tamanho[com_coorte],
+            'permanencia_media': permanencia[com_coorte] / tamanho[com_coorte],
+        }, index=retencao.index)
+        return retencao, resumo
+
+@cache_contado(st.cache_resource, show_spinner=False, max_entries=VERSOES_EM_CACHE)
+def matriz_atividade(_df_vendas, _df_inativos, versao):
+    """Matriz de atividade da versão atual dos dados."""
+    return MatrizAtividade(_df_vendas, _df_inativos)
+
+# --- Perfis de corretores ---
+# A página de análise individual trocava de corretor refazendo máscaras sobre
+# três tabelas e os agregados globais. Aqui tudo é calculado uma vez por versão
+# dos dados: as posições das linhas de cada corretor em cada conjunto, as séries
+# mensais de vendas e comissões, a linha do tempo de status (da matriz de
+# atividade), a persona da segmentação e as médias globais de comparação. Trocar de
+# corretor vira uma consulta.
+def _serie_mensal(df, coluna_data, coluna_valor):
+    """Soma mensal (fim de mês) por corretor, com índice (id_corretor, mês)."""
+    return df.groupby(['id_corretor', pd.Grouper(key=coluna_data, freq=pd.offsets.MonthEnd())], observed=True)[coluna_valor].sum()
+
+def _mensal_do_corretor(serie, id_corretor):
+    """Série mensal contínua do corretor (meses sem registro valem 0), como um resample faria."""
+    if id_corretor not in serie.index.get_level_values(0):
+        return pd.Series(dtype=float, index=pd.DatetimeIndex([]))
+    valores = serie.xs(id_corretor, level=0)
+    meses = pd.date_range(valores.index.min(), valores.index.max(), freq=pd.offsets.MonthEnd())
+    return valores.reindex(meses, fill_value=0)
+
+class PerfisCorretores:
+    """Perfis pré-calculados de todos os corretores e médias globais de comparação."""
+
+    def __init__(self, df_vendas, df_pagamentos, df_inativos, agregados, df_segmentado, matriz):
+        self.df_vendas = df_vendas
+        self.df_pagamentos = df_pagamentos
+        self.df_inativos = df_inativos
+        self.corretores = sorted(df_vendas['corretor'].unique())
+        # Os conjuntos se relacionam pelo id_corretor; o nome (canônico) só entra na seleção da página
+        primeiras = df_vendas['id_corretor'].dropna().drop_duplicates()
+        self.ids = dict(zip(df_vendas.loc[primeiras.index, 'corretor'].astype(object), primeiras))
+        self.posicoes = {
+            'vendas': df_vendas.groupby('id_corretor', sort=False).indices,
+            'pagamentos': df_pagamentos.groupby('id_corretor', sort=False).indices,
+            'inativos': df_inativos.groupby('id_corretor', sort=False).indices,
+        }
+        self.vendas_mensais = _serie_mensal(df_vendas, 'data_vigencia', 'valor_proposta')
+        self.comissoes_mensais = _serie_mensal(df_pagamentos, 'data_baixa', 'amount_to_pay')
+
+        # --- Médias globais ---
+        self.vendas_corretor = agregados['vendas_corretor']
+        self.comissoes_corretor = agregados['comissoes_corretor']
+        self.media_ticket_geral = self.vendas_corretor['total_vendas'].sum() / self.vendas_corretor['num_vendas'].sum()
+        df_merged = pd.merge(self.vendas_corretor['total_vendas'].rename('valor_proposta'), self.comissoes_corretor, on='id_corretor', how='inner')
+        self.media_comissao_geral = (df_merged['amount_to_pay'].sum() / df_merged['valor_proposta'].sum()) * 100 if df_merged['valor_proposta'].sum() > 0 else 0
+
+        self.matriz = matriz
+
+        self.personas = {}
+        if df_segmentado is not None:
+            self.personas = dict(zip(df_segmentado['corretor'].astype(str), df_segmentado['perfil_corretor']))
+
+    def linhas(self, conjunto, corretor):
+        """Linhas do corretor num dos conjuntos de dados ('vendas', 'pagamentos' ou 'inativos')."""
+        df = getattr(self, f'df_{conjunto}')
+        return df.iloc[self.posicoes[conjunto].get(self.ids.get(corretor), np.array([], dtype=np.intp))]
+
+    def series_por_periodo(self, corretor, granularidade):
+        """Vendas e comissões do corretor por dia, semana ou mês (o mês vem das séries pré-calculadas)."""
+        if granularidade == 'mes':
+            id_corretor = self.ids.get(corretor)
+            return _mensal_do_corretor(self.vendas_mensais, id_corretor), _mensal_do_corretor(self.comissoes_mensais, id_corretor)
+        vendas, pagamentos = self.linhas('vendas', corretor), self.linhas('pagamentos', corretor)
+        return (serie_por_periodo(vendas['data_vigencia'], vendas['valor_proposta'], granularidade),
+                serie_por_periodo(pagamentos['data_baixa'], pagamentos['amount_to_pay'], granularidade))
+
+    @medir('perfil_corretor')
+    def perfil(self, corretor):
+        """Tudo o que a página de análise individual precisa sobre um corretor."""
+        id_corretor = self.ids.get(corretor)
+        df_vendas_corretor = self.linhas('vendas', corretor)
+        total_vendas = self.vendas_corretor['total_vendas'].get(id_corretor, 0)
+        num_vendas = int(self.vendas_corretor['num_vendas'].get(id_corretor, 0))
+        return {
+            'vendas': df_vendas_corretor,
+            'pagamentos': self.linhas('pagamentos', corretor),
+            'inativos': self.linhas('inativos', corretor),
+            'vendas_mensais': _mensal_do_corretor(self.vendas_mensais, id_corretor),
+            'comissoes_mensais': _mensal_do_corretor(self.comissoes_mensais, id_corretor),
+            'status': self.matriz.status(id_corretor),
+            'perfil_ml': self.personas.get(corretor, "N/A"),
+            'tipos': ", ".join(df_vendas_corretor['tipo_de_corretor'].unique()) if not df_vendas_corretor.empty else "N/A",
+            'total_vendas': total_vendas,
+            'num_vendas': num_vendas,
+            'ticket_medio': total_vendas / num_vendas if num_vendas > 0 else 0,
+            'total_comissao': self.comissoes_corretor.get(id_corretor, 0),
+        }
+
+@cache_contado(st.cache_resource, show_spinner=False, max_entries=VERSOES_EM_CACHE)
+def perfis_corretores(_df_vendas, _df_pagamentos, _df_inativos, versao):
+    """Perfis de corretores da versão atual dos dados."""
+    agregados = agregados_dados(_df_vendas, _df_pagamentos, versao)
+    df_segmentado, _ = segmenta_corretores(_df_vendas, df_base=_df_vendas)
+    return PerfisCorretores(_df_vendas, _df_pagamentos, _df_inativos, agregados, df_segmentado,
+                            matriz_atividade(_df_vendas, _df_inativos, versao))
+
+# --- Motor de consultas ---
+# As agregações das páginas (KPIs, séries mensais, top-N, desempenho por tipo e
+# totais financeiros do período) passam por um motor com a mesma interface nos dois casos.
+# O motor pandas (padrão) usa os DataFrames em memória, o cubo mensal e os índices
+# de filtro. Com DASHBOARD_MOTOR=duckdb, o DuckDB consulta direto os Parquets do
+# cache em disco: filtros e agrupamentos são executados por ele, e só o resultado
+# agregado chega ao Python. Os inativos, pequenos, são alinhados aos ids das vendas
+# ao montar o motor, como no DadosLazy. As tabelas detalhadas, a segmentação e as
+# exportações continuam usando as linhas carregadas pelo DadosLazy.
+MOTOR_CONSULTAS = os.environ.get('DASHBOARD_MOTOR', 'pandas')
+
+COLUNA_VALOR_PAGO = 'Valor total pago da parcela (R$)'
+COLUNA_JUROS = 'Juros realizado (R$)'
+
+class MotorPandas:
+    """Agregações sobre os DataFrames carregados (cubo mensal de vendas e índices de filtro)."""
+
+    def __init__(self, dados):
+        self.dados = dados
+        self._fatias = {}
+
+    def _fatia(self, nome, filtros, data_inicio, data_fim, construir):
+        # Cada página pede vários agregados com os mesmos filtros: a fatia é montada uma vez por rerun
+        chave = (nome, tuple(sorted(filtros.items())), data_inicio, data_fim)
+        if chave not in self._fatias:
+            self._fatias[chave] = construir()
+        return self._fatias[chave]
+
+    def _fatos_vendas(self, filtros, data_inicio, data_fim):
+        """Fatia do cubo mensal ou, se o período corta um mês ao meio, as linhas filtradas convertidas em fatos."""
+        def construir():
+            df_vendas = self.dados.vendas
+            versao = versao_dados()
+            data_min, data_max = df_vendas['data_vigencia'].min(), df_vendas['data_vigencia'].max()
+            inicio = data_min if data_inicio is None else data_inicio
+            fim = data_max if data_fim is None else data_fim
+            fatos = fatiar_cubo(indexar_cubo_vendas(df_vendas, versao), filtros, inicio, fim, data_min, data_max)
+            if fatos is None:
+                indice = indexar_dados(df_vendas, 'vendas', 'data_vigencia', ('supervisor', 'tipo_de_corretor'), versao)
+                fatos = fatos_de_linhas(indice.linhas(indice.filtrar(filtros, data_inicio, data_fim)))
+            return fatos
+        return self._fatia('vendas', filtros, data_inicio, data_fim, construir)
+
+    def _contas(self, filtros, data_inicio, data_fim):
+        def construir():
+            indice = indexar_dados(self.dados.contas_pagar, 'contas_pagar', 'Data de vencimento', ('Categoria 1', 'Centro de Custo 1'), versao_dados())
+            return indice.linhas(indice.filtrar(filtros, data_inicio, data_fim))
+        return self._fatia('contas_pagar', filtros, data_inicio, data_fim, construir)
+
+    def resumo_vendas(self, filtros, data_inicio=None, data_fim=None):
+        return resumo_vendas(self._fatos_vendas(filtros, data_inicio, data_fim))
+
+    def vendas_mensais(self, filtros, data_inicio=None, data_fim=None):
+        return vendas_mensais(self._fatos_vendas(filtros, data_inicio, data_fim))
+
+    def vendas_por_periodo(self, granularidade, filtros, data_inicio=None, data_fim=None):
+        """Vendas por dia, semana ou mês (os dois primeiros saem das linhas filtradas, não do cubo)."""
+        if granularidade == 'mes':
+            return self.vendas_mensais(filtros, data_inicio, data_fim)
+        indice = indexar_dados(self.dados.vendas, 'vendas', 'data_vigencia', ('supervisor', 'tipo_de_corretor'), versao_dados())
+        linhas = indice.linhas(indice.filtrar(filtros, data_inicio, data_fim))
+        return serie_por_periodo(linhas['data_vigencia'], linhas['valor_proposta'], granularidade).rename('valor_total')
+
+    def vendas_por(self, dimensao, filtros, data_inicio=None, data_fim=None):
+        return vendas_por(self._fatos_vendas(filtros, data_inicio, data_fim), dimensao)
+
+    def contagem_por(self, dimensao, filtros, data_inicio=None, data_fim=None):
+        """Número de vendas por valor da dimensão, do maior para o menor (empates em ordem alfabética)."""
+        fatos = self._fatos_vendas(filtros, data_inicio, data_fim)
+        contagem = fatos.groupby(dimensao, observed=True)['num_vendas'].sum().rename('count')
+        return contagem.sort_values(ascending=False, kind='stable')
+
+    @medir('agregacao_tipos')
+    def desempenho_por_tipo(self):
+        """Total, ticket médio e vendas por corretor de cada tipo, sobre todo o histórico (None sem vendas)."""
+        df_vendas = self.dados.vendas
+        if df_vendas is None:
+            return None
+        # Base única de corretores: cada um conta no primeiro tipo em que aparece (vendas, depois inativos)
+        df_base_corretores = matriz_atividade(df_vendas, self.dados.inativos, versao_dados()).base
+        df_vendas_por_tipo = df_vendas.groupby('tipo_de_corretor', observed=True).agg(
+            total_vendas=('valor_proposta', 'sum'),
+            ticket_medio=('valor_proposta', 'mean')
+        ).reset_index()
+        df_corretores_por_tipo = df_base_corretores.groupby('tipo_de_corretor', observed=True).agg(
+            num_corretores=('corretor', 'count')
+        ).reset_index()
+        df_desempenho = pd.merge(df_vendas_por_tipo, df_corretores_por_tipo, on='tipo_de_corretor')
+        df_desempenho['vendas_por_corretor'] = df_desempenho['total_vendas'] / df_desempenho['num_corretores']
+        return df_desempenho
+
+    def totais_financeiros(self, filtros, data_inicio=None, data_fim=None):
+        df = self._contas(filtros, data_inicio, data_fim)
+        return {'total_pago': df[COLUNA_VALOR_PAGO].sum(), 'total_juros': df[COLUNA_JUROS].sum()}
+
+    def despesas_por(self, dimensao, filtros, data_inicio=None, data_fim=None):
+        """Total pago por valor de uma dimensão do contas a pagar."""
+        return self._contas(filtros, data_inicio, data_fim).groupby(dimensao, observed=True)[COLUNA_VALOR_PAGO].sum()
+
+def _identificador_sql(nome):
+    return '"' + nome.replace('"', '""') + '"'
+
+def _literal_sql(texto):
+    return "'" + texto.replace("'", "''") + "'"
+
+class MotorDuckDB:
+    """Agregações executadas pelo DuckDB sobre os Parquets do cache, com filtros e agrupamentos no SQL."""
+
+    def __init__(self, arquivos):
+        import duckdb
+        self._conexao = duckdb.connect()
+        for tabela, caminho in arquivos.items():
+            if tabela != 'inativos':
+                self._conexao.execute(f"CREATE VIEW {tabela} AS SELECT * FROM read_parquet({_literal_sql(caminho)}, file_row_number = true)")
+        self._criar_inativos(arquivos.get('inativos'))
+
+    def _criar_inativos(self, caminho):
+        """Tabela de inativos com os corretores levados aos ids das vendas, como faz alinhar_corretores nas linhas em memória.
+
+        O Parquet do cache é gravado por arquivo, antes desse alinhamento; a referência
+        são só os pares (id, nome) distintos das vendas, lidos pelo próprio DuckDB.
+        """
+        if caminho is None:
+            # Sem arquivo de inativos: tabela vazia, como o DataFrame vazio do carregador
+            inativos = pd.DataFrame({'id_corretor': pd.Series(dtype='Int64'), 'tipo_de_corretor': pd.Series(dtype=object)})
+        else:
+            inativos = pd.read_parquet(caminho, columns=['corretor', 'tipo_de_corretor', 'id_corretor'])
+            referencia = self._conexao.execute("SELECT DISTINCT id_corretor, corretor FROM vendas WHERE id_corretor IS NOT NULL").df()
+            alinhar_entidades(referencia, [inativos])
+        inativos['linha'] = np.arange(len(inativos))
+        self._conexao.register('inativos_alinhados', inativos)
+        self._conexao.execute("CREATE TABLE inativos AS SELECT id_corretor::BIGINT AS id_corretor, tipo_de_corretor::VARCHAR AS tipo_de_corretor, linha FROM inativos_alinhados")
+        self._conexao.unregister('inativos_alinhados')
+
+    def _consultar(self, sql, parametros=()):
+        # Um cursor por consulta: a conexão é compartilhada entre as sessões do servidor
+        with medir('consulta_duckdb'):
+            cursor = self._conexao.cursor()
+            try:
+                return cursor.execute(sql, list(parametros)).df()
+            finally:
+                cursor.close()
+
+    @staticmethod
+    def _onde(filtros, coluna_data, data_inicio, data_fim, nao_nulas=()):
+        """Cláusula WHERE (e parâmetros) com a mesma semântica do IndiceFiltro: data_fim inclui o dia inteiro."""
+        condicoes, parametros = [], []
+        for col, valor in filtros.items():
+            if valor is not None:
+                condicoes.append(f"{_identificador_sql(col)} = ?")
+                parametros.append(valor)
+        if data_inicio is not None:
+            condicoes.append(f"{_identificador_sql(coluna_data)} >= ?")
+            parametros.append(pd.Timestamp(data_inicio).to_pydatetime())
+        if data_fim is not None:
+            condicoes.append(f"{_identificador_sql(coluna_data)} < ?")
+            parametros.append((pd.Timestamp(data_fim) + pd.Timedelta(days=1)).to_pydatetime())
+        condicoes += [f"{_identificador_sql(col)} IS NOT NULL" for col in nao_nulas]
+        return (" WHERE " + " AND ".join(condicoes)) if condicoes else "", parametros
+
+    def _somar_por(self, tabela, dimensao, coluna_valor, onde, parametros, nome):
+        dim = _identificador_sql(dimensao)
+        df = self._consultar(
+            f"SELECT {dim}, COALESCE(SUM({_identificador_sql(coluna_valor)}), 0) AS {_identificador_sql(nome)} FROM {tabela}{onde} GROUP BY {dim} ORDER BY {dim}",
+            parametros)
+        return df.set_index(dimensao)[nome]
+
+    # Mesmos rótulos de rotulo_periodo: date_trunc('week') começa na segunda-feira
+    ROTULOS_PERIODO = {'dia': "date_trunc('day', {})", 'semana': "date_trunc('week', {})", 'mes': "last_day({})"}
+
+    def _por_periodo(self, tabela, coluna_data, coluna_valor, onde, parametros, granularidade='mes'):
+        rotulo = self.ROTULOS_PERIODO[granularidade].format(_identificador_sql(coluna_data))
+        df = self._consultar(
+            f"SELECT {rotulo}::TIMESTAMP AS periodo, "
+            f"COALESCE(SUM({_identificador_sql(coluna_valor)}), 0) AS valor FROM {tabela}{onde} GROUP BY periodo ORDER BY periodo",
+            parametros)
+        serie = pd.Series(df['valor'].to_numpy(), index=pd.DatetimeIndex(df['periodo']).astype('datetime64[ns]'))
+        return _preencher_periodos(serie, granularidade)
+
+    def resumo_vendas(self, filtros, data_inicio=None, data_fim=None):
+        onde, parametros = self._onde(filtros, 'data_vigencia', data_inicio, data_fim)
+        linha = self._consultar(
+            f"SELECT COALESCE(SUM(valor_proposta), 0) AS total_vendas, COUNT(*) AS num_vendas, "
+            f"COUNT(DISTINCT corretor) AS corretores_ativos FROM vendas{onde}", parametros).iloc[0]
+        total_vendas, num_vendas = float(linha['total_vendas']), int(linha['num_vendas'])
+        return {
+            'total_vendas': total_vendas,
+            'num_vendas': num_vendas,
+            'ticket_medio': total_vendas / num_vendas if num_vendas > 0 else 0,
+            'corretores_ativos': int(linha['corretores_ativos']),
+        }
+
+    def vendas_mensais(self, filtros, data_inicio=None, data_fim=None):
+        onde, parametros = self._onde(filtros, 'data_vigencia', data_inicio, data_fim)
+        return self._por_periodo('vendas', 'data_vigencia', 'valor_proposta', onde, parametros).rename('valor_total')
+
+    def vendas_por_periodo(self, granularidade, filtros, data_inicio=None, data_fim=None):
+        """Vendas por dia, semana ou mês."""
+        onde, parametros = self._onde(filtros, 'data_vigencia', data_inicio, data_fim)
+        return self._por_periodo('vendas', 'data_vigencia', 'valor_proposta', onde, parametros, granularidade).rename('valor_total')
+
+    def vendas_por(self, dimensao, filtros, data_inicio=None, data_fim=None):
+        onde, parametros = self._onde(filtros, 'data_vigencia', data_inicio, data_fim, nao_nulas=[dimensao])
+        return self._somar_por('vendas', dimensao, 'valor_proposta', onde, parametros, 'valor_total')
+
+    def contagem_por(self, dimensao, filtros, data_inicio=None, data_fim=None):
+        """Número de vendas por valor da dimensão, do maior para o menor (empates em ordem alfabética)."""
+        onde, parametros = self._onde(filtros, 'data_vigencia', data_inicio, data_fim, nao_nulas=[dimensao])
+        dim = _identificador_sql(dimensao)
+        df = self._consultar(f"SELECT {dim}, COUNT(*) AS count FROM vendas{onde} GROUP BY {dim} ORDER BY count DESC, {dim}", parametros)
+        return df.set_index(dimensao)['count']
+
+    @medir('agregacao_tipos')
+    def desempenho_por_tipo(self):
+        """Total, ticket médio e vendas por corretor de cada tipo, sobre todo o histórico."""
+        return self._consultar("""
+            WITH base AS (
+                SELECT id_corretor, tipo_de_corretor, 0 AS origem, file_row_number AS linha FROM vendas
+                UNION ALL
+                SELECT id_corretor, tipo_de_corretor, 1 AS origem, linha FROM inativos
+            ), corretores AS (
+                -- cada corretor conta no primeiro tipo em que aparece (vendas, depois inativos)
+                SELECT id_corretor, tipo_de_corretor FROM base WHERE id_corretor IS NOT NULL
+                QUALIFY row_number() OVER (PARTITION BY id_corretor ORDER BY origem, linha) = 1
+            ), corretores_por_tipo AS (
+                SELECT tipo_de_corretor, COUNT(id_corretor) AS num_corretores
+                FROM corretores WHERE tipo_de_corretor IS NOT NULL GROUP BY tipo_de_corretor
+            ), vendas_por_tipo AS (
+                SELECT tipo_de_corretor, COALESCE(SUM(valor_proposta), 0) AS total_vendas, AVG(valor_proposta) AS ticket_medio
+                FROM vendas WHERE tipo_de_corretor IS NOT NULL GROUP BY tipo_de_corretor
+            )
+            SELECT tipo_de_corretor, total_vendas, ticket_medio, num_corretores,
+                   total_vendas / num_corretores AS vendas_por_corretor
+            FROM vendas_por_tipo JOIN corretores_por_tipo USING (tipo_de_corretor)
+            ORDER BY tipo_de_corretor
+        """)
+
+    def totais_financeiros(self, filtros, data_inicio=None, data_fim=None):
+        onde, parametros = self._onde(filtros, 'Data de vencimento', data_inicio, data_fim)
+        linha = self._consultar(
+            f"SELECT COALESCE(SUM({_identificador_sql(COLUNA_VALOR_PAGO)}), 0) AS total_pago, "
+            f"COALESCE(SUM({_identificador_sql(COLUNA_JUROS)}), 0) AS total_juros FROM contas_pagar{onde}", parametros).iloc[0]
+        return {'total_pago': float(linha['total_pago']), 'total_juros': float(linha['total_juros'])}
+
+    def despesas_por(self, dimensao, filtros, data_inicio=None, data_fim=None):
+        """Total pago por valor de uma dimensão do contas a pagar."""
+        onde, parametros = self._onde(filtros, 'Data de vencimento', data_inicio, data_fim, nao_nulas=[dimensao])
+        return self._somar_por('contas_pagar', dimensao, COLUNA_VALOR_PAGO, onde, parametros, COLUNA_VALOR_PAGO)
+
+ARQUIVOS_DUCKDB = {
+    'vendas': ('data/vendas.csv', _parse_vendas),
+    'inativos': ('data/corretores_inativos.csv', _parse_inativos),
+    'contas_pagar': ('data/contas_a_pagar_set24_set25.csv', _parse_contas_pagar),
+}
+
+@cache_contado(st.cache_resource, show_spinner=False, max_entries=VERSOES_EM_CACHE)
+def motor_duckdb(versao):
+    """Motor DuckDB com uma view por conjunto de dados, criado uma única vez por versão dos dados."""
+    arquivos = {}
+    for tabela, (caminho, parser) in ARQUIVOS_DUCKDB.items():
+        try:
+            arquivos[tabela] = _garantir_parquet(caminho, parser)
+        except FileNotFoundError:
+            if tabela != 'inativos':
+                raise
+            arquivos[tabela] = None
+    return MotorDuckDB(arquivos)
+
+def motor_consultas(dados):
+    """Motor de agregação escolhido em DASHBOARD_MOTOR; sem o DuckDB disponível, volta para o pandas."""
+    if MOTOR_CONSULTAS == 'duckdb':
+        try:
+            if FONTE_DADOS != 'csv' or MODO_INCREMENTAL or PASTA_INSTANTANEOS:
+                raise ValueError("o motor DuckDB só lê os arquivos CSV, sem DASHBOARD_INCREMENTAL nem DASHBOARD_INSTANTANEOS")
+            return motor_duckdb(versao_dados())
+        except Exception as e:
+            st.warning(f"Não foi possível usar o motor DuckDB ({e}). Usando o pandas.")
+    return MotorPandas(dados)
+
+# --- Livro de caixa ---
+# O valor original das parcelas é lançado por dia de vencimento e por par
+# categoria x centro de custo, separando as parcelas do arquivo das projetadas.
+# As somas acumuladas por dia permitem responder o total de qualquer janela com
+# duas buscas binárias, sem varrer as contas a cada rerun. Contas recorrentes
+# ("7/12") têm as parcelas restantes projetadas mês a mês a partir da última
+# exportada, com o mesmo valor e dia de vencimento. Só entram as projeções
+# posteriores ao último vencimento do arquivo: parcelas que faltam dentro do
+# período exportado foram canceladas ou renegociadas.
+COLUNA_VALOR_ORIGINAL = 'Valor original da parcela (R$)'
+DIMENSOES_LIVRO_CAIXA = ['Categoria 1', 'Centro de Custo 1']
+
+def _somar_meses(datas, meses):
+    """Soma `meses` a cada data, mantendo o dia (limitado ao último dia do mês), como o DateOffset(months=n)."""
+    mes = datas.dt.year.to_numpy() * 12 + datas.dt.month.to_numpy() - 1 + meses
+    inicio_mes = pd.to_datetime(pd.DataFrame({'year': mes // 12, 'month': mes % 12 + 1, 'day': 1}))
+    dia = np.minimum(datas.dt.day.to_numpy(), inicio_mes.dt.days_in_month.to_numpy())
+    return inicio_mes + pd.to_timedelta(dia - 1, unit='D')
+
+def projetar_recorrencias(df_contas):
+    """Parcelas futuras das contas recorrentes que ainda não estão no arquivo."""
+    parcela = df_contas['Recorrência'].astype(str).str.extract(r'^\s*(\d+)\s*/\s*(\d+)\s*$').astype(float)
+    series = df_contas.assign(_atual=parcela[0], _total=parcela[1]).dropna(subset=['_atual', '_total', 'Data de vencimento'])
+    # Uma série é o mesmo fornecedor, descrição e número de parcelas; vale a parcela mais recente
+    ultimas = series.loc[series.groupby(['Nome do fornecedor', 'Descrição', '_total'], observed=True, dropna=False)['Data de vencimento'].idxmax()]
+    ultimas = ultimas[ultimas['_atual'] < ultimas['_total']]
+    repetidas = ultimas.loc[ultimas.index.repeat((ultimas['_total'] - ultimas['_atual']).astype(int))]
+    passo = repetidas.groupby(level=0).cumcount().to_numpy() + 1
+    projetadas = pd.DataFrame({
+        'Data de vencimento': _somar_meses(repetidas['Data de vencimento'], passo).to_numpy(),
+        **{col: repetidas[col].astype(object).to_numpy() for col in ['Nome do fornecedor', 'Descrição'] + DIMENSOES_LIVRO_CAIXA},
+        'Recorrência': [f"{int(a + p)}/{int(t)}" for a, p, t in zip(repetidas['_atual'], passo, repetidas['_total'])],
+        COLUNA_VALOR_ORIGINAL: repetidas[COLUNA_VALOR_ORIGINAL].to_numpy(),
+    })
+    return projetadas[projetadas['Data de vencimento'] > df_contas['Data de vencimento'].max()].reset_index(drop=True)
+
+class LivroCaixa:
+    """Valor original a vencer por dia e por categoria x centro de custo, com somas acumuladas."""
+
+    def __init__(self, df_contas, projetadas=None):
+        self.projetadas = projetar_recorrencias(df_contas) if projetadas is None else projetadas
+        lancamentos = pd.concat([
+            df_contas[['Data de vencimento'] + DIMENSOES_LIVRO_CAIXA + [COLUNA_VALOR_ORIGINAL]].astype({col: object for col in DIMENSOES_LIVRO_CAIXA}).assign(projetada=False),
+            self.projetadas[['Data de vencimento'] + DIMENSOES_LIVRO_CAIXA + [COLUNA_VALOR_ORIGINAL]].assign(projetada=True),
+        ], ignore_index=True).dropna(subset=['Data de vencimento'])
+        dias = lancamentos['Data de vencimento'].dt.normalize()
+        self.dias = pd.date_range(dias.min(), dias.max(), freq='D') if not dias.empty else pd.DatetimeIndex([])
+        grupos = lancamentos.groupby(DIMENSOES_LIVRO_CAIXA + ['projetada'], dropna=False, sort=True)
+        self.chaves = grupos.size().index.to_frame(index=False)
+        diario = np.zeros((len(self.dias), len(self.chaves)))
+        np.add.at(diario, (self.dias.get_indexer(dias), grupos.ngroup().to_numpy()), lancamentos[COLUNA_VALOR_ORIGINAL].fillna(0).to_numpy())
+        # Linha i = total dos dias anteriores a self.dias[i]
+        self._acumulado = np.vstack([np.zeros((1, len(self.chaves))), np.cumsum(diario, axis=0)])
+
+    def _colunas(self, filtros, projetadas):
+        colunas = np.ones(len(self.chaves), dtype=bool)
+        for col, valor in (filtros or {}).items():
+            if valor is not None:
+                colunas &= (self.chaves[col] == valor).to_numpy()
+        if projetadas is not None:
+            colunas &= (self.chaves['projetada'] == projetadas).to_numpy()
+        return colunas
+
+    def total(self, inicio, fim, filtros=None, projetadas=None):
+        """Valor original com vencimento entre `inicio` e `fim` (inclusive); projetadas=False/True restringe a origem."""
+        i0 = self.dias.searchsorted(pd.Timestamp(inicio), side='left')
+        i1 = self.dias.searchsorted(pd.Timestamp(fim), side='right')
+        if i1 <= i0:
+            return 0.0
+        colunas = self._colunas(filtros, projetadas)
+        return float((self._acumulado[i1, colunas] - self._acumulado[i0, colunas]).sum())
+
+    def mensal(self, desde, filtros=None):
+        """Valor original a vencer por mês a partir de `desde`, em colunas 'Lançadas' e 'Projetadas'."""
+        i0 = self.dias.searchsorted(pd.Timestamp(desde), side='left')
+        if i0 >= len(self.dias):
+            return pd.DataFrame(columns=['Lançadas', 'Projetadas'], dtype=float, index=pd.DatetimeIndex([], name='mes'))
+        inicios = pd.date_range(self.dias[i0].to_period('M').to_timestamp(), self.dias[-1], freq='MS')
+        limites = np.r_[i0, self.dias.searchsorted(inicios[1:], side='left'), len(self.dias)]
+        mensal = pd.DataFrame({
+            rotulo: np.diff(self._acumulado[limites][:, self._colunas(filtros, projetadas)].sum(axis=1))
+            for rotulo, projetadas in (('Lançadas', False), ('Projetadas', True))
+        }, index=(inicios + pd.offsets.MonthEnd(0)).rename('mes'))
+        # Como o resample: do primeiro ao último mês com vencimentos
+        com_valor = np.flatnonzero(mensal.to_numpy().any(axis=1))
+        if len(com_valor) == 0:
+            return mensal.iloc[0:0]
+        return mensal.iloc[com_valor[0]:com_valor[-1] + 1]
+
+@cache_contado(st.cache_resource, show_spinner=False, max_entries=VERSOES_EM_CACHE)
+def livro_caixa(_df_contas, versao):
+    """Livro de caixa da versão atual dos dados."""
+    return LivroCaixa(_df_contas, artefato_instantaneo('parcelas_projetadas', versao))
+
+# --- Redução de pontos dos gráficos ---
+# Séries diárias de vários anos teriam milhares de pontos por traço. Antes de ir
+# para o Plotly, cada traço é reduzido no servidor a no máximo
+# LIMITE_PONTOS_SERIE pontos pelo Largest-Triangle-Three-Buckets: a série é
+# dividida em faixas, e de cada faixa fica o ponto que forma o maior triângulo
+# com o ponto escolhido na faixa anterior e a média da seguinte, o que preserva
+# picos e vales. O resultado vai para o cache de figuras junto com o gráfico.
+LIMITE_PONTOS_SERIE = int(os.environ.get('DASHBOARD_PONTOS_SERIE', '800'))
+
+def lttb(x, y, limite):
+    """Posições dos pontos escolhidos pelo LTTB (sempre o primeiro e o último); todas se já couberem no limite."""
+    n = len(y)
+    if n <= limite or limite < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    # limite - 2 faixas entre o primeiro e o último ponto
+    bordas = np.linspace(1, n - 1, limite - 1).astype(np.intp)
+    escolhidos = np.empty(limite, dtype=np.intp)
+    escolhidos[0], escolhidos[-1] = 0, n - 1
+    anterior = 0
+    for i in range(limite - 2):
+        inicio, fim = bordas[i], bordas[i + 1]
+        if i + 2 < len(bordas):
+            x_seguinte, y_seguinte = x[fim:bordas[i + 2]].mean(), y[fim:bordas[i + 2]].mean()
+        else:
+            x_seguinte, y_seguinte = x[n - 1], y[n - 1]
+        areas = np.abs((x[anterior] - x_seguinte) * (y[inicio:fim] - y[anterior])
+                       - (x[anterior] - x[inicio:fim]) * (y_seguinte - y[anterior]))
+        anterior = inicio + int(np.argmax(areas))
+        escolhidos[i + 1] = anterior
+    return escolhidos
+
+def reduzir_serie(serie, limite=None):
+    """Série temporal com no máximo `limite` pontos (padrão LIMITE_PONTOS_SERIE), escolhidos pelo LTTB."""
+    limite = LIMITE_PONTOS_SERIE if limite is None else limite
+    if len(serie) <= limite:
+        return serie
+    x = serie.index.to_numpy().astype('datetime64[ns]').astype(np.int64)
+    with medir('reducao_pontos'):
+        return serie.iloc[lttb(x, serie.to_numpy(), limite)]
+
+GRANULARIDADES = {'Dia': 'dia', 'Semana': 'semana', 'Mês': 'mes'}
+# Formato das datas no hover de cada granularidade
+FORMATOS_PERIODO = {'dia': '%d/%m/%Y', 'semana': 'semana de %d/%m/%Y', 'mes': '%B de %Y'}
+
+def seletor_granularidade(chave):
+    """Seletor Dia/Semana/Mês dos gráficos de evolução (padrão: Mês); devolve 'dia', 'semana' ou 'mes'."""
+    rotulo = st.radio("Granularidade", list(GRANULARIDADES), index=2, horizontal=True, key=chave)
+    return GRANULARIDADES[rotulo]
+
+# --- Cache de figuras ---
+# As figuras ficam num LRU do servidor, com chave (versão dos dados, página,
+# gráfico, filtros). Num rerun causado por outro widget, a figura é reaproveitada
+# sem refazer agregação nem montagem. Figuras matplotlib são guardadas como PNG e
+# fechadas logo após a renderização, para não acumular memória no servidor.
+LIMITE_CACHE_FIGURAS = 256
+
+class CacheFiguras:
+    """LRU limitado e thread-safe de figuras prontas (ou outros itens caros de construir)."""
+
+    def __init__(self, limite, nome='figuras', ao_descartar=None):
+        self.limite = limite
+        self.nome = nome
+        self.ao_descartar = ao_descartar
+        self._itens = OrderedDict()
+        self._trava = threading.Lock()
+
+    def obter(self, chave, construir):
+        """Devolve o item da chave, construindo-o (fora da trava) se ainda não existir."""
+        with self._trava:
+            if chave in self._itens:
+                self._itens.move_to_end(chave)
+                registrar_cache(self.nome, acerto=True)
+                return self._itens[chave]
+        registrar_cache(self.nome, acerto=False)
+        item = construir()
+        with self._trava:
+            self._itens[chave] = item
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.limite:
+                _, descartado = self._itens.popitem(last=False)
+                if self.ao_descartar is not None:
+                    self.ao_descartar(descartado)
+        return item
+
+@st.cache_resource(show_spinner=False)
+def cache_figuras():
+    """Cache de figuras único por processo do servidor."""
+    return CacheFiguras(LIMITE_CACHE_FIGURAS)
+
+def _normalizar_filtros(filtros):
+    """Transforma o estado dos filtros numa tupla ordenada e hashable."""
+    return tuple(sorted((nome, str(valor)) for nome, valor in filtros.items()))
+
+def figura_em_cache(pagina, grafico, filtros, construir):
+    """Figura Plotly (ou None) do cache; `construir` só roda quando a chave muda."""
+    chave = (versao_dados(), pagina, grafico, _normalizar_filtros(filtros))
+
+    def construir_medindo():
+        with medir(f"grafico:{grafico}"):
+            return construir()
+    return cache_figuras().obter(chave, construir_medindo)
+
+def exibir_grafico(fig):
+    """st.plotly_chart com a largura do container, medindo o envio da figura ao navegador."""
+    with medir('envio_graficos'):
+        st.plotly_chart(fig, width='stretch')
+
+def png_em_cache(pagina, grafico, filtros, construir):
+    """PNG de uma figura matplotlib (ou None) do cache; a figura é fechada logo após ser renderizada."""
+    def renderizar():
+        fig = construir()
+        if fig is None:
+            return None
+        import matplotlib.pyplot as plt
+        try:
+            buffer = io.BytesIO()
+            fig.savefig(buffer, format='png', dpi=200, bbox_inches='tight')
+            return buffer.getvalue()
+        finally:
+            plt.close(fig)
+    return figura_em_cache(pagina, grafico, filtros, renderizar)
+
+# --- Exportações ---
+# Os downloads são gerados só quando o botão é clicado, escrevendo o DataFrame
+# em blocos num arquivo temporário que fica em memória até LIMITE_MEMORIA_EXPORTACAO
+# e depois passa para o disco. O arquivo pronto fica num LRU com chave (versão dos
+# dados, exportação, filtros, formato), então baixar de novo não refaz nada.
+# O Parquet só é oferecido com o pyarrow instalado.
+TAMANHO_BLOCO_EXPORTACAO = 50_000
+LIMITE_MEMORIA_EXPORTACAO = 16 * 1024 * 1024
+LIMITE_CACHE_EXPORTACOES = 16
+FORMATOS_EXPORTACAO = {'csv.gz': ('CSV compactado', 'application/gzip')}
+if importlib.util.find_spec('pyarrow') is not None:
+    FORMATOS_EXPORTACAO['parquet'] = ('Parquet', 'application/vnd.apache.parquet')
+
+def _escrever_csv_gzip(df, destino):
+    """Escreve o DataFrame como CSV (UTF-8) compactado com gzip, um bloco de linhas por vez."""
+    with gzip.GzipFile(fileobj=destino, mode='wb', compresslevel=6) as compactado:
+        with io.TextIOWrapper(compactado, encoding='utf-8', newline='') as texto:
+            for inicio in range(0, max(len(df), 1), TAMANHO_BLOCO_EXPORTACAO):
+                df.iloc[inicio:inicio + TAMANHO_BLOCO_EXPORTACAO].to_csv(texto, index=False, header=inicio == 0)
+
+def _escrever_parquet(df, destino):
+    """Escreve o DataFrame como Parquet, um row group por bloco de linhas."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    # Esquema inferido sem converter os dados; colunas de texto (object) viram string
+    esquema = pa.Schema.from_pandas(df.iloc[:0], preserve_index=False)
+    for i, campo in enumerate(esquema):
+        if df[campo.name].dtype == object:
+            esquema = esquema.set(i, pa.field(campo.name, pa.string()))
+    with pq.ParquetWriter(destino, esquema) as escritor:
+        for inicio in range(0, len(df), TAMANHO_BLOCO_EXPORTACAO):
+            bloco = df.iloc[inicio:inicio + TAMANHO_BLOCO_EXPORTACAO]
+            escritor.write_table(pa.Table.from_pandas(bloco, schema=esquema, preserve_index=False))
+
+ESCRITORES_EXPORTACAO = {'csv.gz': _escrever_csv_gzip, 'parquet': _escrever_parquet}
+
+class ArquivoExportado:
+    """Arquivo temporário de uma exportação pronta, lido por várias sessões."""
+
+    def __init__(self, df, formato):
+        self.arquivo = tempfile.SpooledTemporaryFile(max_size=LIMITE_MEMORIA_EXPORTACAO)
+        self._trava = threading.Lock()
+        ESCRITORES_EXPORTACAO[formato](df, self.arquivo)
+
+    def conteudo(self):
+        with self._trava:
+            self.arquivo.seek(0)
+            return self.arquivo.read()
+
+    def fechar(self):
+        with self._trava:
+            self.arquivo.close()
+
+@st.cache_resource(show_spinner=False)
+def cache_exportacoes():
+    """Cache de exportações único por processo do servidor."""
+    return CacheFiguras(LIMITE_CACHE_EXPORTACOES, nome='exportacoes', ao_descartar=ArquivoExportado.fechar)
+
+@medir('exportacao')
+def exportar(df, nome, filtros, formato):
+    """Conteúdo do arquivo exportado (do cache, ou gerado agora em blocos)."""
+    chave = (versao_dados(), nome, _normalizar_filtros(filtros), formato)
+    return cache_exportacoes().obter(chave, lambda: ArquivoExportado(df, formato)).conteudo()
+
+def botoes_exportacao(df, nome, filtros, rotulo):
+    """Botões de download (CSV compactado e, com o pyarrow, Parquet) gerados sob demanda."""
+    colunas = st.columns(len(FORMATOS_EXPORTACAO))
+    for coluna, (formato, (descricao, mime)) in zip(colunas, FORMATOS_EXPORTACAO.items()):
+        coluna.download_button(label=f"📥 {rotulo} ({descricao})",
+                               data=lambda formato=formato: exportar(df, nome, filtros, formato),
+                               file_name=f"{nome}.{formato}", mime=mime, key=f"exportar_{nome}_{formato}")
+
+# --- Tabelas paginadas ---
+# Em vez de formatar e enviar a tabela inteira ao navegador, a busca e a
+# ordenação são feitas no servidor sobre as colunas tipadas e só a página
+# visível é formatada (de forma vetorizada) e exibida.
+TAMANHOS_PAGINA = [25, 50, 100, 250]
+TAMANHO_PAGINA_PADRAO = int(os.environ.get('DASHBOARD_TAMANHO_PAGINA', '50'))
+_TROCA_SEPARADORES = str.maketrans(',.', '.,')
+
+def formatar_moeda(serie):
+    """Versão vetorizada de format_currency para uma coluna inteira."""
+    texto = pd.to_numeric(serie, errors='coerce').fillna(0).map('{:,.2f}'.format).astype(object)
+    return 'R$ ' + texto.str.translate(_TROCA_SEPARADORES)
+
+def formatar_inteiro(serie):
+    """Versão vetorizada de format_integer para uma coluna inteira."""
+    texto = pd.to_numeric(serie, errors='coerce').fillna(0).astype('int64').map('{:,}'.format).astype(object)
+    return texto.str.translate(_TROCA_SEPARADORES)
+
+FORMATADORES = {'moeda': formatar_moeda, 'inteiro': formatar_inteiro}
+
+def _buscar_texto(df, termo):
+    """Posições das linhas em que alguma coluna de texto contém o termo (sem diferenciar maiúsculas)."""
+    mascara = np.zeros(len(df), dtype=bool)
+    for col in df.columns:
+        serie = df[col]
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            # Busca no dicionário da coluna e depois compara só os códigos
+            categorias = serie.cat.categories.astype(str).str.contains(termo, case=False, regex=False)
+            mascara |= np.isin(serie.cat.codes.to_numpy(), np.flatnonzero(categorias))
+        elif serie.dtype == object:
+            mascara |= serie.str.contains(termo, case=False, regex=False, na=False).to_numpy(dtype=bool)
+    return np.flatnonzero(mascara)
+
+@medir('tabela')
+def tabela_paginada(df, chave, formatos=None):
+    """Exibe `df` paginado, com busca e ordenação no servidor; `formatos` mapeia coluna -> 'moeda' ou 'inteiro'."""
+    formatos = formatos or {}
+    col_busca, col_ordem, col_sentido, col_tamanho = st.columns([3, 2, 1, 1])
+    termo = col_busca.text_input("Buscar", key=f"{chave}_busca", placeholder="Texto em qualquer coluna")
+    coluna_ordem = col_ordem.selectbox("Ordenar por", ["(ordem original)"] + list(df.columns), key=f"{chave}_ordem")
+    sentido = col_sentido.selectbox("Sentido", ["Crescente", "Decrescente"], key=f"{chave}_sentido")
+    tamanho = col_tamanho.selectbox("Linhas por página", TAMANHOS_PAGINA, key=f"{chave}_tamanho",
+                                    index=TAMANHOS_PAGINA.index(TAMANHO_PAGINA_PADRAO) if TAMANHO_PAGINA_PADRAO in TAMANHOS_PAGINA else 1)
+
+    posicoes = _buscar_texto(df, termo) if termo else np.arange(len(df))
+    if coluna_ordem in df.columns:
+        # Ordena só a coluna escolhida (tipada), e não o DataFrame inteiro
+        ordem = (df[coluna_ordem].iloc[posicoes].reset_index(drop=True)
+                 .sort_values(ascending=sentido == "Crescente", kind='stable', na_position='last').index.to_numpy())
+        posicoes = posicoes[ordem]
+
+    total = len(posicoes)
+    num_paginas = max(1, -(-total // tamanho))
+    chave_pagina = f"{chave}_pagina"
+    if st.session_state.get(chave_pagina, 1) > num_paginas:
+        st.session_state[chave_pagina] = num_paginas
+    pagina = st.number_input(f"Página (de {num_paginas})", min_value=1, max_value=num_paginas, step=1, key=chave_pagina)
+
+    inicio = (pagina - 1) * tamanho
+    df_pagina = df.iloc[posicoes[inicio:inicio + tamanho]].copy()
+    for col, formato in formatos.items():
+        if col in df_pagina.columns:
+            df_pagina[col] = FORMATADORES[formato](df_pagina[col])
+    st.dataframe(df_pagina, width='stretch')
+    st.caption(f"Linhas {min(inicio + 1, total)}–{min(inicio + tamanho, total)} de {format_integer(total)}")
 
 def format_currency(value):
     """Formata um número para o padrão de moeda brasileiro (R$ 1.234,56)."""
@@ -86,6 +2887,18 @@ def format_integer(value):
         return "0"
     return f"{int(value):,}".replace(",", ".")
 
-def render_sidebar():
-    """Renderiza os elementos fixos da barra lateral, como o logo."""
-    st.sidebar.image("imagens/logo_usina_white.png", width=250)
\ No newline at end of file
+def render_sidebar(pagina=None):
+    """Renderiza os elementos fixos da barra lateral, como o logo, e abre a medição de desempenho da página."""
+    st.sidebar.image("imagens/logo_usina_white.png", width=250)
+    if pagina is None:
+        return
+    anterior = iniciar_medicao(pagina)
+    fixar_instantaneo()
+    status = status_dados()
+    if status:
+        st.sidebar.caption(status)
+    mostrar_avisos_atualizacao()
+    # Reatribuir mantém a escolha ao trocar de página (o Streamlit descarta estado de widgets entre páginas)
+    st.session_state['painel_desempenho'] = st.session_state.get('painel_desempenho', False)
+    if st.sidebar.toggle("Mostrar painel de desempenho", key='painel_desempenho'):
+        painel_desempenho(anterior)
\ No newline at end of file